@@ -1,14 +1,24 @@
 # ################### Imports ###################
 import urllib
 import re
-import urlparse
 import os
 
 from urllib import url2pathname 
-from fuzzywuzzy import fuzz, process
-from bs4 import BeautifulSoup, Tag
-from url_loading import simple_get
-from utils import get_date
+from event_context import event_contexts
+from event_index import event_index
+from instrumentation import metrics
+from extraction import DivCounter, parse_reviews_page, parse_matchguide_page, parse_search_page, COMMENT_CLASS, INFORMATION_BOX_CLASS
+from fingerprints import Fingerprint
+from promotion_cache import promotion_cache
+from record_cache import record_cache, get_event_key, get_match_key
+from records import Matchguide, Review
+from refresh_scheduler import refresh_scheduler
+from http_cache import MATCHGUIDE_TTL, REVIEWS_TTL
+from scoring import extract_events, extract_matches
+from search_planning import negative_searches, plan_event_search, plan_match_search
+from url_loading import refresh_page, simple_get, stream_get
+from workers import BackgroundJob, parallel_map, run_concurrently
+from utils import get_date, get_int_pref
 from datetime import datetime
 
 # ################### Agent Constants ###################
@@ -23,167 +33,51 @@ CM_FROM_YEAR = "1887"
 CM_SEARCH_URL = "?id=1&view=search&sEventName={eventname}"
 CM_DEFAULT_DATE_PARAMS = "&sDateFromDay=01&sDateFromMonth=01&sDateFromYear=" + CM_FROM_YEAR
 CM_SPECIFIC_DATE_PARAMS = "&sDateFromDay={day}&sDateFromMonth={month}&sDateFromYear={year}&sDateTillDay={day}&sDateTillMonth={month}&sDateTillYear={year}"
+CM_SEARCH_OFFSET_PARAM = "&s={offset}"
 CM_EVENT_URL = "?id=1&nr={eventid}"
 CM_EVENT_CARD_PARAM = "&page=2"
 CM_REVIEWS_PARAM = "&page=99"
 
-# ################### Cagematch event info keys ###################
-DATE_KEY = "Date"
-NAME_KEY = "Name of the event"
-PROMOTION_KEY = "Promotion"
-TYPE_KEY = "Type"
-LOCATION_KEY = "Location"
-ARENA_KEY = "Arena"
-BROADCAST_TYPE_KEY = "Broadcast type" # Not always present
-BROADCAST_DATE_KEY = "Broadcast date" # Not always present
-NETWORK_KEY = "TV station/network" # Not always present
-COMMENTARY_KEY = "Commentary by" # Not always present
-CARD_KEY = "Card"
-RESULTS_KEY = "Results"
-MATCH_KEY = "Match"
-
 # ################### Cagematch matchguide keys ###################
 WON_KEY = "WON rating" # Not always present
 
-# ################### Cagematch promotion keys ###################
-ABBREVIATIONS_KEY = "Abbreviations"
-CURR_ABBREVIATION_KEY = "Current abbreviation"
-
 # ################### the scary regex ###################
 # https://regex101.com/r/YgefKe/1
 FILENAME_REGEX = "(?:(?=^\d{4})|(?P<prom>.+?)(?:(?= [^-]) |(?= - ) - ))(?P<date>(?:\d{4})(?: |-|.)(?:(?:0[1-9])|(?:1[0-2]))(?: |-|.)(?:(?:0[1-9])|(?:1[0-9])|(?:2[0-9])|(?:3[0-1])))(?:(?= M | - M - )(?P<match> M | - M - )|(?! M | - M - )(?:(?= [^-]) |(?= - ) - ))(?P<name>.+)"
-reg = re.compile(FILENAME_REGEX)
-
-
-# ################### Other Cagematch constants ###################
-FREELANCE_STRINGS = ['Wrestling In Mexiko - Freelance Shows', 'Wrestling In Europa - Freelance Shows', 'Wrestling In Japan - Freelance Shows', 'Wrestling In Canada - Freelance Shows', 'Wrestling In Australia - Freelance Shows', 'Wrestling In The USA - Freelance Shows', 'Wrestling Im Rest der Welt - Freelance Shows']
-
+_filename_regex = None
 
-def get_event_information_dictionary(html):
-    """
-    Find the information box from the event page. 
-
-    :param html: the event page html, as parsed through Beautiful Soup
-    :return: dictionary of the event information box
-    """
-    event_table = html.find("div", {"class": "InformationBoxTable"})
-    dictionary = get_dict_from_table(event_table)
-    Log.Debug("[" + AGENT_NAME + "] [get_event_information_dictionary] Parsed event dictionary: " + str(dictionary))
-    return dictionary
 
+# ################### Search result pages ###################
+SEARCH_MODE_FIRST_PAGE = "First page only"
+SEARCH_MODE_UNTIL_CONFIDENT = "Until a confident match is found"
+SEARCH_MODE_EVERY_PAGE = "Every page"
+DEFAULT_SEARCH_CONFIDENCE = 90
+# How many pages ahead of the one being read are fetched in the background
+SEARCH_PREFETCH_PAGES = 2
+# Even every page stops somewhere, at 100 results per page
+MAX_SEARCH_PAGES = 20
+# Searches whose results aren't scored as they are read, such as for the events a match could be on, can't tell when
+# they have found a confident match, so until then they only read this many pages
+UNSCORED_SEARCH_PAGES = 2
 
-def get_promotion_information_dictionary(html):
-    """
-    Find the information boxes from the promotion page. 
-
-    :param html: the promotion page html, as parsed through Beautiful Soup
-    :return: dictionary of the promotion information boxes
-    """
-    tables = html.find_all("div", {"class": "InformationBoxTable"})
-    general_dictionary = get_dict_from_table(tables[0])
-    details_dictionary = get_dict_from_table(tables[1])
-    dictionary = general_dictionary.copy()
-    dictionary.update(details_dictionary)
-    Log.Debug("[" + AGENT_NAME + "] [get_promotion_information_dictionary] Parsed promotion dictionary: " + str(dictionary))
-    return dictionary
-
-
-def get_dict_from_table(information_box_table):
-    """
-    From an individual InformationBoxTable div, essentially treat it as a table:
-        - find every InformationBoxTitle div, and use the text as a key.
-        - find every InformationBoxContents div, and use the content as a value.
-
-    :return: dictionary of the event information box
-    """
-    keys = [str(span.get_text().rstrip(':').strip()) for span in information_box_table.find_all(
-        "div", {"class": "InformationBoxTitle"})]
-    values = [get_link_dict(span.contents[0]) for span in information_box_table.find_all(
-        "div", {"class": "InformationBoxContents"})]
-    dictionary = dict(zip(keys, values))
-    return dictionary
-
+# Automatic matches only need the best few candidates, manual searches list them all
+AUTOMATIC_RESULT_LIMIT = 10
 
-def get_link_dict(box_content):
-    """
-    If the provided element is a link, return a dictionary containing the link's display 'text' and the 'link' itself.
-    Otherwise return a dictionary with 'text' being the string of the element
-    """
-    if box_content.name == 'a':
-        return {'text': str(box_content.string), 'link': str(box_content.attrs['href'])}
-    elif isinstance(box_content, Tag):
-        return {'text': box_content.text}
-    else:
-        return {'text': str(box_content)}
+# ################### Other Cagematch constants ###################
+FREELANCE_STRINGS = ['Wrestling In Mexiko - Freelance Shows', 'Wrestling In Europa - Freelance Shows', 'Wrestling In Japan - Freelance Shows', 'Wrestling In Canada - Freelance Shows', 'Wrestling In Australia - Freelance Shows', 'Wrestling In The USA - Freelance Shows', 'Wrestling Im Rest der Welt - Freelance Shows']
 
 
-def parse_search_result_row(table_row):
-    """
-    Parse a table row from a search page and extract the relevant parts to a dict
-
-    :param table_row: a "tr" element extracted from a table
-    :return: dictionary containing event id "id", event name "name", and year of event "year"
-    """
-    table_cells = table_row.find_all('td')
-    dd, mm, yyyy = table_cells[1].text.split(".")
-    # The event column can have an event link and a promotion image link, so we need to find the right one.
-    # As the image links contain no text, we can do this by checking that link.string isn't None
-    links = table_cells[2].find_all('a', href=True)
-    for link in links:
-        if link.string is not None:
-            event_link = link
-    
-    if event_link is not None:
-        event_id = dict(urlparse.parse_qsl(urlparse.urlparse(event_link.attrs['href']).query))['nr']
-        return {
-            'id': str(event_id),
-            'name': str(event_link.string),
-            'year': str(yyyy),
-            'month': str(mm),
-            'day': str(dd)
-        }
-    return None
+def Start():
+    # Keep cached pages fresh in the background while Plex isn't asking for anything
+    refresh_scheduler.start(refresh_page)
 
 
-def parse_search_result_counts(html):
-    """
-    Figure out how many results our search got by parsing the text above the results table.
-        - find the div containing this string, class TableHeaderOff id TableHeader
-        - check if this matches the string saying no items were found, if so return 0 results
-        - otherwise chunk up the string and return how many results were found, and which are
-          being displayed
-
-    :param html: the event page html, as parsed through Beautiful Soup
-    :return: dictionary containing:
-                 - start: the start position of the results returned
-                 - end: the end position of the results returned
-                 - total: the total number of results the search found
-    """
-    # Constants
-    NO_RESULTS_STRING = "No items were found that match the search parameters."
-    RESULTS_STRING_1 = "Displaying items "
-    RESULTS_STRING_2 = " to "
-    RESULTS_STRING_3 = " of total "
-    RESULTS_STRING_4 = " items that match the search parameters."
-
-    search_results_div = html.find('div', {"class": "TableHeaderOff", "id": "TableHeader"})
-    if search_results_div.string == NO_RESULTS_STRING:
-        search_results = {
-            'start': 0,
-            'end': 0,
-            'total': 0
-        }
-    elif search_results_div.string.startswith(RESULTS_STRING_1):
-        start, split_1 = search_results_div.string.split(RESULTS_STRING_1,1)[1].split(RESULTS_STRING_2, 1)
-        end, split_2 = split_1.split(RESULTS_STRING_3,1)
-        total = split_2.split(RESULTS_STRING_4)[0]
-        search_results = {
-            'start': int(start),
-            'end': int(end),
-            'total': int(total)
-        }
-    Log.Debug("[" + AGENT_NAME + "] [parse_search_result_counts] Search returned: " + str(search_results))
-    return search_results
+# The scary regex is compiled the first time a file name is read rather than when the plugin loads
+def get_filename_regex():
+    global _filename_regex
+    if _filename_regex is None:
+        _filename_regex = re.compile(FILENAME_REGEX)
+    return _filename_regex
 
 
 def format_match_name_for_candidate(match, event, year, month, day):
@@ -212,6 +106,11 @@ class Cagent_Movie(Agent.Movies):
         'id': some id}
     """
     def search(self, results, media, lang, manual):
+        with metrics.timer('search_ms'):
+            self.search_media(results, media, lang, manual)
+
+
+    def search_media(self, results, media, lang, manual):
         search_str = media.name
         if media.filename:
             pathname = url2pathname(media.filename)
@@ -223,7 +122,7 @@ class Cagent_Movie(Agent.Movies):
             self.search_by_cm_id(results, lang, manual_id_match.group(1))
             return
         else:
-            reg_match = reg.match(search_str)
+            reg_match = get_filename_regex().match(search_str)
             if reg_match is not None:
                 search_input = {k: v for k, v in reg_match.groupdict().items() if v is not None}
                 Log.Debug("[" + AGENT_NAME + "] [search] Regex found the following components: " + str(search_input))
@@ -231,15 +130,20 @@ class Cagent_Movie(Agent.Movies):
                 search_input = {'name': search_str}
             
             if 'match' in search_input:
-                self.search_for_matches(results, media, lang, search_input, search_str)
+                self.search_for_matches(results, media, lang, search_input, search_str, manual)
                 return
             else:
                 # Search for an event
-                self.search_for_events(results, media, lang, search_input, search_str)
+                self.search_for_events(results, media, lang, search_input, search_str, manual)
                 return
 
 
     def update(self, metadata, media, lang, force):
+        with metrics.timer('update_ms'):
+            self.update_metadata(metadata, media, lang, force)
+
+
+    def update_metadata(self, metadata, media, lang, force):
         Log.Info("[" + AGENT_NAME + "] [update] Updating item with ID: " + metadata.id)
         is_match = False
         if ":" in metadata.id:
@@ -250,24 +154,26 @@ class Cagent_Movie(Agent.Movies):
         Log.Info("[" + AGENT_NAME + "] [update] Using event ID " + event_id)
         target_url = CM_MAIN_URL + CM_EVENT_URL.format(eventid=event_id)
         Log.Debug("[" + AGENT_NAME + "] [update] Event URL: " + target_url)
-        raw_html = simple_get(target_url)
-        if raw_html is not None:
-            html = BeautifulSoup(raw_html, 'html.parser')
-            dictionary = get_event_information_dictionary(html)
+        card_url = target_url + CM_EVENT_CARD_PARAM
+        event = event_contexts.get_event(event_id, target_url)
+        if event is not None:
+            # Only the sections that are different to the last refresh are written
+            fingerprint = Fingerprint(metadata.id, metadata.title, force)
 
             # First do the things that are common between events and matches
             Log.Debug("[" + AGENT_NAME + "] [update] Setting common metadata")
             # Set the event date
-            date_str = dictionary.get(BROADCAST_DATE_KEY, dictionary[DATE_KEY])['text']
-            if date_str is not None:
+            date_str = event.broadcast_date if event.broadcast_date is not None else event.date
+            if date_str is not None and fingerprint.changed('date', date_str):
                 event_date = datetime.strptime(str(date_str), "%d.%m.%Y")
                 if event_date is not None:
                     metadata.originally_available_at = event_date
 
             # Set the "studio" (i.e. Promotion)
-            promotion = str(dictionary[PROMOTION_KEY]['text'])
+            promotion = str(event.promotion)
             if promotion is not None and promotion not in FREELANCE_STRINGS:
-                metadata.studio = promotion
+                if fingerprint.changed('studio', promotion):
+                    metadata.studio = promotion
 
             # Set up collections
             collections = []
@@ -281,175 +187,218 @@ class Cagent_Movie(Agent.Movies):
                 if "Matches" not in collections: 
                     collections.append("Matches")
 
-            metadata.collections.clear()
-            metadata.collections = collections
+            if fingerprint.changed('collections', collections):
+                metadata.collections.clear()
+                metadata.collections = collections
 
             if is_match:
                 Log.Debug("[" + AGENT_NAME + "] [update] Setting match specific metadata")
+                metrics.increment('update.matches')
                 match_idx = int(match_id) - 1
-                # For matches, use the match card to get the title and set it into the dictionary
-                raw_card_html = simple_get(target_url + CM_EVENT_CARD_PARAM)
-                if raw_card_html is not None:
-                    card_html = BeautifulSoup(raw_card_html, 'html.parser')
-                    card_divs = card_html.find("div", {"class": "Matches"})
-                    if match_idx < len(card_divs):
-                        match_name = str(card_divs.contents[match_idx].find("div", {"class": "MatchResults"}).text)
-                        metadata.title = match_name
-                        dictionary[MATCH_KEY] = {'text': match_name}
+                result_matches = event.matches
+                maxReviews = int(Prefs["reviewCount"])
+                matchguide_url = None
+                if maxReviews > 0 and match_idx < len(result_matches) and result_matches[match_idx].matchguide_link is not None:
+                    matchguide_url = CM_MAIN_URL + result_matches[match_idx].matchguide_link
+                    Log.Debug("[" + AGENT_NAME + "] [update] Matchguide entry: " + matchguide_url)
+
+                # The other pages we need only depend on the event page, so fetch any that aren't cached all at once
+                match_key = get_match_key(event_id, match_id)
+                new_match_parts = {}
+                matchguide = None
+                reviews = None
+                pages = {}
+                if event.card is None:
+                    pages['card'] = (event_contexts.get_event, (event_id, target_url, card_url))
+                if matchguide_url is not None:
+                    if Prefs["tokyoDome"]:
+                        matchguide = record_cache.get(match_key, 'matchguide', Matchguide)
+                        if matchguide is None:
+                            pages['matchguide'] = (self.read_matchguide, (matchguide_url,))
+                    # If only one review is wanted, the comments are only needed when there's no WON rating
+                    if not (Prefs["tokyoDome"] and maxReviews == 1):
+                        reviews = self.get_cached_reviews(match_key, maxReviews)
+                        if reviews is None:
+                            pages['comments'] = (self.read_reviews, (matchguide_url + CM_REVIEWS_PARAM, maxReviews))
+                fetched = run_concurrently(pages)
+                # The event loaded along with its card, or the one we had if the card couldn't be loaded
+                event = fetched.get('card') or event
+
+                # For matches, use the match card to get the title
+                match_name = ''
+                if event.card is not None:
+                    if match_idx < len(event.card):
+                        match_name = event.card[match_idx]
+                        fingerprint.title = match_name
+                        if fingerprint.changed('title', match_name):
+                            metadata.title = match_name
                 
                 # Set the Cagematch rating if available
-                result_divs = html.find("div", {"class": "Matches"})
-                if match_idx < len(result_divs):
-                    result_text = result_divs.contents[match_idx].find("div", {"class": "MatchRecommendedLine"}).text
-                    prefix = ':::: Matchguide Rating: '
-                    if result_text.startswith(prefix):
-                        event_rating = result_text[len(prefix):result_text.index(' based on')]
-                        metadata.rating = float(event_rating)
+                if match_idx < len(result_matches):
+                    if result_matches[match_idx].rating is not None:
+                        if fingerprint.changed('rating', result_matches[match_idx].rating):
+                            metadata.rating = float(result_matches[match_idx].rating)
                     else:
                         Log.Debug("[" + AGENT_NAME + "] [update] No rating for match")
 
                 # Add reviews if enabled
-                metadata.reviews.clear()
-                maxReviews = int(Prefs["reviewCount"])
+                review_entries = []
                 if maxReviews > 0:
-                    reviewsAdded = 0
-                    if match_idx < len(result_divs):
-                        matchguide_url = CM_MAIN_URL + result_divs.contents[match_idx].find("div", {"class": "MatchRecommendedLine"}).find('a', href=True).attrs['href']
-                        Log.Debug("[" + AGENT_NAME + "] [update] Matchguide entry: " + matchguide_url)
+                    if matchguide_url is not None:
                         if Prefs["tokyoDome"]:
-                            raw_matchguide_html = simple_get(matchguide_url)
-                            if raw_matchguide_html is not None:
-                                matchguide_html = BeautifulSoup(raw_matchguide_html, 'html.parser')
-                                matchguide_dictionary = get_event_information_dictionary(matchguide_html)
-                                if WON_KEY in matchguide_dictionary:
-                                    reviewsAdded += 1
-                                    r = metadata.reviews.new()
-                                    r.author = 'Dave Meltzer'
-                                    r.source = 'Wrestling Observer Newsletter'
-                                    r.link = 'https://www.f4wonline.com/'
-                                    r.text = matchguide_dictionary.get(WON_KEY, {}).get('text', '').replace("*", "★").replace("1/2", "⯪").replace("1/4", "¼").replace("3/4", "¾")
+                            if fetched.get('matchguide') is not None:
+                                matchguide = fetched['matchguide']
+                                new_match_parts['matchguide'] = (matchguide, MATCHGUIDE_TTL)
+                            if matchguide is not None and matchguide.won_rating is not None:
+                                review_entries.append((
+                                    'Dave Meltzer', 'Wrestling Observer Newsletter', 'https://www.f4wonline.com/',
+                                    matchguide.won_rating.replace("*", "★").replace("1/2", "⯪").replace("1/4", "¼").replace("3/4", "¾")))
                         
-                        if reviewsAdded < maxReviews:
-                            raw_match_comments_html = simple_get(matchguide_url + CM_REVIEWS_PARAM)
-                            if raw_match_comments_html is not None:
-                                match_comments_html = BeautifulSoup(raw_match_comments_html, 'html.parser')
-                                comment_divs = match_comments_html.find_all("div", {"class": "Comment"})
-                                i = 0
-                                while (reviewsAdded < maxReviews and i < len(comment_divs)):
-                                    comment = comment_divs[i]
-                                    r = metadata.reviews.new()
-                                    r.author = comment.find("div", {"class": "CommentHeader"}).text.split(" wrote on ")[0]
-                                    r.source = 'CAGEMATCH user'
-                                    r.link = matchguide_url + CM_REVIEWS_PARAM
-                                    r.text = comment.find("div", {"class": "CommentContents"}).text
-                                    i += 1
-                                    reviewsAdded += 1
+                        if len(review_entries) < maxReviews:
+                            if reviews is None and 'comments' not in pages:
+                                reviews = self.get_cached_reviews(match_key, maxReviews)
+                            if reviews is None:
+                                if 'comments' in pages:
+                                    reviews, complete = fetched['comments'] or (None, False)
+                                else:
+                                    reviews, complete = self.read_reviews(matchguide_url + CM_REVIEWS_PARAM, maxReviews)
+                                if reviews is not None:
+                                    new_match_parts['reviews'] = (reviews, REVIEWS_TTL)
+                                    new_match_parts['reviews_partial'] = (not complete, REVIEWS_TTL)
+                            if reviews is not None:
+                                for review in reviews[:maxReviews - len(review_entries)]:
+                                    review_entries.append((review.author, 'CAGEMATCH user', matchguide_url + CM_REVIEWS_PARAM, review.text))
+                if fingerprint.changed('reviews', review_entries):
+                    self.set_reviews(metadata, review_entries)
+
+                if len(new_match_parts) > 0:
+                    record_cache.put(match_key, new_match_parts)
 
                 # Set workers as roles, in future some way to link roles that are same e.g. Dean Ambrose/Jon Moxley
-                metadata.roles.clear()
-                all_workers = html.find("div", {"class": "Comments Font9"})
-                worker_list = [w.strip() for w in all_workers.text.split(",")]
-                match_text = dictionary.get(MATCH_KEY, {}).get('text', '')
-                for worker in worker_list:
-                    # Only add workers in this match, do this the naïve way:
-                    if worker in match_text:
-                        Log.Debug("[" + AGENT_NAME + "] [update] Setting roles: worker " + worker + " match " + match_text)
-                        role = metadata.roles.new()
-                        role.name = worker
+                # Only add workers in this match
+                match_workers = event_contexts.get_worker_matcher(event).find(match_name)
+                for worker in match_workers:
+                    Log.Debug("[" + AGENT_NAME + "] [update] Setting roles: worker " + worker + " match " + match_name)
+                if fingerprint.changed('roles', match_workers):
+                    self.set_roles(metadata, match_workers)
                 
                 # Build the summary
-                match_summary = self.build_match_summary(dictionary)
-                if match_summary is not None:
+                match_summary = self.build_match_summary(event, match_name)
+                if match_summary is not None and fingerprint.changed('summary', match_summary):
                     metadata.summary = match_summary
             else:
                 Log.Debug("[" + AGENT_NAME + "] [update] Setting event specific metadata")
+                metrics.increment('update.events')
                 # Set the event name
-                event_name = str(dictionary[NAME_KEY]['text'])
+                event_name = str(event.name)
+                remove_slug = Prefs["removePromotionSlug"] == 'Always' or (Prefs["removePromotionSlug"] == 'When added to \"Promotion Name\" collection' and Prefs["addEventsToCollection"])
+                maxReviews = int(Prefs["reviewCount"])
+
+                # The other pages we need only depend on the event page, so fetch any that aren't cached all at once
+                reviews = None
+                pages = {}
+                if event.card is None:
+                    pages['card'] = (event_contexts.get_event, (event_id, target_url, card_url))
+                if event_name is not None and remove_slug:
+                    promotion_link = event.promotion_link or ''
+                    pages['promotion'] = (promotion_cache.get, (promotion_link, CM_MAIN_URL + promotion_link))
+                if maxReviews > 0:
+                    reviews = self.get_cached_reviews(get_event_key(event_id), maxReviews)
+                    if reviews is None:
+                        pages['comments'] = (self.read_reviews, (target_url + CM_REVIEWS_PARAM, maxReviews))
+                fetched = run_concurrently(pages)
+                # The event loaded along with its card, or the one we had if the card couldn't be loaded
+                event = fetched.get('card') or event
+
                 if event_name is not None:
-                    if Prefs["removePromotionSlug"] == 'Always' or (Prefs["removePromotionSlug"] == 'When added to \"Promotion Name\" collection' and Prefs["addEventsToCollection"]):
-                        raw_promotion_html = simple_get(CM_MAIN_URL + dictionary.get(PROMOTION_KEY, {}).get('link', ''))
-                        if raw_promotion_html is not None:
-                            promotion_html = BeautifulSoup(raw_promotion_html, 'html.parser')
-                            promotion_dict = get_promotion_information_dictionary(promotion_html)
-                            
-                            # Check "Current abbreviation" first
-                            current_slug = promotion_dict.get(CURR_ABBREVIATION_KEY, {}).get('text', '')
-                            if current_slug is not '' and event_name.startswith(current_slug):
-                                    event_name = event_name.replace(current_slug,"",1) # Only remove first instance, which we already know is at start
-                                    if event_name.startswith('/'): # Trim leading slash if we've removed slug for co-promoted events
-                                        event_name = event_name.replace('/',"",1)
-
-                            slug_set = set(promotion_dict.get(ABBREVIATIONS_KEY, {}).get('text', '').split(', '))
-                            for slug in slug_set:
-                                if event_name.startswith(slug):
-                                    event_name = event_name.replace(slug,"",1) # Only remove first instance, which we already know is at start
-                                    if event_name.startswith('/'): # Trim leading slash if we've removed slug for co-promoted events
-                                        event_name = event_name.replace('/',"",1)
-
-                    metadata.title = event_name
+                    if remove_slug:
+                        promotion_slugs = fetched['promotion']
+                        if promotion_slugs is not None:
+                            event_name = promotion_slugs.remove_from(event_name)
+
+                    fingerprint.title = event_name
+                    if fingerprint.changed('title', event_name):
+                        metadata.title = event_name
 
                 # Set the Cagematch rating if available
-                ratings_divs = html.find_all("div", {"class": "RatingsBoxAdjustedRating"})
-                for div in ratings_divs:
-                    if div.string is not None:
-                        event_rating = div.string
-                        if event_rating is not None and str(event_rating) != "---":
-                            metadata.rating = float(event_rating)
+                if event.rating is not None and fingerprint.changed('rating', event.rating):
+                    metadata.rating = float(event.rating)
 
                 # Add reviews if enabled
-                metadata.reviews.clear()
-                maxReviews = int(Prefs["reviewCount"])
+                review_entries = []
                 if maxReviews > 0:
-                    reviewsAdded = 0
-                    raw_event_comments_html = simple_get(target_url + CM_REVIEWS_PARAM)
-                    if raw_event_comments_html is not None:
-                        event_comments_html = BeautifulSoup(raw_event_comments_html, 'html.parser')
-                        comment_divs = event_comments_html.find_all("div", {"class": "Comment"})
-                        i = 0
-                        while (reviewsAdded < maxReviews and i < len(comment_divs)):
-                            comment = comment_divs[i]
-                            r = metadata.reviews.new()
-                            r.author = comment.find("div", {"class": "CommentHeader"}).text.split(" wrote on ")[0]
-                            r.source = 'CAGEMATCH user'
-                            r.link = target_url + CM_REVIEWS_PARAM
-                            r.text = comment.find("div", {"class": "CommentContents"}).text
-                            i += 1
-                            reviewsAdded += 1
+                    if 'comments' in pages:
+                        reviews, complete = fetched['comments'] or (None, False)
+                        if reviews is not None:
+                            record_cache.put(get_event_key(event_id), {
+                                'reviews': (reviews, REVIEWS_TTL),
+                                'reviews_partial': (not complete, REVIEWS_TTL)})
+                    if reviews is not None:
+                        for review in reviews[:maxReviews]:
+                            review_entries.append((review.author, 'CAGEMATCH user', target_url + CM_REVIEWS_PARAM, review.text))
+                if fingerprint.changed('reviews', review_entries):
+                    self.set_reviews(metadata, review_entries)
                 
-                # Set the results into the event dictionary
-                result_divs = html.find("div", {"class": "Matches"})
-                event_results = ''
-                for div in result_divs:
-                    event_results = event_results + '\n' + str(div.find("div", {"class": "MatchResults"}).text)
-                dictionary[RESULTS_KEY] = {'text': event_results}
-
-                # Set the card into the event dictionary
-                raw_card_html = simple_get(target_url + CM_EVENT_CARD_PARAM)
-                if raw_card_html is not None:
-                    card_html = BeautifulSoup(raw_card_html, 'html.parser')
-                    card_divs = card_html.find("div", {"class": "Matches"})
-                    event_card = ''
-                    for div in card_divs:
-                        event_card = event_card + '\n' + str(div.find("div", {"class": "MatchResults"}).text)
-                    dictionary[CARD_KEY] = {'text': event_card}
-
                 # Set workers as roles, in future some way to link roles that are same e.g. Dean Ambrose/Jon Moxley
-                all_workers = html.find("div", {"class": "Comments Font9"})
-                worker_list = [w.strip() for w in all_workers.text.split(",")]
-                for worker in worker_list:
-                    role = metadata.roles.new()
-                    role.name = worker
+                if fingerprint.changed('roles', event.workers):
+                    self.set_roles(metadata, event.workers)
                 
                 # Build the summary
-                event_summary = self.build_event_summary(dictionary)
-                if event_summary is not None:
+                event_summary = self.build_event_summary(event)
+                if event_summary is not None and fingerprint.changed('summary', event_summary):
                     metadata.summary = event_summary
+
+            fingerprint.save()
         else:
             Log.Error("[" + AGENT_NAME + "] [update] Nothing was returned from request")
         return
     
 
-    def build_event_summary(self, dict):
+    # Read the first `count` reviews from a comments page, downloading only as much of the page as they need
+    def read_reviews(self, reviews_url, count):
+        raw_html, complete = stream_get(reviews_url, DivCounter(COMMENT_CLASS, count))
+        if raw_html is None:
+            return None, False
+        return parse_reviews_page(raw_html).comments, complete
+
+
+    # The cached reviews of an event or match, unless they were cut short before `count` of them
+    def get_cached_reviews(self, key, count):
+        reviews = record_cache.get(key, 'reviews', Review, many=True)
+        if reviews is not None and len(reviews) < count and record_cache.get(key, 'reviews_partial'):
+            return None
+        return reviews
+
+
+    # Read the WON rating from a match's matchguide entry, which only needs the page up to its information box
+    def read_matchguide(self, matchguide_url):
+        raw_html = stream_get(matchguide_url, DivCounter(INFORMATION_BOX_CLASS, 1))[0]
+        if raw_html is None:
+            return None
+        matchguide_dictionary = parse_matchguide_page(raw_html).info
+        return Matchguide(matchguide_dictionary[WON_KEY]['text'] if WON_KEY in matchguide_dictionary else None)
+
+
+    # Replace the item's reviews with (author, source, link, text) entries
+    def set_reviews(self, metadata, review_entries):
+        metadata.reviews.clear()
+        for author, source, link, text in review_entries:
+            r = metadata.reviews.new()
+            r.author = author
+            r.source = source
+            r.link = link
+            r.text = text
+
+
+    # Replace the item's roles with the given workers
+    def set_roles(self, metadata, workers):
+        metadata.roles.clear()
+        for worker in workers:
+            role = metadata.roles.new()
+            role.name = worker
+
+
+    def build_event_summary(self, event):
         DEFAULT_FORMAT_STRING = "{name} was an event {promotion} that took place on {date} from the {arena} in {location}."
         if Prefs["descriptionType"] == 'Card':
             card_str = "{card}"
@@ -458,42 +407,37 @@ class Cagent_Movie(Agent.Movies):
         elif Prefs["descriptionType"] == 'None':
             card_str = ''
         format_str = DEFAULT_FORMAT_STRING + card_str
-        promotion_text = ''
-        if dict[PROMOTION_KEY]['text'] not in FREELANCE_STRINGS:
-            promotion_text  = 'by ' + dict[PROMOTION_KEY]['text']
         return format_str.format(
-            name=dict[NAME_KEY]['text'],
-            promotion=promotion_text,
-            date=dict[DATE_KEY]['text'],
-            arena=dict[ARENA_KEY]['text'],
-            location=dict[LOCATION_KEY]['text'],
-            type=dict[TYPE_KEY]['text'],
-            broadcast_type=dict.get(BROADCAST_TYPE_KEY, {}).get('text', ''),
-            broadcast_date=dict.get(BROADCAST_DATE_KEY, {}).get('text', ''),
-            network=dict.get(NETWORK_KEY, {}).get('text', ''),
-            commentary=dict.get(COMMENTARY_KEY, {}).get('text', ''),
-            card=dict.get(CARD_KEY, {}).get('text', ''),
-            results=dict.get(RESULTS_KEY, {}).get('text', ''))
-
-
-    def build_match_summary(self, dict):
+            card=event.card_text,
+            results=event.results_text,
+            **self.get_summary_fields(event))
+
+
+    def build_match_summary(self, event, match_name):
         DEFAULT_FORMAT_STRING = "{match_name} was a match at {name}, an event {promotion} that took place on {date} from the {arena} in {location}."
         format_str = DEFAULT_FORMAT_STRING
-        promotion_text = ''
-        if dict[PROMOTION_KEY]['text'] not in FREELANCE_STRINGS:
-            promotion_text  = 'by ' + dict[PROMOTION_KEY]['text']
         return format_str.format(
-            name=dict[NAME_KEY]['text'],
-            promotion=promotion_text,
-            date=dict[DATE_KEY]['text'],
-            arena=dict[ARENA_KEY]['text'],
-            location=dict[LOCATION_KEY]['text'],
-            type=dict[TYPE_KEY]['text'],
-            broadcast_type=dict.get(BROADCAST_TYPE_KEY, {}).get('text', ''),
-            broadcast_date=dict.get(BROADCAST_DATE_KEY, {}).get('text', ''),
-            network=dict.get(NETWORK_KEY, {}).get('text', ''),
-            commentary=dict.get(COMMENTARY_KEY, {}).get('text', ''),
-            match_name=dict.get(MATCH_KEY, {}).get('text', ''))
+            match_name=match_name,
+            **self.get_summary_fields(event))
+
+
+    # The event fields both kinds of summary can use, with missing ones left blank
+    def get_summary_fields(self, event):
+        promotion_text = ''
+        if event.promotion is not None and event.promotion not in FREELANCE_STRINGS:
+            promotion_text  = 'by ' + event.promotion
+        return {
+            'name': event.name or '',
+            'promotion': promotion_text,
+            'date': event.date or '',
+            'arena': event.arena or '',
+            'location': event.location or '',
+            'type': event.event_type or '',
+            'broadcast_type': event.broadcast_type or '',
+            'broadcast_date': event.broadcast_date or '',
+            'network': event.network or '',
+            'commentary': event.commentary or ''
+        }
 
 
     # Request card page, and either return a single candidate: either the event information or the information for a specific match
@@ -507,21 +451,18 @@ class Cagent_Movie(Agent.Movies):
             event_id = cm_id
         target_url = CM_MAIN_URL + CM_EVENT_URL.format(eventid=event_id) + CM_EVENT_CARD_PARAM
         Log.Debug("[" + AGENT_NAME + "] [search_by_cm_id] Event URL: " + target_url)
-        raw_html = simple_get(target_url)
-        if raw_html is not None:
-            html = BeautifulSoup(raw_html, 'html.parser')
-            dictionary = get_event_information_dictionary(html)
-            date_str = dictionary[DATE_KEY]['text']
-            dd, mm, yyyy = date_str.split(".")
-            event_name = str(dictionary[NAME_KEY]['text'])
+        event = event_contexts.get_card_event(event_id, target_url)
+        if event is not None:
+            dd, mm, yyyy = event.date.split(".")
+            event_name = str(event.name)
             if match_id is not None:
-                card_divs = html.find("div", {"class": "Matches"})
+                card_matches = event.card
                 match_id_int = int(match_id)
                 match_idx = match_id_int - 1 if match_id_int > 0 else match_id_int
                 if match_idx == 0:
-                    for count, div in enumerate(card_divs.contents, start=1):
+                    for count, match_name in enumerate(card_matches, start=1):
                         name = format_match_name_for_candidate(
-                            str(div.find("div", {"class": "MatchResults"}).text),
+                            match_name,
                             event_name, yyyy, mm, dd)
 
                         results.Append(MetadataSearchResult(
@@ -530,9 +471,9 @@ class Cagent_Movie(Agent.Movies):
                             year=str(int(yyyy)),
                             score=50,
                             lang=lang))
-                elif match_idx < len(card_divs):
+                elif match_idx < len(card_matches):
                     name = format_match_name_for_candidate(
-                        str(card_divs.contents[match_idx].find("div", {"class": "MatchResults"}).text),
+                        card_matches[match_idx],
                         event_name, yyyy, mm, dd)
 
                     results.Append(MetadataSearchResult(
@@ -553,29 +494,26 @@ class Cagent_Movie(Agent.Movies):
             return
 
     
-    def search_for_events(self, results, media, lang, search_input, search_input_str):
+    def search_for_events(self, results, media, lang, search_input, search_input_str, manual=False):
         search_str = search_input_str
         if 'name' in search_input:
             search_str = search_input['name']
             if 'prom' in search_input:
                 search_str = search_input['prom'] + " " + search_str
 
-        if 'date' in search_input:
-            date = get_date(search_input['date'])
-            candidate_events = self.do_event_search(search_str, date)
-            if len(candidate_events) == 0:
-                # If we didn't get any results for a specific date search, 
-                # do a more general one
-                candidate_events = self.do_event_search(search_str)
-        else:
-            candidate_events = self.do_event_search(search_str)
+        date = get_date(search_input['date']) if 'date' in search_input else None
+        # If a search for the specific date doesn't find the event, fall back to more general ones
+        candidate_events = self.run_search_plan(plan_event_search(search_input, search_str, date), search_str, manual)
 
-        scored_candidates = process.extract(search_str, [c['name'] for c in candidate_events], limit=len(candidate_events))
+        with metrics.timer('score.events_ms'):
+            scored_candidates = extract_events(search_str, [c['name'] for c in candidate_events], None if manual else AUTOMATIC_RESULT_LIMIT)
         # Convert scores into a dict so we can do a quick lookup using the event name
         score_dict = dict(scored_candidates)
         Log.Debug("[" + AGENT_NAME + "] [search_for_events] Candidate scores: " + str(score_dict))
         # TODO do some scoring modification for date matches: promotion match and date match
         for candidate in candidate_events:
+            if candidate['name'] not in score_dict:
+                continue
             Log.Debug("[" + AGENT_NAME + "] [search_for_events] Adding candidate: " + str(candidate))
             results.Append(MetadataSearchResult(
                 id=candidate['id'],
@@ -587,28 +525,27 @@ class Cagent_Movie(Agent.Movies):
 
 
     # Try and find a promotions event(s) on a specific date so we can try match to a specific match
-    def search_for_matches(self, results, media, lang, search_input, search_input_str):
+    def search_for_matches(self, results, media, lang, search_input, search_input_str, manual=False):
         search_str = search_input_str
         if 'prom' in search_input:
             search_str = search_input['prom']
 
-        if 'date' in search_input:
-            date = get_date(search_input['date'])
-            candidate_events = self.do_event_search(search_str, date)
+        date = get_date(search_input['date']) if 'date' in search_input else None
+        candidate_events = self.run_search_plan(plan_match_search(search_input, search_str, date), None, manual)
+
+        # Load the cards of every event on the date at once, and pool all of their matches
+        card_events = parallel_map(
+            lambda candidate: event_contexts.get_card_event(candidate['id'], CM_MAIN_URL + CM_EVENT_URL.format(eventid=candidate['id']) + CM_EVENT_CARD_PARAM),
+            candidate_events)
         match_candidates = []
-        for candidate in candidate_events:
-            target_url = CM_MAIN_URL + CM_EVENT_URL.format(eventid=candidate['id'])
-            raw_card_html = simple_get(target_url + CM_EVENT_CARD_PARAM)
-            if raw_card_html is not None:
-                card_html = BeautifulSoup(raw_card_html, 'html.parser')
-                card_divs = card_html.find("div", {"class": "Matches"})
-                match_candidates = []
+        for candidate, card_event in zip(candidate_events, card_events):
+            if card_event is not None:
                 match_index = 1
-                for div in card_divs:
+                for match_name in card_event.card:
                     match_candidates.append(
                         {
                             'id': candidate['id'] + ":" + str(match_index),
-                            'name': str(div.find("div", {"class": "MatchResults"}).text),
+                            'name': match_name,
                             'event_name': candidate['name'],
                             'year': candidate['year'],
                             'month': candidate['month'],
@@ -621,11 +558,14 @@ class Cagent_Movie(Agent.Movies):
         match_str = search_input_str
         if 'name' in search_input:
             match_str = search_input['name']
-        scored_candidates = process.extract(match_str, [c['name'] for c in match_candidates], limit=len(match_candidates), scorer=fuzz.token_set_ratio)
+        with metrics.timer('score.matches_ms'):
+            scored_candidates = extract_matches(match_str, [c['name'] for c in match_candidates], None if manual else AUTOMATIC_RESULT_LIMIT)
         score_dict = dict(scored_candidates)
         Log.Debug("[" + AGENT_NAME + "] [search_for_matches] Candidate scores ratio: " + str(score_dict))
         # TODO do some scoring modification for date matches: promotion match and date match
         for candidate in match_candidates:
+            if candidate['name'] not in score_dict:
+                continue
             Log.Debug("[" + AGENT_NAME + "] [search_for_matches] Adding candidate: " + str(candidate))
             results.Append(MetadataSearchResult(
                 id=candidate['id'],
@@ -637,7 +577,81 @@ class Cagent_Movie(Agent.Movies):
         return
 
 
-    def do_event_search(self, search_str, date=None):
+    # Work through the tiers of a search plan until one finds what we're after. The strategies in a tier are run side by
+    # side, and their results pooled. Given a `score_str`, a tier is only enough if one of its events scores at least
+    # "searchConfidence" against it, as most dates have some event on them. Otherwise the candidates found so far are
+    # kept and the next tier is tried. Without one, the first tier to find any events is used
+    def run_search_plan(self, plan, score_str, manual):
+        confidence = get_int_pref("searchConfidence", DEFAULT_SEARCH_CONFIDENCE)
+        candidate_events = []
+        seen_ids = set()
+        for tier in plan:
+            tier_events = parallel_map(lambda strategy: self.run_search_strategy(strategy, score_str, manual), tier)
+            tier_names = []
+            for strategy_events in tier_events:
+                for candidate in strategy_events or []:
+                    if candidate['id'] not in seen_ids:
+                        seen_ids.add(candidate['id'])
+                        candidate_events.append(candidate)
+                        tier_names.append(candidate['name'])
+            if len(tier_names) == 0:
+                continue
+            if score_str is None:
+                return candidate_events
+            best_name, best_score = extract_events(score_str, tier_names, 1)[0]
+            if best_score >= confidence:
+                Log.Debug("[" + AGENT_NAME + "] [run_search_plan] Stopping at \"" + best_name + "\", scored " + str(best_score))
+                return candidate_events
+        return candidate_events
+
+
+    # Run one search strategy, from the event index if we can. Automatic searches skip those that recently found nothing
+    def run_search_strategy(self, strategy, score_str, manual):
+        Log.Debug("[" + AGENT_NAME + "] [run_search_strategy] Searching by " + strategy.description + ": \"" + strategy.search_str + "\"")
+        candidate_events = self.find_indexed_events(strategy.search_str, strategy.date, manual)
+        if candidate_events is not None:
+            return candidate_events
+        if not manual and negative_searches.contains(strategy.search_str, strategy.date):
+            Log.Debug("[" + AGENT_NAME + "] [run_search_strategy] Skipping search that recently found nothing")
+            metrics.increment('search.negative_hits')
+            return []
+        return self.read_event_search(strategy.search_str, strategy.date, score_str)
+
+
+    # Answer a search we have already read every result of without asking CAGEMATCH. Returns None when the site needs
+    # asking, which manual searches always do
+    def find_indexed_events(self, search_str, date, manual):
+        if manual or date is None:
+            return None
+        candidate_events = event_index.find_events(search_str, date)
+        metrics.increment('search.index_hits' if candidate_events is not None else 'search.index_misses')
+        if candidate_events is not None:
+            Log.Info("[" + AGENT_NAME + "] [find_indexed_events] Found " + str(len(candidate_events)) + " indexed events for \"" + search_str + "\"")
+        return candidate_events
+
+
+    # Gather the rows of an event search. Given a `score_str`, stop reading pages once an event scores well enough against it,
+    # and without one only read the first few pages
+    def read_event_search(self, search_str, date=None, score_str=None):
+        until_confident = Prefs["searchMode"] == SEARCH_MODE_UNTIL_CONFIDENT
+        stop_early = score_str is not None and until_confident
+        max_pages = UNSCORED_SEARCH_PAGES if score_str is None and until_confident else MAX_SEARCH_PAGES
+        confidence = get_int_pref("searchConfidence", DEFAULT_SEARCH_CONFIDENCE)
+        candidate_events = []
+        for rows in self.do_event_search(search_str, date, max_pages):
+            candidate_events.extend(rows)
+            if stop_early and len(rows) > 0:
+                best_name, best_score = extract_events(score_str, [row['name'] for row in rows], 1)[0]
+                if best_score >= confidence:
+                    Log.Debug("[" + AGENT_NAME + "] [read_event_search] Stopping at \"" + best_name + "\", scored " + str(best_score))
+                    break
+        return candidate_events
+
+
+    # Search CAGEMATCH for events, yielding the result rows a page at a time. Once the caller asks for more than the
+    # first page, later pages are fetched a few at a time ahead of the one being read. How many pages are read depends
+    # on the "searchMode" preference, up to `max_pages`, and the caller can stop iterating to skip the rest
+    def do_event_search(self, search_str, date=None, max_pages=MAX_SEARCH_PAGES):
         Log.Info("[" + AGENT_NAME + "] [do_event_search] Performing search with string \"" + search_str + "\"")
         safe_url = urllib.quote_plus(search_str)
         target_url = CM_MAIN_URL + CM_SEARCH_URL.format(eventname=safe_url)
@@ -646,24 +660,45 @@ class Cagent_Movie(Agent.Movies):
         else:
             target_url = target_url + CM_DEFAULT_DATE_PARAMS
         Log.Debug("[" + AGENT_NAME + "] [do_event_search] Search URL: " + target_url)
-        raw_html = simple_get(target_url)
-        if raw_html is not None:
-            html = BeautifulSoup(raw_html, 'html.parser')
-            search_results = parse_search_result_counts(html)
-            if search_results['total'] == 0:
+        rows_seen = []
+        complete = False
+        try:
+            raw_html = simple_get(target_url)
+            if raw_html is None:
+                Log.Error("[" + AGENT_NAME + "] [do_event_search] Nothing was returned from request")
+                return
+            search_page = parse_search_page(raw_html)
+            counts = search_page.counts
+            if counts['total'] == 0:
                 Log.Info("[" + AGENT_NAME + "] [do_event_search] No results found.")
-            else:
-                candidates = []
-                # Should find results table
-                table = html.find('table')
-                # Get all rows, dropping the header
-                table_rows = table.find_all('tr', class_=lambda x: x != 'THeaderRow')
-                for table_row in table_rows:
-                    candidate = parse_search_result_row(table_row)
-                    if candidate is not None:
-                        candidates.append(candidate)
-                return candidates
-        else:
-            Log.Error("[" + AGENT_NAME + "] [do_event_search] Nothing was returned from request")
-            
-        return []
+                # Left to the negative cache, which asks again after a while
+                negative_searches.add(search_str, date)
+                return
+            rows_seen.extend(search_page.rows)
+            yield search_page.rows
+
+            page_size = counts['end'] - counts['start'] + 1
+            offsets = []
+            if Prefs["searchMode"] != SEARCH_MODE_FIRST_PAGE:
+                offsets = list(range(counts['end'], counts['total'], page_size))[:max_pages - 1]
+                if len(offsets) > 0:
+                    Log.Debug("[" + AGENT_NAME + "] [do_event_search] Reading " + str(len(offsets)) + " more pages of " + str(counts['total']) + " results")
+            jobs = [BackgroundJob(simple_get, (target_url + CM_SEARCH_OFFSET_PARAM.format(offset=offset),)) for offset in offsets[:SEARCH_PREFETCH_PAGES]]
+            next_offset_idx = len(jobs)
+            read_every_page = True
+            while len(jobs) > 0:
+                raw_html = jobs.pop(0).result()
+                if next_offset_idx < len(offsets):
+                    jobs.append(BackgroundJob(simple_get, (target_url + CM_SEARCH_OFFSET_PARAM.format(offset=offsets[next_offset_idx]),)))
+                    next_offset_idx += 1
+                if raw_html is None:
+                    Log.Error("[" + AGENT_NAME + "] [do_event_search] Nothing was returned from request for a later page")
+                    read_every_page = False
+                    continue
+                rows = parse_search_page(raw_html).rows
+                rows_seen.extend(rows)
+                yield rows
+            complete = read_every_page and counts['end'] + len(offsets) * page_size >= counts['total']
+        finally:
+            # Only a search we read every result of can stand in for asking CAGEMATCH again
+            event_index.add_search(search_str, date if complete else None, rows_seen)
@@ -0,0 +1,156 @@
+"""
+In-memory context for the events we're working on, shared by searches and updates.
+Matching a show's matches means looking at the same event page and card again and again: once
+to list the matches, and again for every match file updated. Each event's record is kept here
+once it has been loaded, so later matches of the same event need neither the network nor the
+parser. Only the most recently used events are kept, and only for a while.
+When an event's cached record has expired but its page hasn't changed, the record is kept rather
+than parsing the page again.
+"""
+import threading
+import time
+
+from collections import OrderedDict
+from extraction import parse_event_page, parse_card_page
+from http_cache import get_content_hash
+from instrumentation import metrics
+from record_cache import record_cache, get_event_key, get_event_record_ttl
+from records import Event
+from url_loading import simple_get
+from worker_matching import WorkerMatcher
+
+MAX_EVENT_CONTEXTS = 64
+# How long an event is kept in memory, so that a long running server still notices changes
+CONTEXT_TTL = 60 * 60
+
+
+class EventContext(object):
+    """
+    What we know about one event. `event` is the full record from the event page, while
+    `card_event` is only the information box and card, for when just the card page has been read.
+    Loading either holds `lock`, so threads working on the same event load it once between them.
+    `worker_matcher` finds the event's workers in its matches, and is built the first time it's needed.
+    """
+
+    def __init__(self, event_id):
+        self.event_id = event_id
+        self.lock = threading.Lock()
+        self.event = None
+        self.card_event = None
+        self.worker_matcher = None
+        self.expires = time.time() + CONTEXT_TTL
+
+
+class EventContexts(object):
+    """
+    Least recently used contexts by event id.
+    """
+
+    def __init__(self, max_size=MAX_EVENT_CONTEXTS):
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        self._contexts = OrderedDict()
+
+    def get(self, event_id):
+        event_id = str(event_id)
+        with self._lock:
+            context = self._contexts.pop(event_id, None)
+            if context is None or context.expires < time.time():
+                context = EventContext(event_id)
+            self._contexts[event_id] = context
+            while len(self._contexts) > self._max_size:
+                self._contexts.popitem(last=False)
+            return context
+
+    def get_event(self, event_id, event_url, card_url=None):
+        """
+        Return the full Event record for `event_id`, from memory, the record cache or by fetching and
+        parsing `event_url`. Given a `card_url`, the card is loaded as well if we don't have it.
+
+        :return: Event, or None if it couldn't be loaded
+        """
+        context = self.get(event_id)
+        with context.lock:
+            event = context.event
+            changed = False
+            sources = None
+            if event is None:
+                event = record_cache.get(get_event_key(event_id), 'event', Event)
+                if event is None:
+                    metrics.increment('context.misses')
+                    raw_html = simple_get(event_url)
+                    if raw_html is None:
+                        return None
+                    sources = {'event': get_content_hash(raw_html)}
+                    event = record_cache.get_unchanged(get_event_key(event_id), 'event', sources['event'], Event)
+                    if event is None:
+                        event_page = parse_event_page(raw_html)
+                        event = Event.from_info(event_id, event_page.info, event_page.matches, event_page.rating, event_page.workers)
+                    else:
+                        # Only the event page is known to be the same, so the card is read again when needed
+                        event.card = None
+                    changed = True
+                if event.card is None and context.card_event is not None:
+                    event.card = context.card_event.card
+                    changed = True
+                context.event = event
+            else:
+                metrics.increment('context.hits')
+
+            if card_url is not None and event.card is None:
+                raw_card_html = simple_get(card_url)
+                if raw_card_html is not None:
+                    event.card = [match.text for match in parse_card_page(raw_card_html).matches]
+                    changed = True
+
+            if changed:
+                record_cache.put(get_event_key(event_id), {'event': (event, get_event_record_ttl(event))}, sources)
+            return event
+
+    def get_card_event(self, event_id, card_url):
+        """
+        Return an Event record for `event_id` with at least its information box and card, reading only
+        the card page if we don't already have a record with the card.
+
+        :return: Event, or None if it couldn't be loaded
+        """
+        context = self.get(event_id)
+        with context.lock:
+            for event in (context.event, context.card_event):
+                if event is not None and event.card is not None:
+                    metrics.increment('context.hits')
+                    return event
+            if context.event is None:
+                event = record_cache.get(get_event_key(event_id), 'event', Event)
+                if event is not None:
+                    context.event = event
+                    if event.card is not None:
+                        return event
+
+            metrics.increment('context.misses')
+            raw_card_html = simple_get(card_url)
+            if raw_card_html is None:
+                return None
+            card_page = parse_card_page(raw_card_html)
+            card = [match.text for match in card_page.matches]
+            if context.event is not None:
+                # The full record was only missing its card
+                context.event.card = card
+                record_cache.put(get_event_key(event_id), {'event': (context.event, get_event_record_ttl(context.event))})
+                return context.event
+            context.card_event = Event.from_info(event_id, card_page.info, None)
+            context.card_event.card = card
+            return context.card_event
+
+    def get_worker_matcher(self, event):
+        """
+        Return a WorkerMatcher for the workers of `event`, built once and shared by all of its matches.
+        """
+        context = self.get(event.id)
+        with context.lock:
+            if context.worker_matcher is None or context.worker_matcher.workers != event.workers:
+                context.worker_matcher = WorkerMatcher(event.workers)
+            return context.worker_matcher
+
+
+event_contexts = EventContexts()
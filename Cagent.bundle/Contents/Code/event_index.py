@@ -0,0 +1,175 @@
+"""
+A local index of the dated CAGEMATCH searches we have read every result of, and the events they
+found, so repeated automatic searches for a dated file name can be answered without asking the
+site.
+Only searches we read every result of are answered from the index: the events we have seen on a
+date are rarely all of them, so anything else still goes to the site. Old shows do still get
+added to the site, so a remembered search is asked again after a while. The index is saved as
+JSON in the bundle's data directory.
+"""
+import datetime
+import json
+import threading
+import time
+
+from http_cache import DAY, PAST_EVENT_AGE_DAYS
+
+STORE_KEY = "event-index"
+# How long a search is remembered for, like searches for dates long gone that found nothing
+SEARCH_TTL = 7 * DAY
+# Changes are written back in batches, rather than after every event we see
+SAVE_AFTER_CHANGES = 25
+SAVE_AFTER_SECONDS = 30
+
+
+def get_date_key(date):
+    return "%04d-%02d-%02d" % (date.year, date.month, date.day)
+
+
+def get_search_key(search_str, date):
+    """
+    The key a dated search is remembered under. Only spacing and case are ignored, as any other
+    difference in the query can change what the site returns.
+    """
+    if isinstance(search_str, str):
+        search_str = search_str.decode('utf-8', 'ignore')
+    return get_date_key(date) + "|" + " ".join(search_str.lower().split())
+
+
+class EventIndex(object):
+    """
+    The dated searches that went to the site, with when they did, and the records of the events they
+    found keyed by event id, so that repeating one returns exactly the events the site gave us.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = None
+        self._searches = None
+        self._unsaved_changes = 0
+        self._last_save = time.time()
+
+    def find_events(self, search_str, date):
+        """
+        Give the events a dated search for `search_str` found last time, in the same format as search
+        result rows. Only searches whose every result was read are remembered, so that the answer is
+        as complete as the site's.
+
+        :return: list of dictionaries containing "id", "name", "year", "month" and "day", or None if
+                 the search isn't remembered and the site needs asking
+        """
+        with self._lock:
+            self._load()
+            search = self._searches.get(get_search_key(search_str, date))
+            if search is None or search['stored'] < time.time() - SEARCH_TTL:
+                return None
+            return [self._get_row(event_id) for event_id in search['ids'] if event_id in self._events]
+
+    def add_search(self, search_str, date, rows):
+        """
+        Remember a dated search on the site and the rows it returned, if it is far enough in the past that
+        events are rarely added to it. Searches that found nothing are left to the negative search cache.
+        """
+        if not rows or date is None or (datetime.date.today() - date).days <= PAST_EVENT_AGE_DAYS:
+            return
+        with self._lock:
+            self._load()
+            for row in rows:
+                self._add(row['id'], row['name'], "%s-%s-%s" % (row['year'], row['month'], row['day']))
+            self._searches[get_search_key(search_str, date)] = {'stored': time.time(), 'ids': [row['id'] for row in rows]}
+            self._changed(len(rows) + 1)
+
+    def export(self):
+        """
+        :return: tuple of (event id to event record, search key to search), copies of what is indexed
+        """
+        with self._lock:
+            self._load()
+            self._prune()
+            return dict(self._events), dict(self._searches)
+
+    def merge(self, events, searches):
+        """
+        Merge events and searches, as given by `export` from another index, and save the index. A search is
+        taken if it was stored later than ours and hasn't expired, along with the events it found.
+
+        :return: the number of searches and events that were added or replaced
+        """
+        changed = 0
+        expired = time.time() - SEARCH_TTL
+        with self._lock:
+            self._load()
+            for search_key, search in searches.items():
+                current = self._searches.get(search_key)
+                if not isinstance(search, dict) or search['stored'] < expired or (
+                        current is not None and current['stored'] >= search['stored']):
+                    continue
+                self._searches[search_key] = search
+                changed += 1
+                for event_id in search['ids']:
+                    record = events.get(event_id)
+                    if record is not None and self._events.get(event_id) != record:
+                        self._events[event_id] = record
+                        changed += 1
+            if changed:
+                self._save()
+        return changed
+
+    def _add(self, event_id, name, date_key):
+        """
+        Add or update an event record. Must be called with the lock held.
+        """
+        event_id = str(event_id)
+        self._events[event_id] = {'id': event_id, 'name': name, 'date': date_key}
+
+    def _prune(self):
+        """
+        Forget the searches that have expired, and the events no remaining search found. Must be called with the
+        lock held.
+        """
+        expired = time.time() - SEARCH_TTL
+        self._searches = dict((key, search) for key, search in self._searches.items() if search['stored'] >= expired)
+        found_ids = set(event_id for search in self._searches.values() for event_id in search['ids'])
+        self._events = dict((event_id, record) for event_id, record in self._events.items() if event_id in found_ids)
+
+    def _get_row(self, event_id):
+        record = self._events[event_id]
+        yyyy, mm, dd = record['date'].split("-")
+        return {
+            'id': str(record['id']),
+            'name': record['name'],
+            'year': str(yyyy),
+            'month': str(mm),
+            'day': str(dd)
+        }
+
+    def _changed(self, count):
+        self._unsaved_changes += count
+        if self._unsaved_changes >= SAVE_AFTER_CHANGES or time.time() - self._last_save > SAVE_AFTER_SECONDS:
+            self._save()
+
+    def _load(self):
+        if self._events is not None:
+            return
+        self._events = {}
+        self._searches = {}
+        try:
+            raw_store = Data.Load(STORE_KEY)
+            if raw_store is not None:
+                store = json.loads(raw_store)
+                # Searches remembered without the time they were stored are asked again
+                self._searches = dict((key, search) for key, search in store.get('searches', {}).items() if isinstance(search, dict))
+                for event_id, record in store.get('events', {}).items():
+                    self._events[str(event_id)] = record
+        except Exception as exc:
+            Log.Error("[event_index] Could not load event index, starting afresh: " + str(exc))
+        self._prune()
+
+    def _save(self):
+        self._prune()
+        self._unsaved_changes = 0
+        self._last_save = time.time()
+        Data.Save(STORE_KEY, json.dumps({'events': self._events, 'searches': self._searches}))
+
+
+event_index = EventIndex()
@@ -0,0 +1,385 @@
+"""
+Pull the parts we use out of CAGEMATCH pages.
+Rather than building a tree of a whole page, each page type only parses the handful of divs the
+agent reads, and hands back a small object holding what was found.
+For pages where only the first few divs are needed, DivCounter follows the page as it downloads
+so the rest of it never has to be read.
+Beautiful Soup and lxml are only imported the first time a page is parsed, as most updates find
+everything they need in the record cache.
+"""
+import re
+import urlparse
+
+from instrumentation import timed
+from records import Match, Review
+
+_parser = None
+
+# ################### Cagematch page classes ###################
+INFORMATION_BOX_CLASS = "InformationBoxTable"
+MATCHES_CLASS = "Matches"
+WORKERS_CLASS = "Comments Font9"
+RATING_CLASS = "RatingsBoxAdjustedRating"
+COMMENT_CLASS = "Comment"
+SEARCH_HEADER_CLASS = "TableHeaderOff"
+
+MATCHGUIDE_RATING_PREFIX = ':::: Matchguide Rating: '
+
+DIV_TAG_REGEX = re.compile(r'<(/?)div\b([^>]*)>', re.IGNORECASE)
+CLASS_ATTRIBUTE_REGEX = re.compile(r'class\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+
+# Change this whenever what is extracted from a page, or the records it is kept in, changes. Cached records from
+# another version are thrown away
+PARSER_VERSION = 1
+
+
+class EventPage(object):
+    """
+    An event page: the information box, the results, the CAGEMATCH rating and all the workers on the show.
+    """
+
+    def __init__(self, info, matches, rating, workers):
+        self.info = info
+        self.matches = matches
+        self.rating = rating
+        self.workers = workers
+
+
+class CardPage(object):
+    """
+    The card page of an event (&page=2): the information box, and the matches as they were advertised.
+    """
+
+    def __init__(self, info, matches):
+        self.info = info
+        self.matches = matches
+
+
+class ReviewsPage(object):
+    """
+    A comments page (&page=99) of an event or a match, as a list of Review records in page order.
+    """
+
+    def __init__(self, comments):
+        self.comments = comments
+
+
+class PromotionPage(object):
+    """
+    A promotion page, with its general and details information boxes merged into one dictionary.
+    """
+
+    def __init__(self, info):
+        self.info = info
+
+
+class MatchguidePage(object):
+    """
+    A matchguide entry for a single match.
+    """
+
+    def __init__(self, info):
+        self.info = info
+
+
+class SearchPage(object):
+    """
+    An event search results page: the result counts from the header and the parsed result rows.
+    """
+
+    def __init__(self, counts, rows):
+        self.counts = counts
+        self.rows = rows
+
+
+@timed('parse.event_ms')
+def parse_event_page(raw_html):
+    html = make_soup(raw_html, lambda name, attrs: name == 'div' and has_class(attrs, (
+        INFORMATION_BOX_CLASS, MATCHES_CLASS, WORKERS_CLASS, RATING_CLASS)))
+    info = get_dict_from_table(html.find("div", {"class": INFORMATION_BOX_CLASS}))
+    rating = None
+    for div in html.find_all("div", {"class": RATING_CLASS}):
+        if div.string is not None and str(div.string) != "---":
+            rating = str(div.string)
+    workers = []
+    workers_div = html.find("div", {"class": WORKERS_CLASS})
+    if workers_div is not None:
+        workers = [w.strip() for w in workers_div.text.split(",")]
+    Log.Debug("[extraction] [parse_event_page] Parsed event dictionary: " + str(info))
+    return EventPage(info, get_match_entries(html), rating, workers)
+
+
+@timed('parse.card_ms')
+def parse_card_page(raw_html):
+    html = make_soup(raw_html, lambda name, attrs: name == 'div' and has_class(attrs, (
+        INFORMATION_BOX_CLASS, MATCHES_CLASS)))
+    info = get_dict_from_table(html.find("div", {"class": INFORMATION_BOX_CLASS}))
+    return CardPage(info, get_match_entries(html))
+
+
+@timed('parse.reviews_ms')
+def parse_reviews_page(raw_html):
+    html = make_soup(raw_html, lambda name, attrs: name == 'div' and has_class(attrs, (COMMENT_CLASS,)))
+    comments = []
+    for comment in html.find_all("div", {"class": COMMENT_CLASS}):
+        author = comment.find("div", {"class": "CommentHeader"}).text.split(" wrote on ")[0]
+        text = comment.find("div", {"class": "CommentContents"}).text
+        comments.append(Review(author, text))
+    return ReviewsPage(comments)
+
+
+@timed('parse.promotion_ms')
+def parse_promotion_page(raw_html):
+    html = make_soup(raw_html, lambda name, attrs: name == 'div' and has_class(attrs, (INFORMATION_BOX_CLASS,)))
+    tables = html.find_all("div", {"class": INFORMATION_BOX_CLASS})
+    info = get_dict_from_table(tables[0])
+    info.update(get_dict_from_table(tables[1]))
+    Log.Debug("[extraction] [parse_promotion_page] Parsed promotion dictionary: " + str(info))
+    return PromotionPage(info)
+
+
+@timed('parse.matchguide_ms')
+def parse_matchguide_page(raw_html):
+    html = make_soup(raw_html, lambda name, attrs: name == 'div' and has_class(attrs, (INFORMATION_BOX_CLASS,)))
+    return MatchguidePage(get_dict_from_table(html.find("div", {"class": INFORMATION_BOX_CLASS})))
+
+
+@timed('parse.search_ms')
+def parse_search_page(raw_html):
+    html = make_soup(raw_html, lambda name, attrs: name == 'table' or (
+        name == 'div' and has_class(attrs, (SEARCH_HEADER_CLASS,))))
+    counts = parse_search_result_counts(html)
+    rows = []
+    if counts['total'] > 0:
+        # Should find results table
+        table = html.find('table')
+        # Get all rows, dropping the header
+        for table_row in table.find_all('tr', class_=lambda x: x != 'THeaderRow'):
+            row = parse_search_result_row(table_row)
+            if row is not None:
+                rows.append(row)
+    return SearchPage(counts, rows)
+
+
+class DivCounter(object):
+    """
+    Count the complete divs of class `class_name` in a page fed to it a chunk at a time, by
+    following the nesting of div tags rather than building a tree. Once `wanted` of them have been
+    closed it is `done`, and `end` is the offset just past the last one, so the page up to there
+    holds every div counted.
+    """
+
+    def __init__(self, class_name, wanted):
+        self.class_parts = class_name.split()
+        self.wanted = wanted
+        self.reset()
+
+    def reset(self):
+        """
+        Start again from the beginning of a page, as when a request is retried.
+        """
+        self.count = 0
+        self.end = 0
+        self._depth = 0
+        self._pending = ""
+        self._offset = 0
+
+    @property
+    def done(self):
+        return self.count >= self.wanted
+
+    def feed(self, chunk):
+        text = self._pending + chunk
+        # A tag cut off at the end of the chunk is kept for the next one
+        scan_end = len(text)
+        last_open = text.rfind("<")
+        if last_open != -1 and text.find(">", last_open) == -1:
+            scan_end = last_open
+        for tag in DIV_TAG_REGEX.finditer(text, 0, scan_end):
+            if self.done:
+                break
+            if tag.group(1):
+                if self._depth > 0:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self.count += 1
+                        self.end = self._offset + tag.end()
+            elif self._depth > 0:
+                self._depth += 1
+            elif self._has_class(tag.group(2)):
+                self._depth = 1
+        self._pending = text[scan_end:]
+        self._offset += scan_end
+
+    def _has_class(self, attributes):
+        class_match = CLASS_ATTRIBUTE_REGEX.search(attributes)
+        if class_match is None:
+            return False
+        tag_classes = class_match.group(1).split()
+        return all(part in tag_classes for part in self.class_parts)
+
+
+def make_soup(raw_html, wanted):
+    """
+    Parse only the top level elements of `raw_html` that `wanted(name, attrs)` accepts, along with
+    everything inside them. Nothing else on the page is turned into a tree.
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+    return BeautifulSoup(raw_html, get_parser(), parse_only=SoupStrainer(wanted))
+
+
+def get_parser():
+    """
+    The parser backend Beautiful Soup is to use: lxml if it is available, or Python's own.
+    """
+    global _parser
+    if _parser is None:
+        try:
+            import lxml
+            _parser = 'lxml'
+        except ImportError:
+            _parser = 'html.parser'
+    return _parser
+
+
+def has_class(attrs, class_names):
+    """
+    Check whether the raw attributes of a tag, as seen while parsing, give it any of `class_names`.
+    A class name containing spaces needs all of its parts to be present.
+    """
+    tag_classes = attrs.get('class') if attrs else None
+    if not tag_classes:
+        return False
+    if not isinstance(tag_classes, list):
+        tag_classes = tag_classes.split()
+    for class_name in class_names:
+        if all(part in tag_classes for part in class_name.split()):
+            return True
+    return False
+
+
+def get_match_entries(html):
+    """
+    Turn each match in the "Matches" div into a Match record, in card order.
+    """
+    from bs4 import Tag
+    matches_div = html.find("div", {"class": MATCHES_CLASS})
+    if matches_div is None:
+        return []
+    entries = []
+    for div in matches_div.contents:
+        if not isinstance(div, Tag):
+            continue
+        text = str(div.find("div", {"class": "MatchResults"}).text)
+        rating = None
+        matchguide_link = None
+        recommended_line = div.find("div", {"class": "MatchRecommendedLine"})
+        if recommended_line is not None:
+            line_text = recommended_line.text
+            if line_text.startswith(MATCHGUIDE_RATING_PREFIX):
+                rating = line_text[len(MATCHGUIDE_RATING_PREFIX):line_text.index(' based on')]
+            link = recommended_line.find('a', href=True)
+            if link is not None:
+                matchguide_link = link.attrs['href']
+        entries.append(Match(text, rating, matchguide_link))
+    return entries
+
+
+def get_dict_from_table(information_box_table):
+    """
+    From an individual InformationBoxTable div, essentially treat it as a table:
+        - find every InformationBoxTitle div, and use the text as a key.
+        - find every InformationBoxContents div, and use the content as a value.
+
+    :return: dictionary of the event information box
+    """
+    keys = [str(span.get_text().rstrip(':').strip()) for span in information_box_table.find_all(
+        "div", {"class": "InformationBoxTitle"})]
+    values = [get_link_dict(span.contents[0]) for span in information_box_table.find_all(
+        "div", {"class": "InformationBoxContents"})]
+    dictionary = dict(zip(keys, values))
+    return dictionary
+
+
+def get_link_dict(box_content):
+    """
+    If the provided element is a link, return a dictionary containing the link's display 'text' and the 'link' itself.
+    Otherwise return a dictionary with 'text' being the string of the element
+    """
+    from bs4 import Tag
+    if box_content.name == 'a':
+        return {'text': str(box_content.string), 'link': str(box_content.attrs['href'])}
+    elif isinstance(box_content, Tag):
+        return {'text': box_content.text}
+    else:
+        return {'text': str(box_content)}
+
+
+def parse_search_result_row(table_row):
+    """
+    Parse a table row from a search page and extract the relevant parts to a dict
+
+    :param table_row: a "tr" element extracted from a table
+    :return: dictionary containing event id "id", event name "name", and year of event "year"
+    """
+    table_cells = table_row.find_all('td')
+    dd, mm, yyyy = table_cells[1].text.split(".")
+    # The event column can have an event link and a promotion image link, so we need to find the right one.
+    # As the image links contain no text, we can do this by checking that link.string isn't None
+    links = table_cells[2].find_all('a', href=True)
+    event_link = None
+    for link in links:
+        if link.string is not None:
+            event_link = link
+
+    if event_link is not None:
+        event_id = dict(urlparse.parse_qsl(urlparse.urlparse(event_link.attrs['href']).query))['nr']
+        return {
+            'id': str(event_id),
+            'name': str(event_link.string),
+            'year': str(yyyy),
+            'month': str(mm),
+            'day': str(dd)
+        }
+    return None
+
+
+def parse_search_result_counts(html):
+    """
+    Figure out how many results our search got by parsing the text above the results table.
+        - find the div containing this string, class TableHeaderOff id TableHeader
+        - check if this matches the string saying no items were found, if so return 0 results
+        - otherwise chunk up the string and return how many results were found, and which are
+          being displayed
+
+    :param html: the search page html, as parsed through Beautiful Soup
+    :return: dictionary containing:
+                 - start: the start position of the results returned
+                 - end: the end position of the results returned
+                 - total: the total number of results the search found
+    """
+    # Constants
+    NO_RESULTS_STRING = "No items were found that match the search parameters."
+    RESULTS_STRING_1 = "Displaying items "
+    RESULTS_STRING_2 = " to "
+    RESULTS_STRING_3 = " of total "
+    RESULTS_STRING_4 = " items that match the search parameters."
+
+    search_results_div = html.find('div', {"class": SEARCH_HEADER_CLASS, "id": "TableHeader"})
+    if search_results_div.string == NO_RESULTS_STRING:
+        search_results = {
+            'start': 0,
+            'end': 0,
+            'total': 0
+        }
+    elif search_results_div.string.startswith(RESULTS_STRING_1):
+        start, split_1 = search_results_div.string.split(RESULTS_STRING_1,1)[1].split(RESULTS_STRING_2, 1)
+        end, split_2 = split_1.split(RESULTS_STRING_3,1)
+        total = split_2.split(RESULTS_STRING_4)[0]
+        search_results = {
+            'start': int(start),
+            'end': int(end),
+            'total': int(total)
+        }
+    Log.Debug("[extraction] [parse_search_result_counts] Search returned: " + str(search_results))
+    return search_results
@@ -0,0 +1,76 @@
+"""
+Fingerprints of the metadata last written to each item, so that refreshing an item only
+rewrites the sections of its metadata that have changed.
+Plex keeps an item's metadata between refreshes, so clearing and rebuilding its collections,
+reviews and roles every time is a lot of database writes for nothing when CAGEMATCH hasn't
+changed. Each section is hashed as it would be written, which covers both the extracted data and
+the preferences that shape it, and the hashes are kept in one small data item per item.
+"""
+import hashlib
+import json
+
+from instrumentation import metrics
+
+KEY_PREFIX = "fingerprint-"
+
+
+class Fingerprint(object):
+    """
+    The section hashes for one item. Call `changed` with each section's value before writing it,
+    and `save` once the item has been updated.
+    With `force`, or when the item's title isn't the one we last gave it (so Plex has reset its
+    metadata since, or never received it), every section is written again.
+    """
+
+    def __init__(self, item_id, current_title=None, force=False):
+        # Plex item ids for matches have a colon, which doesn't belong in a file name
+        self.key = KEY_PREFIX + str(item_id).replace(":", "-")
+        self._stored = {} if force or current_title is None else self._load()
+        if self._stored.get('title') != to_unicode(current_title):
+            self._stored = {}
+        self._sections = {}
+        self.title = None
+
+    def changed(self, section, value):
+        """
+        Record the JSON serialisable value `section` is about to be given.
+
+        :return: True if it's different to what was written last time, so it needs writing
+        """
+        digest = hashlib.sha1(json.dumps(value, sort_keys=True)).hexdigest()
+        self._sections[section] = digest
+        if self._stored.get('sections', {}).get(section) == digest:
+            metrics.increment('update.sections_skipped')
+            return False
+        metrics.increment('update.sections_written')
+        return True
+
+    def save(self):
+        """
+        Store the hashes of everything recorded with `changed`, along with the title that was set.
+        Nothing is stored if no title was set, as the next update couldn't tell the item apart from a new one.
+        """
+        if self.title is None:
+            return
+        fingerprint = {'title': to_unicode(self.title), 'sections': self._sections}
+        if fingerprint == self._stored:
+            return
+        try:
+            Data.Save(self.key, json.dumps(fingerprint, separators=(',', ':')))
+        except Exception as exc:
+            Log.Error("[fingerprints] Could not save " + self.key + ": " + str(exc))
+
+    def _load(self):
+        try:
+            raw_fingerprint = Data.Load(self.key)
+            if raw_fingerprint is not None:
+                return json.loads(raw_fingerprint)
+        except Exception as exc:
+            Log.Error("[fingerprints] Could not load " + self.key + ": " + str(exc))
+        return {}
+
+
+def to_unicode(text):
+    if isinstance(text, str):
+        return text.decode('utf-8', 'ignore')
+    return text
@@ -0,0 +1,429 @@
+"""
+A persistent cache of the pages we fetch from CAGEMATCH.
+Bodies are stored as individual data items in the bundle's data directory, with a JSON index
+holding the URL, size, expiry and last access time of each one so the cache can be kept under
+a size limit by evicting the least recently used pages. The index also keeps the ETag and
+Last-Modified validators CAGEMATCH sent, so expired pages can be revalidated rather than
+downloaded again.
+"""
+import hashlib
+import heapq
+import json
+import re
+import threading
+import time
+import urlparse
+
+from datetime import date
+from utils import get_int_pref
+
+# ################### Storage keys ###################
+INDEX_KEY = "http-cache-index"
+BODY_KEY_PREFIX = "http-cache-"
+
+# ################### URL classes ###################
+SEARCH_CLASS = "search"
+EVENT_CLASS = "event"
+CARD_CLASS = "card"
+REVIEWS_CLASS = "reviews"
+PROMOTION_CLASS = "promotion"
+MATCHGUIDE_CLASS = "matchguide"
+OTHER_CLASS = "other"
+
+# ################### Time to live, in seconds ###################
+DAY = 24 * 60 * 60
+SEARCH_TTL = DAY
+REVIEWS_TTL = DAY
+RECENT_EVENT_TTL = DAY
+PAST_EVENT_TTL = 90 * DAY
+PROMOTION_TTL = 7 * DAY
+MATCHGUIDE_TTL = 7 * DAY
+DEFAULT_TTL = DAY
+# Events older than this are unlikely to have their card or results edited again
+PAST_EVENT_AGE_DAYS = 30
+
+DEFAULT_CACHE_SIZE_MB = 250
+# Access times are only written back to disk every so often, rather than on every hit. Stores and
+# removals are saved straight away, so no body is ever left on disk without an index entry
+INDEX_SAVE_INTERVAL = 25
+INDEX_SAVE_SECONDS = 30
+# Once over its size limit, the cache is trimmed to this fraction of it, so that a full cache
+# isn't sorted for eviction on every store
+EVICTION_TARGET = 0.9
+STATS_LOG_INTERVAL = 100
+
+EVENT_DATE_REGEX = re.compile(r'InformationBoxTitle">Date:</div><div class="InformationBoxContents">(?:<a[^>]*>)?(\d{2})\.(\d{2})\.(\d{4})')
+
+
+def classify_url(url):
+    """
+    Work out what kind of CAGEMATCH page a URL points at, which decides how long it is cached for.
+    """
+    query = dict(urlparse.parse_qsl(urlparse.urlparse(url).query))
+    page_id = query.get('id')
+    if page_id == '1':
+        if query.get('view') == 'search':
+            return SEARCH_CLASS
+        elif query.get('page') == '99':
+            return REVIEWS_CLASS
+        elif query.get('page') == '2':
+            return CARD_CLASS
+        elif 'nr' in query:
+            return EVENT_CLASS
+    elif page_id == '8':
+        return PROMOTION_CLASS
+    elif page_id == '111':
+        if query.get('page') == '99':
+            return REVIEWS_CLASS
+        return MATCHGUIDE_CLASS
+    return OTHER_CLASS
+
+
+def get_ttl(url_class, body):
+    """
+    Decide how long a page should be cached for. Event and card pages for events that happened a
+    while ago are kept for a long time, while anything that changes often (searches, reviews,
+    upcoming events) is only kept for a day.
+    """
+    if url_class in (EVENT_CLASS, CARD_CLASS):
+        return get_event_ttl(get_event_date(body))
+    elif url_class == SEARCH_CLASS:
+        return SEARCH_TTL
+    elif url_class == REVIEWS_CLASS:
+        return REVIEWS_TTL
+    elif url_class == PROMOTION_CLASS:
+        return PROMOTION_TTL
+    elif url_class == MATCHGUIDE_CLASS:
+        return MATCHGUIDE_TTL
+    return DEFAULT_TTL
+
+
+def get_event_ttl(event_date):
+    """
+    How long anything about an event on `event_date` (None if unknown) can be kept for.
+    """
+    if event_date is not None and (date.today() - event_date).days > PAST_EVENT_AGE_DAYS:
+        return PAST_EVENT_TTL
+    return RECENT_EVENT_TTL
+
+
+def get_event_date(body):
+    """
+    Pull the event date out of the information box of a raw event page, without parsing the page.
+    """
+    date_match = EVENT_DATE_REGEX.search(body)
+    if date_match is None:
+        return None
+    dd, mm, yyyy = date_match.groups()
+    try:
+        return date(int(yyyy), int(mm), int(dd))
+    except ValueError:
+        return None
+
+
+def get_content_hash(body):
+    """
+    A hash of a page's bytes, so that what was built from a page can be kept when the same bytes
+    are fetched again, whether or not the site sent validators.
+    """
+    return hashlib.sha1(body).hexdigest()
+
+
+def get_body_key(url):
+    return BODY_KEY_PREFIX + hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def get_max_bytes():
+    return get_int_pref("cacheSizeMB", DEFAULT_CACHE_SIZE_MB) * 1024 * 1024
+
+
+class ResponseCache(object):
+    """
+    URL keyed, size bounded, least recently used cache of page bodies.
+    The index is loaded lazily on first use and is shared by every agent worker thread.
+    Setting the size limit to 0 turns the cache off, and empties it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = None
+        self._stats = None
+        self._total_bytes = 0
+        # (expires, url) for every entry, soonest first, so that pages coming due can be found without going through
+        # the whole index. Items left behind when an entry is replaced or removed are skipped as they come up
+        self._expiry_heap = []
+        self._unsaved_changes = 0
+        self._last_save = time.time()
+        self._lookups = 0
+
+    def get(self, url):
+        """
+        Return the cached body for `url`, or None if it isn't cached or has expired.
+        """
+        if get_max_bytes() <= 0:
+            self.clear()
+            return None
+        now = time.time()
+        with self._lock:
+            self._load()
+            self._lookups += 1
+            entry = self._entries.get(url)
+            if entry is None:
+                self._stats['misses'] += 1
+                entry_state = 'miss'
+            elif entry['expires'] < now:
+                self._stats['expired'] += 1
+                entry['accessed'] = now
+                entry_state = 'expired'
+            else:
+                self._stats['hits'] += 1
+                entry['accessed'] = now
+                entry_state = 'hit'
+                self._changed()
+            self._log_stats()
+
+        Log.Debug("[http_cache] Cache " + entry_state + " for " + url)
+        if entry_state != 'hit':
+            return None
+        body = Data.Load(entry['key'])
+        if body is None:
+            # The body has gone missing from under us, so forget about it
+            with self._lock:
+                self._remove(url)
+                self._save()
+            return None
+        return body
+
+    def get_stale(self, url, max_staleness):
+        """
+        Return the cached body for `url` if it expired less than `max_staleness` seconds ago, for
+        serving while it is revalidated. Returns None otherwise. A page is never served for longer
+        past expiring than it was cached for, so pages that change often, like searches and
+        comments, are only served stale briefly.
+        """
+        if get_max_bytes() <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            self._load()
+            entry = self._entries.get(url)
+            if entry is None or entry['expires'] < now - min(max_staleness, entry['expires'] - entry['stored']):
+                return None
+            entry['accessed'] = now
+            self._stats['stale_hits'] += 1
+        body = Data.Load(entry['key'])
+        if body is not None:
+            Log.Debug("[http_cache] Serving stale " + url)
+        return body
+
+    def pop_entries_expiring(self, before):
+        """
+        Return (url, entry) pairs, with copies of the index entries, for the cached pages that
+        expire before the time `before` and haven't been returned since they were stored or
+        revalidated. Each page is only returned once per expiry, so the caller should keep any it
+        means to come back to.
+        """
+        if get_max_bytes() <= 0:
+            return []
+        due = []
+        with self._lock:
+            self._load()
+            while self._expiry_heap and self._expiry_heap[0][0] < before:
+                expires, url = heapq.heappop(self._expiry_heap)
+                entry = self._entries.get(url)
+                if entry is not None and entry['expires'] == expires:
+                    due.append((url, dict(entry)))
+        return due
+
+    def get_expires(self, url):
+        """
+        Return when the cached page for `url` expires, or None if it isn't cached.
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(url)
+            return entry['expires'] if entry is not None else None
+
+    def get_revalidation_headers(self, url):
+        """
+        Return the conditional request headers for checking whether the cached page for `url` has
+        changed, or None if we don't have it or it came without validators.
+        """
+        if get_max_bytes() <= 0:
+            return None
+        with self._lock:
+            self._load()
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            headers = {}
+            if entry.get('etag') is not None:
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified') is not None:
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers or None
+
+    def refresh(self, url):
+        """
+        Start a new expiry period for the cached page for `url`, as the site has told us it hasn't
+        changed, and return its body. Returns None if the body is no longer there.
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(url)
+        if entry is None:
+            return None
+        body = Data.Load(entry['key'])
+        now = time.time()
+        with self._lock:
+            if body is None:
+                self._remove(url)
+                self._save()
+                return None
+            entry['stored'] = now
+            entry['expires'] = now + get_ttl(entry['class'], body)
+            self._push_expiry(url, entry)
+            self._stats['revalidated'] += 1
+            self._save()
+        Log.Debug("[http_cache] Revalidated " + url)
+        return body
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """
+        Store a freshly fetched body for `url`, along with its validators if it came with any,
+        evicting old entries if the cache is over its size limit.
+        """
+        max_bytes = get_max_bytes()
+        if max_bytes <= 0 or len(body) > max_bytes:
+            return
+        url_class = classify_url(url)
+        now = time.time()
+        key = get_body_key(url)
+        Data.Save(key, body)
+        with self._lock:
+            self._load()
+            # A page refreshed in the background hasn't been used, so keep when it last was
+            previous = self._entries.get(url)
+            accessed = previous['accessed'] if previous is not None else now
+            if previous is not None:
+                self._total_bytes -= previous['size']
+            self._total_bytes += len(body)
+            self._entries[url] = {
+                'key': key,
+                'class': url_class,
+                'size': len(body),
+                'stored': now,
+                'expires': now + get_ttl(url_class, body),
+                'accessed': accessed,
+                'etag': etag,
+                'last_modified': last_modified
+            }
+            self._push_expiry(url, self._entries[url])
+            self._stats['stores'] += 1
+            evicted = self._evict(max_bytes)
+            self._save()
+        for evicted_key in evicted:
+            Data.Remove(evicted_key)
+
+    def clear(self):
+        """
+        Remove every cached page, and the index.
+        """
+        with self._lock:
+            self._load()
+            if not self._entries:
+                return
+            keys = [entry['key'] for entry in self._entries.itervalues()]
+            self._entries = {}
+            self._total_bytes = 0
+            self._expiry_heap = []
+            self._save()
+        for key in keys:
+            Data.Remove(key)
+        Log.Info("[http_cache] Cleared " + str(len(keys)) + " cached pages")
+
+    def stats(self):
+        """
+        Return a copy of the hit/miss counters, along with the current size of the cache.
+        """
+        with self._lock:
+            self._load()
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._total_bytes
+            return stats
+
+    def _evict(self, max_bytes):
+        """
+        Once the cache is over `max_bytes`, drop the least recently used entries until it is down
+        to EVICTION_TARGET of it. Must be called with the lock held. Returns the data keys that
+        should be removed.
+        """
+        evicted = []
+        if self._total_bytes <= max_bytes:
+            return evicted
+        target = max_bytes * EVICTION_TARGET
+        for url, entry in sorted(self._entries.items(), key=lambda item: item[1]['accessed']):
+            if self._total_bytes <= target:
+                break
+            self._remove(url)
+            evicted.append(entry['key'])
+            self._stats['evictions'] += 1
+        return evicted
+
+    def _remove(self, url):
+        """
+        Drop the entry for `url` from the index. Must be called with the lock held.
+        """
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._total_bytes -= entry['size']
+
+    def _push_expiry(self, url, entry):
+        """
+        Add an entry's new expiry time to the heap, rebuilding it once it is mostly items that have been left behind.
+        Must be called with the lock held.
+        """
+        heapq.heappush(self._expiry_heap, (entry['expires'], url))
+        if len(self._expiry_heap) > 2 * len(self._entries) + 100:
+            self._build_expiry_heap()
+
+    def _build_expiry_heap(self):
+        self._expiry_heap = [(entry['expires'], url) for url, entry in self._entries.iteritems()]
+        heapq.heapify(self._expiry_heap)
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stale_hits': 0, 'revalidated': 0, 'stores': 0, 'evictions': 0}
+        try:
+            raw_index = Data.Load(INDEX_KEY)
+            if raw_index is not None:
+                index = json.loads(raw_index)
+                self._entries = index.get('entries', {})
+                self._stats.update(index.get('stats', {}))
+        except Exception as exc:
+            Log.Error("[http_cache] Could not load cache index, starting afresh: " + str(exc))
+        self._total_bytes = sum(entry['size'] for entry in self._entries.itervalues())
+        self._build_expiry_heap()
+
+    def _changed(self):
+        """
+        Note a change to access times, saving the index once enough have built up. Must be called with the lock held.
+        """
+        self._unsaved_changes += 1
+        if self._unsaved_changes >= INDEX_SAVE_INTERVAL or time.time() - self._last_save > INDEX_SAVE_SECONDS:
+            self._save()
+
+    def _save(self):
+        self._unsaved_changes = 0
+        self._last_save = time.time()
+        Data.Save(INDEX_KEY, json.dumps({'entries': self._entries, 'stats': self._stats}))
+
+    def _log_stats(self):
+        if self._lookups % STATS_LOG_INTERVAL == 0:
+            Log.Info("[http_cache] Cache statistics: " + str(self._stats))
+
+
+response_cache = ResponseCache()
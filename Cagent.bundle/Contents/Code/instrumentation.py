@@ -0,0 +1,143 @@
+"""
+Counters and latency histograms for the work the agent does: requests, parsing, scoring and
+metadata updates. Every few minutes a summary is written to the log as a single JSON line, and
+to a data item in the bundle's data directory, so slow refreshes can be broken down afterwards.
+"""
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import wraps
+
+SUMMARY_KEY = "metrics.json"
+SUMMARY_INTERVAL = 5 * 60
+# Upper bounds of the histogram buckets, in milliseconds. Anything slower goes in a final overflow bucket.
+BUCKET_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram(object):
+    """
+    Count, total, extremes and bucketed distribution of a series of values.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for index, bound in enumerate(BUCKET_BOUNDS_MS):
+            if value <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, fraction):
+        """
+        Estimate a percentile as the upper bound of the bucket it falls in.
+        """
+        if self.count == 0:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return BUCKET_BOUNDS_MS[index] if index < len(BUCKET_BOUNDS_MS) else self.max
+        return self.max
+
+    def to_json(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 2) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'buckets': dict(zip([str(bound) for bound in BUCKET_BOUNDS_MS] + ['inf'], self.buckets))
+        }
+
+
+class Metrics(object):
+    """
+    Named counters and histograms shared by every agent worker thread.
+    Histogram names ending in "_ms" hold durations, others hold sizes or other values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._started = time.time()
+            self._last_summary = time.time()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value)
+            due = time.time() - self._last_summary > SUMMARY_INTERVAL
+            if due:
+                self._last_summary = time.time()
+        if due:
+            self.write_summary()
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time the body of a `with` block into the histogram `name`, in milliseconds.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.time() - start) * 1000)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'since': self._started,
+                'until': time.time(),
+                'counters': dict(self._counters),
+                'histograms': dict((name, histogram.to_json()) for name, histogram in self._histograms.items())
+            }
+
+    def write_summary(self):
+        summary_json = json.dumps(self.summary(), sort_keys=True)
+        Log.Info("[instrumentation] Summary: " + summary_json)
+        try:
+            Data.Save(SUMMARY_KEY, summary_json)
+        except Exception as exc:
+            Log.Error("[instrumentation] Could not save summary: " + str(exc))
+
+
+def timed(name):
+    """
+    Decorator that times every call of the decorated function into the histogram `name`.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+metrics = Metrics()
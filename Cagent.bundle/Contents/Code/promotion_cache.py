@@ -0,0 +1,159 @@
+"""
+Persistent cache of promotion abbreviations, used to remove promotion slugs from event names.
+Each promotion page is only fetched and parsed the first time one of its events is updated, and
+again once the cached abbreviations are a month old.
+"""
+import json
+import re
+import threading
+import time
+
+from extraction import parse_promotion_page
+from records import Promotion, to_bytes
+from url_loading import simple_get
+
+STORE_KEY = "promotion-cache"
+PROMOTION_TTL = 30 * 24 * 60 * 60
+
+
+class PromotionSlugs(object):
+    """
+    The current abbreviation and all known abbreviations of a promotion, along with a precompiled
+    matcher that tells us whether an event name starts with any of them.
+    """
+
+    def __init__(self, current_slug, slugs, fetched):
+        self.current_slug = current_slug
+        self.slugs = slugs
+        self.fetched = fetched
+        # Longest first, so that e.g. "NJPW" is tried before "NJ"
+        self._ordered_slugs = sorted([slug for slug in slugs if slug != ''], key=len, reverse=True)
+        self._prefix_regex = None
+        if self._ordered_slugs:
+            self._prefix_regex = re.compile('|'.join(re.escape(slug) for slug in self._ordered_slugs))
+
+    def remove_from(self, event_name):
+        """
+        Strip the promotion's abbreviations from the start of `event_name`, current abbreviation first.
+        Each abbreviation is only removed once, along with a leading slash left by co-promoted events.
+        """
+        if self.current_slug != '' and event_name.startswith(self.current_slug):
+            event_name = strip_prefix(event_name, self.current_slug)
+
+        if self._prefix_regex is None or not self._prefix_regex.match(event_name):
+            return event_name
+        for slug in self._ordered_slugs:
+            if event_name.startswith(slug):
+                event_name = strip_prefix(event_name, slug)
+        return event_name
+
+    def is_stale(self):
+        return time.time() - self.fetched > PROMOTION_TTL
+
+    def to_json(self):
+        return {'current': self.current_slug, 'slugs': self.slugs, 'fetched': self.fetched}
+
+    @classmethod
+    def from_json(cls, value):
+        # JSON gives back unicode, but the event names the slugs are removed from are byte strings
+        return cls(to_bytes(value['current']), to_bytes(value['slugs']), value['fetched'])
+
+    @classmethod
+    def from_promotion(cls, promotion):
+        return cls(promotion.current_abbreviation, promotion.abbreviations, time.time())
+
+
+def strip_prefix(event_name, slug):
+    event_name = event_name.replace(slug, "", 1) # Only remove first instance, which we already know is at start
+    if event_name.startswith('/'): # Trim leading slash if we've removed slug for co-promoted events
+        event_name = event_name.replace('/', "", 1)
+    return event_name
+
+
+class PromotionCache(object):
+    """
+    Promotion link to PromotionSlugs, kept in memory and saved to the bundle's data directory.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._promotions = None
+
+    def get(self, promotion_link, promotion_url):
+        """
+        Return the PromotionSlugs for the promotion at `promotion_link`, fetching `promotion_url`
+        if we haven't seen it before or our copy is stale. If the fetch fails, a stale copy is
+        better than nothing, so it is still returned.
+
+        :return: PromotionSlugs, or None if the promotion couldn't be loaded
+        """
+        with self._lock:
+            self._load()
+            slugs = self._promotions.get(promotion_link)
+        if slugs is not None and not slugs.is_stale():
+            return slugs
+
+        Log.Debug("[promotion_cache] Loading promotion " + promotion_link)
+        raw_promotion_html = simple_get(promotion_url)
+        if raw_promotion_html is None:
+            return slugs
+        slugs = PromotionSlugs.from_promotion(Promotion.from_info(parse_promotion_page(raw_promotion_html).info))
+        with self._lock:
+            self._promotions[promotion_link] = slugs
+            self._save()
+        return slugs
+
+    def peek(self, promotion_link):
+        """
+        Return the PromotionSlugs we already have for `promotion_link`, however old, without fetching anything.
+
+        :return: PromotionSlugs, or None if we haven't seen the promotion
+        """
+        with self._lock:
+            self._load()
+            return self._promotions.get(promotion_link)
+
+    def export(self):
+        """
+        :return: dictionary of promotion link to the JSON form of its PromotionSlugs
+        """
+        with self._lock:
+            self._load()
+            return dict((link, slugs.to_json()) for link, slugs in self._promotions.items())
+
+    def merge(self, promotions):
+        """
+        Merge `promotions`, as given by `export` from another copy of the cache, keeping whichever
+        copy of each promotion was fetched last.
+
+        :return: the number of promotions taken from `promotions`
+        """
+        taken = 0
+        with self._lock:
+            self._load()
+            for link, value in promotions.items():
+                current = self._promotions.get(str(link))
+                if current is None or value['fetched'] > current.fetched:
+                    self._promotions[str(link)] = PromotionSlugs.from_json(value)
+                    taken += 1
+            if taken:
+                self._save()
+        return taken
+
+    def _load(self):
+        if self._promotions is not None:
+            return
+        self._promotions = {}
+        try:
+            raw_store = Data.Load(STORE_KEY)
+            if raw_store is not None:
+                for link, value in json.loads(raw_store).items():
+                    self._promotions[str(link)] = PromotionSlugs.from_json(value)
+        except Exception as exc:
+            Log.Error("[promotion_cache] Could not load promotion cache, starting afresh: " + str(exc))
+
+    def _save(self):
+        Data.Save(STORE_KEY, json.dumps(dict((link, slugs.to_json()) for link, slugs in self._promotions.items())))
+
+
+promotion_cache = PromotionCache()
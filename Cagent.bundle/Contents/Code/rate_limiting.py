@@ -0,0 +1,118 @@
+"""
+Process wide throttling for requests to CAGEMATCH.
+Every request takes a token from a shared bucket, which refills at a rate that starts at the
+"requestsPerSecond" preference and backs off when the site rejects requests or slows down.
+"""
+import random
+import threading
+import time
+
+from utils import get_float_pref
+
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+MIN_REQUESTS_PER_SECOND = 0.2
+
+# Additive increase after each healthy response, multiplicative decrease when throttled
+RATE_INCREASE_STEP = 0.1
+THROTTLED_RATE_FACTOR = 0.5
+SLOW_RATE_FACTOR = 0.9
+
+# Response times are tracked as an exponentially weighted moving average
+LATENCY_SMOOTHING = 0.2
+SLOW_LATENCY_SECONDS = 3.0
+
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+
+def get_backoff_delay(attempt, retry_after=None):
+    """
+    How long to wait before retry number `attempt` (starting from 0). The delay doubles with each
+    attempt, and half of it is randomised so that workers that failed together don't retry together.
+    If the server sent a Retry-After header in seconds, wait at least that long.
+
+    :return: delay in seconds
+    """
+    delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2 ** attempt))
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    if retry_after is not None:
+        try:
+            delay = max(delay, min(MAX_BACKOFF_SECONDS, float(retry_after)))
+        except ValueError:
+            # Retry-After can also be an HTTP date, which we don't bother with
+            pass
+    return delay
+
+
+class AdaptiveRateLimiter(object):
+    """
+    Token bucket rate limiter, shared by every agent worker thread.
+    The bucket holds up to one second's worth of tokens at the configured ceiling, so short
+    bursts are allowed but the long term rate never exceeds the preference.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rate = None
+        self._tokens = 1.0
+        self._last_refill = time.time()
+        self._latency = None
+
+    def acquire(self):
+        """
+        Block until a request is allowed to go out.
+        """
+        while True:
+            with self._lock:
+                ceiling = self._get_ceiling()
+                now = time.time()
+                self._tokens = min(max(1.0, ceiling), self._tokens + (now - self._last_refill) * self._rate)
+                self._last_refill = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def record_success(self, latency):
+        """
+        A request got a healthy response in `latency` seconds. Speed back up towards the ceiling,
+        unless responses are getting slow, in which case ease off a little.
+        """
+        with self._lock:
+            ceiling = self._get_ceiling()
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency = LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self._latency
+            if self._latency > SLOW_LATENCY_SECONDS:
+                self._set_rate(self._rate * SLOW_RATE_FACTOR)
+            else:
+                self._set_rate(min(ceiling, self._rate + RATE_INCREASE_STEP))
+
+    def record_throttled(self):
+        """
+        A request was rejected or timed out, so halve the rate.
+        """
+        with self._lock:
+            self._get_ceiling()
+            self._set_rate(self._rate * THROTTLED_RATE_FACTOR)
+
+    def _get_ceiling(self):
+        """
+        Read the ceiling from the preferences, starting at it the first time round, and making
+        sure the current rate respects it if it has been lowered since. Must be called with the lock held.
+        """
+        ceiling = max(MIN_REQUESTS_PER_SECOND, get_float_pref("requestsPerSecond", DEFAULT_REQUESTS_PER_SECOND))
+        if self._rate is None or self._rate > ceiling:
+            self._rate = ceiling
+        return ceiling
+
+    def _set_rate(self, rate):
+        rate = max(MIN_REQUESTS_PER_SECOND, rate)
+        if abs(rate - self._rate) > 0.01:
+            Log.Debug("[rate_limiting] Request rate now " + "%.2f" % rate + " per second")
+        self._rate = rate
+
+
+rate_limiter = AdaptiveRateLimiter()
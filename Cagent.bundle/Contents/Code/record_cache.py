@@ -0,0 +1,151 @@
+"""
+A persistent cache of the records we extract from CAGEMATCH pages, so that updating an item we
+have seen before needs neither the pages nor the parser.
+Entries are keyed by event id, or event and match number, and hold several separately expiring
+parts: the event itself, its reviews, a match's matchguide rating and so on. Each entry is a
+small JSON data item in the bundle's data directory. Entries written by a different version of
+the extraction code are ignored, so a parser change never serves stale records.
+A part can also note the content hash of the page it was built from, so that once it has
+expired, fetching the same page again gives back the part rather than parsing the page again.
+"""
+import json
+import threading
+import time
+
+from datetime import datetime
+from extraction import PARSER_VERSION
+from http_cache import get_event_ttl
+from instrumentation import metrics
+
+KEY_PREFIX = "record-cache-"
+
+
+def get_event_key(event_id):
+    return "event-" + str(event_id)
+
+
+def get_match_key(event_id, match_id):
+    return "event-" + str(event_id) + "-" + str(match_id)
+
+
+def get_event_record_ttl(event):
+    """
+    How long an Event record can be kept for, which like its pages depends on how long ago the event was.
+    """
+    try:
+        return get_event_ttl(datetime.strptime(str(event.date), "%d.%m.%Y").date())
+    except ValueError:
+        return get_event_ttl(None)
+
+
+class RecordCache(object):
+    """
+    Parts of records, stored by entry key and part name along with when each part expires.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def get(self, key, part, record_class=None, many=False):
+        """
+        Return the part `part` of the entry `key`, or None if it isn't cached or has expired.
+        With a `record_class`, the part is loaded as one of those records, or with `many` a list of them.
+        """
+        with self._lock:
+            stored = self._load(key).get(part)
+        if stored is None or stored['expires'] < time.time():
+            metrics.increment('records.misses')
+            return None
+        metrics.increment('records.hits')
+        return from_json(stored['value'], record_class, many)
+
+    def get_unchanged(self, key, part, source, record_class=None, many=False):
+        """
+        Return the part `part` of the entry `key` even if it has expired, as long as it was built
+        from a page with the content hash `source`. Returns None otherwise.
+        """
+        with self._lock:
+            stored = self._load(key).get(part)
+        if stored is None or stored.get('source') != source:
+            return None
+        metrics.increment('records.unchanged')
+        return from_json(stored['value'], record_class, many)
+
+    def put(self, key, parts, sources=None):
+        """
+        Store `parts`, a dictionary of part name to (value, seconds to keep it), in the entry `key`,
+        keeping any other parts already there. Values can be records, lists of records or plain JSON.
+        `sources` gives the content hashes of the pages parts were built from, by part name. A part
+        without one keeps its previous hash, as it was updated from the same page.
+        """
+        sources = sources or {}
+        now = time.time()
+        with self._lock:
+            entry = self._load(key)
+            for part, (value, ttl) in parts.items():
+                source = sources.get(part, entry.get(part, {}).get('source'))
+                entry[part] = {'value': to_json(value), 'expires': now + ttl, 'source': source}
+            self._save(key, entry)
+
+    def export(self, key):
+        """
+        The stored parts of the entry `key`, expired or not, as saved: a dictionary of part name
+        to a dictionary of its JSON 'value', 'expires' time and 'source' hash. None if there's no entry.
+        """
+        with self._lock:
+            return self._load(key) or None
+
+    def merge(self, key, parts):
+        """
+        Merge `parts`, as given by `export` from another copy of the cache, into the entry `key`.
+        Of the two copies of a part, the one that expires later is kept.
+
+        :return: the number of parts taken from `parts`
+        """
+        with self._lock:
+            entry = self._load(key)
+            taken = 0
+            for part, stored in parts.items():
+                current = entry.get(part)
+                if current is None or stored['expires'] > current['expires']:
+                    entry[part] = stored
+                    taken += 1
+            if taken:
+                self._save(key, entry)
+        return taken
+
+    def _save(self, key, entry):
+        try:
+            Data.Save(KEY_PREFIX + key, json.dumps({'version': PARSER_VERSION, 'parts': entry}, separators=(',', ':')))
+        except Exception as exc:
+            Log.Error("[record_cache] Could not save " + key + ": " + str(exc))
+
+    def _load(self, key):
+        try:
+            raw_entry = Data.Load(KEY_PREFIX + key)
+            if raw_entry is not None:
+                entry = json.loads(raw_entry)
+                if entry.get('version') == PARSER_VERSION:
+                    return entry['parts']
+        except Exception as exc:
+            Log.Error("[record_cache] Could not load " + key + ": " + str(exc))
+        return {}
+
+
+def from_json(value, record_class=None, many=False):
+    if record_class is None:
+        return value
+    if many:
+        return [record_class.from_json(item) for item in value]
+    return record_class.from_json(value)
+
+
+def to_json(value):
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    if hasattr(value, 'to_json'):
+        return value.to_json()
+    return value
+
+
+record_cache = RecordCache()
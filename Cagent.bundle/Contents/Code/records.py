@@ -0,0 +1,191 @@
+"""
+Typed records of what we know about events, matches, matchguide entries, promotions and reviews,
+built once from the parsed CAGEMATCH pages.
+Each record has a compact serialised form, a JSON list of its fields in slot order, so that
+caches can keep parsed records rather than raw HTML.
+"""
+import json
+
+# ################### Cagematch event info keys ###################
+DATE_KEY = "Date"
+NAME_KEY = "Name of the event"
+PROMOTION_KEY = "Promotion"
+TYPE_KEY = "Type"
+LOCATION_KEY = "Location"
+ARENA_KEY = "Arena"
+BROADCAST_TYPE_KEY = "Broadcast type" # Not always present
+BROADCAST_DATE_KEY = "Broadcast date" # Not always present
+NETWORK_KEY = "TV station/network" # Not always present
+COMMENTARY_KEY = "Commentary by" # Not always present
+
+# ################### Cagematch promotion keys ###################
+ABBREVIATIONS_KEY = "Abbreviations"
+CURR_ABBREVIATION_KEY = "Current abbreviation"
+
+
+class Record(object):
+    """
+    Base for the record classes. Fields holding lists of other records are named in `nested`.
+    JSON gives back every string as unicode, but the parsed pages give UTF-8 byte strings for most
+    fields, so those are encoded again when loading. Fields that were unicode to begin with are
+    named in `unicode_fields`.
+    """
+    __slots__ = ()
+    nested = {}
+    unicode_fields = ()
+
+    def to_json(self):
+        values = []
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if field in self.nested and value is not None:
+                value = [item.to_json() for item in value]
+            values.append(value)
+        return values
+
+    @classmethod
+    def from_json(cls, values):
+        fields = dict(zip(cls.__slots__, values))
+        for field, value in fields.items():
+            if field in cls.nested:
+                if value is not None:
+                    fields[field] = [cls.nested[field].from_json(item) for item in value]
+            elif field not in cls.unicode_fields:
+                fields[field] = to_bytes(value)
+        return cls(**fields)
+
+    def dumps(self):
+        return json.dumps(self.to_json(), separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, raw):
+        return cls.from_json(json.loads(raw))
+
+
+class Match(Record):
+    """
+    A single match from the "Matches" list of an event or card page.
+    """
+    __slots__ = ('text', 'rating', 'matchguide_link')
+
+    def __init__(self, text, rating=None, matchguide_link=None):
+        self.text = text
+        self.rating = rating
+        self.matchguide_link = matchguide_link
+
+
+class Review(Record):
+    """
+    A CAGEMATCH user's comment on an event or a match.
+    """
+    __slots__ = ('author', 'text')
+    unicode_fields = ('author', 'text')
+
+    def __init__(self, author, text):
+        self.author = author
+        self.text = text
+
+
+class Matchguide(Record):
+    """
+    What we use from a match's matchguide entry: the Wrestling Observer rating, if it has one.
+    """
+    __slots__ = ('won_rating',)
+
+    def __init__(self, won_rating):
+        self.won_rating = won_rating
+
+
+class Promotion(Record):
+    """
+    A promotion's current abbreviation and every abbreviation it has used.
+    """
+    __slots__ = ('current_abbreviation', 'abbreviations')
+
+    def __init__(self, current_abbreviation, abbreviations):
+        self.current_abbreviation = current_abbreviation
+        self.abbreviations = abbreviations
+
+    @classmethod
+    def from_info(cls, info):
+        return cls(
+            info.get(CURR_ABBREVIATION_KEY, {}).get('text', ''),
+            list(set(info.get(ABBREVIATIONS_KEY, {}).get('text', '').split(', '))))
+
+
+class Event(Record):
+    """
+    An event: the fields of its information box, its rating and workers, the results as matches,
+    and once its card page has been read, the card as advertised.
+    Fields the information box doesn't have are None.
+    """
+    __slots__ = ('id', 'name', 'date', 'broadcast_date', 'promotion', 'promotion_link', 'event_type', 'location',
+                 'arena', 'broadcast_type', 'network', 'commentary', 'rating', 'workers', 'matches', 'card')
+    nested = {'matches': Match}
+    unicode_fields = ('workers',)
+
+    def __init__(self, id, name, date, broadcast_date=None, promotion=None, promotion_link=None, event_type=None,
+                 location=None, arena=None, broadcast_type=None, network=None, commentary=None, rating=None,
+                 workers=None, matches=None, card=None):
+        self.id = id
+        self.name = name
+        self.date = date
+        self.broadcast_date = broadcast_date
+        self.promotion = promotion
+        self.promotion_link = promotion_link
+        self.event_type = event_type
+        self.location = location
+        self.arena = arena
+        self.broadcast_type = broadcast_type
+        self.network = network
+        self.commentary = commentary
+        self.rating = rating
+        self.workers = workers or []
+        self.matches = matches or []
+        self.card = card
+
+    @classmethod
+    def from_info(cls, event_id, info, matches, rating=None, workers=None):
+        """
+        Build an event from the information box dictionary of its event or card page.
+        """
+        def text(key):
+            return info[key]['text'] if key in info else None
+
+        return cls(
+            event_id, text(NAME_KEY), text(DATE_KEY),
+            broadcast_date=text(BROADCAST_DATE_KEY),
+            promotion=text(PROMOTION_KEY),
+            promotion_link=info.get(PROMOTION_KEY, {}).get('link'),
+            event_type=text(TYPE_KEY),
+            location=text(LOCATION_KEY),
+            arena=text(ARENA_KEY),
+            broadcast_type=text(BROADCAST_TYPE_KEY),
+            network=text(NETWORK_KEY),
+            commentary=text(COMMENTARY_KEY),
+            rating=rating,
+            workers=workers,
+            matches=matches)
+
+    @property
+    def results_text(self):
+        return join_lines(match.text for match in self.matches)
+
+    @property
+    def card_text(self):
+        return join_lines(self.card or [])
+
+
+def to_bytes(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [to_bytes(item) for item in value]
+    return value
+
+
+def join_lines(lines):
+    """
+    Put each line on its own line, after a leading line break, the way results and cards appear in summaries.
+    """
+    return "".join("\n" + line for line in lines)
@@ -0,0 +1,150 @@
+"""
+Keep the page cache fresh in the background, so searches and updates don't wait on the network.
+Once the plugin has started, an expired page is still served from the cache for a while and
+queued to be revalidated instead, and pages people are using that are about to expire are
+revalidated ahead of time. The cache hands over pages as they come due, so each round only looks
+at the few that are waiting rather than the whole cache. The work is only done while the agent is otherwise idle, and every
+request still goes through the shared rate limiter.
+"""
+import threading
+import time
+
+from collections import OrderedDict
+from http_cache import (response_cache, DAY, RECENT_EVENT_TTL,
+                        CARD_CLASS, EVENT_CLASS, MATCHGUIDE_CLASS, REVIEWS_CLASS)
+from instrumentation import metrics
+
+# How long after expiring a page can still be served while it is revalidated, at most. Pages
+# cached for less than this, like searches, comments and recent events, are only served stale
+# for as long as they were cached for
+MAX_STALE_SECONDS = 3 * DAY
+# Pages expiring this soon are revalidated ahead of time, if they have been used lately
+REFRESH_AHEAD_SECONDS = 60 * 60
+HOT_ACCESS_SECONDS = 2 * DAY
+# The agent counts as idle once it hasn't loaded a page for this long
+IDLE_SECONDS = 5
+POLL_SECONDS = 15
+PAGES_PER_ROUND = 10
+# A page that couldn't be revalidated isn't tried again for a while
+RETRY_SECONDS = 60 * 60
+
+
+def get_refresh_priority(entry):
+    """
+    Order cache entries for refreshing: the pages most likely to have changed, comments pages and
+    the pages of recent events, come first, then the rest of the event pages, then everything
+    else, and the most recently used first within each.
+    """
+    url_class = entry['class']
+    if url_class == REVIEWS_CLASS or (
+            url_class in (EVENT_CLASS, CARD_CLASS) and entry['expires'] - entry['stored'] <= RECENT_EVENT_TTL):
+        rank = 0
+    elif url_class in (EVENT_CLASS, CARD_CLASS, MATCHGUIDE_CLASS):
+        rank = 1
+    else:
+        rank = 2
+    return rank, -entry['accessed']
+
+
+class RefreshScheduler(object):
+    """
+    A daemon thread revalidating cached pages with `refresh_page(url)`, which it is given on `start`.
+    Pages served stale are refreshed first, then pages nearing expiry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._refresh_page = None
+        self._requested = OrderedDict()
+        # Pages in use that have come due, by URL, with copies of their cache entries
+        self._due = {}
+        self._retry_after = {}
+        self._last_activity = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and bool(Prefs["backgroundRefresh"])
+
+    def start(self, refresh_page):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._refresh_page = refresh_page
+            self._thread = threading.Thread(target=self._run, name="refresh-scheduler")
+            self._thread.daemon = True
+            self._thread.start()
+        Log.Info("[refresh_scheduler] Started background refreshing")
+
+    def note_activity(self):
+        """
+        Called whenever a search or update loads a page, to put off background work.
+        """
+        self._last_activity = time.time()
+
+    def request(self, url):
+        """
+        Queue `url`, whose cached page has just been served after expiring, to be revalidated.
+        """
+        with self._lock:
+            self._requested[url] = True
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            # Event.wait with a timeout polls every few milliseconds on Python 2, so sleep instead,
+            # and only for a short while when pages are waiting to be refreshed
+            time.sleep(IDLE_SECONDS if self._wake.is_set() else POLL_SECONDS)
+            if not self.running or time.time() - self._last_activity < IDLE_SECONDS:
+                continue
+            self._wake.clear()
+            try:
+                self._refresh_round()
+            except Exception as exc:
+                Log.Error("[refresh_scheduler] Background refresh failed: " + str(exc))
+
+    def _refresh_round(self):
+        for url in self._get_urls():
+            # Stop as soon as a search or update needs the connection again
+            if time.time() - self._last_activity < IDLE_SECONDS:
+                return
+            with self._lock:
+                self._requested.pop(url, None)
+            Log.Debug("[refresh_scheduler] Refreshing " + url)
+            if self._refresh_page(url):
+                metrics.increment('refresh.pages')
+                self._due.pop(url, None)
+            else:
+                metrics.increment('refresh.failures')
+                self._retry_after[url] = time.time() + RETRY_SECONDS
+
+    def _get_urls(self):
+        """
+        The next pages to refresh: those served stale, then the hottest of those about to expire.
+        """
+        now = time.time()
+        with self._lock:
+            urls = list(self._requested.keys())[:PAGES_PER_ROUND]
+        if len(urls) >= PAGES_PER_ROUND:
+            return urls
+        self._retry_after = dict((url, retry) for url, retry in self._retry_after.items() if retry > now)
+        for url, entry in response_cache.pop_entries_expiring(now + REFRESH_AHEAD_SECONDS):
+            self._due[url] = entry
+        # Pages that haven't been used lately, or keep failing until they aren't, are left to expire
+        self._due = dict((url, entry) for url, entry in self._due.items() if entry['accessed'] > now - HOT_ACCESS_SECONDS)
+        expiring = [(url, entry) for url, entry in self._due.items() if url not in self._retry_after and url not in urls]
+        expiring.sort(key=lambda item: get_refresh_priority(item[1]))
+        for url, _ in expiring:
+            if len(urls) >= PAGES_PER_ROUND:
+                break
+            expires = response_cache.get_expires(url)
+            if expires is None or expires >= now + REFRESH_AHEAD_SECONDS:
+                # Fetched again by a search or update since, or gone from the cache
+                del self._due[url]
+                continue
+            urls.append(url)
+        return urls
+
+
+refresh_scheduler = RefreshScheduler()
@@ -0,0 +1,175 @@
+"""
+Score search candidates against the name we're looking for, giving exactly the scores
+fuzzywuzzy's process.extract would, with less repeated work.
+Each candidate name is normalised and split into tokens once, and kept for later searches. When
+only the best few candidates are wanted, a match candidate that can't possibly score well enough
+to be one of them is skipped before the expensive string comparison.
+Scores must stay identical to fuzzywuzzy's, so that existing matches don't change.
+fuzzywuzzy itself is only imported once something needs scoring, which updates don't.
+"""
+import heapq
+import threading
+
+fuzz = None
+utils = None
+
+# Normalised candidate names are kept until there are this many, then forgotten all at once
+MAX_CACHED_NAMES = 20000
+# difflib starts ignoring common characters in strings this long, so they can match less than expected
+AUTOJUNK_LENGTH = 200
+
+
+class ProcessedName(object):
+    """
+    A name as fuzzywuzzy compares it: lower case, ASCII only and with punctuation turned into spaces.
+    """
+    __slots__ = ('text', 'tokens')
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = frozenset(text.split())
+
+
+class NameCache(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = {}
+
+    def get(self, name):
+        processed = self._names.get(name)
+        if processed is None:
+            load_fuzzywuzzy()
+            processed = ProcessedName(utils.full_process(name, force_ascii=True))
+            with self._lock:
+                if len(self._names) >= MAX_CACHED_NAMES:
+                    self._names = {}
+                self._names[name] = processed
+        return processed
+
+
+name_cache = NameCache()
+
+
+def load_fuzzywuzzy():
+    """
+    Import fuzzywuzzy's fuzz and utils modules into this one, if that hasn't been done yet.
+    """
+    global fuzz, utils
+    if fuzz is None:
+        from fuzzywuzzy import fuzz as fuzz_module, utils as utils_module
+        utils = utils_module
+        fuzz = fuzz_module
+
+
+def extract_events(query, names, limit=None):
+    """
+    Score event names against `query` with fuzzywuzzy's WRatio, as process.extract does by default.
+
+    :return: list of (name, score), best first, with at most `limit` entries if given
+    """
+    processed_query = process_query(query)
+    load_fuzzywuzzy()
+    scored = ((name, fuzz.WRatio(processed_query.text, name_cache.get(name).text, full_process=False)) for name in names)
+    return best_of(scored, limit)
+
+
+def extract_matches(query, names, limit=None):
+    """
+    Score match names against `query` with fuzzywuzzy's token_set_ratio, as process.extract does with that scorer.
+    With a `limit`, candidates whose best possible score can't beat the current top `limit` aren't scored fully.
+
+    :return: list of (name, score), best first, with at most `limit` entries if given
+    """
+    processed_query = process_query(query)
+    heap = []
+    for index, name in enumerate(names):
+        processed_name = name_cache.get(name)
+        threshold = heap[0][0] if limit is not None and len(heap) >= limit else None
+        score = token_set_ratio(processed_query, processed_name, threshold)
+        if score is None:
+            continue
+        entry = (score, -index, name)
+        if threshold is None:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heappushpop(heap, entry)
+    return [(name, score) for score, _, name in sorted(heap, reverse=True)]
+
+
+def process_query(query):
+    # process.extract runs its default processor over the query before normalising it again for the scorer
+    load_fuzzywuzzy()
+    return ProcessedName(utils.full_process(utils.full_process(query), force_ascii=True))
+
+
+def best_of(scored, limit):
+    """
+    The highest scoring of `scored` (name, score) pairs, ties kept in their original order, like heapq.nlargest.
+    """
+    entries = ((score, -index, name) for index, (name, score) in enumerate(scored))
+    if limit is None:
+        best = sorted(entries, reverse=True)
+    else:
+        best = heapq.nlargest(limit, entries)
+    return [(name, score) for score, _, name in best]
+
+
+def token_set_ratio(processed_query, processed_name, threshold=None):
+    """
+    fuzz.token_set_ratio of two already processed names, using their cached tokens.
+    If `threshold` is given and the score can't reach it, return None without comparing the strings.
+    """
+    if processed_query.text == processed_name.text:
+        return 100
+    if not processed_query.text or not processed_name.text:
+        return 0
+
+    intersection = processed_query.tokens & processed_name.tokens
+    sorted_sect = u" ".join(sorted(intersection))
+    sorted_1to2 = u" ".join(sorted(processed_query.tokens - intersection))
+    sorted_2to1 = u" ".join(sorted(processed_name.tokens - intersection))
+    combined_1to2 = (sorted_sect + u" " + sorted_1to2).strip()
+    combined_2to1 = (sorted_sect + u" " + sorted_2to1).strip()
+    sorted_sect = sorted_sect.strip()
+
+    # The intersection starts both combined strings, so only the last comparison needs working out properly
+    best = max(prefix_ratio(sorted_sect, combined_1to2), prefix_ratio(sorted_sect, combined_2to1))
+    upper_bound = ratio_upper_bound(combined_1to2, combined_2to1, len(sorted_sect))
+    if threshold is not None and max(best, upper_bound) < threshold:
+        return None
+    if upper_bound <= best:
+        return best
+    load_fuzzywuzzy()
+    return max(best, fuzz.ratio(combined_1to2, combined_2to1))
+
+
+def prefix_ratio(prefix, whole):
+    """
+    fuzz.ratio of `whole` and a `prefix` of it, which is every character of the prefix matching.
+    """
+    load_fuzzywuzzy()
+    if len(whole) >= AUTOJUNK_LENGTH:
+        return fuzz.ratio(prefix, whole)
+    if prefix == whole:
+        return 100
+    if not prefix:
+        return 0
+    return utils.intr(100 * (2.0 * len(prefix) / (len(prefix) + len(whole))))
+
+
+def ratio_upper_bound(first, second, common_prefix_length=0):
+    """
+    The most fuzz.ratio could give two strings: every character they have in common matching.
+    Characters in a prefix known to be shared by both are counted without looking at them.
+    """
+    load_fuzzywuzzy()
+    if first == second:
+        return 100
+    total_length = len(first) + len(second)
+    if total_length == 0:
+        return 0
+    first_rest = first[common_prefix_length:]
+    second_rest = second[common_prefix_length:]
+    common = common_prefix_length + sum(min(first_rest.count(char), second_rest.count(char)) for char in set(first_rest))
+    return utils.intr(100 * (2.0 * common / total_length))
@@ -0,0 +1,150 @@
+"""
+Plan the CAGEMATCH searches for a file name, and remember the searches that found nothing.
+A file name becomes an ordered list of tiers of search strategies: the date and promotion from
+the name first, then the promotion's other names and the date alone, then the name without the
+date. The tiers are tried in turn until one finds an event that scores as a confident match,
+pooling what each finds, and the strategies within a tier don't depend on each other so can be
+run side by side.
+Unmatchable files (DVD rips, compilations, typos) would otherwise repeat the same fruitless
+searches every time the library is scanned, so searches the site had no results for are kept in
+a negative cache for a while.
+"""
+import datetime
+import json
+import threading
+import time
+
+from http_cache import DAY, PAST_EVENT_AGE_DAYS
+
+STORE_KEY = "search-negative-cache"
+# A search for a date long gone is unlikely to start finding events, but old shows do get added
+PAST_NEGATIVE_TTL = 7 * DAY
+NEGATIVE_TTL = DAY
+
+# Names a promotion has gone by, as they're likely to appear in file names
+PROMOTION_ALIASES = [
+    ['WWE', 'WWF', 'WWWF'],
+    ['TNA', 'Impact', 'GFW'],
+    ['WCW', 'JCP'],
+]
+
+
+class SearchStrategy(object):
+    """
+    One search of the site: the event name to search for, and the date to limit it to, if any.
+    """
+    __slots__ = ('description', 'search_str', 'date')
+
+    def __init__(self, description, search_str, date=None):
+        self.description = description
+        self.search_str = search_str
+        self.date = date
+
+
+def plan_event_search(search_input, search_str, date):
+    """
+    Plan the searches for an event, given the components the file name regex found in it.
+
+    :param search_str: what to search for when the date doesn't find anything, the promotion and name
+    :return: list of tiers, each a list of SearchStrategy
+    """
+    plan = []
+    if date is not None:
+        plan.append([SearchStrategy("date and promotion", search_str, date)])
+        fallbacks = get_alias_strategies(search_input, date)
+        # Every event on the date, for when the promotion or name in the file name isn't CAGEMATCH's
+        fallbacks.append(SearchStrategy("date only", "", date))
+        plan.append(fallbacks)
+    plan.append([SearchStrategy("name only", search_str)])
+    return plan
+
+
+def plan_match_search(search_input, search_str, date):
+    """
+    Plan the searches for the event a match was on. Every event found has its card read, so
+    unlike events there's no searching for everything on the date.
+
+    :return: list of tiers, each a list of SearchStrategy
+    """
+    if date is None:
+        return []
+    plan = [[SearchStrategy("date and promotion", search_str, date)]]
+    aliases = get_alias_strategies(search_input, date, include_name=False)
+    if aliases:
+        plan.append(aliases)
+    return plan
+
+
+def get_alias_strategies(search_input, date, include_name=True):
+    strategies = []
+    for alias in get_promotion_aliases(search_input.get('prom', '')):
+        alias_str = alias
+        if include_name and 'name' in search_input:
+            alias_str = alias + " " + search_input['name']
+        strategies.append(SearchStrategy("promotion alias " + alias, alias_str, date))
+    return strategies
+
+
+def get_promotion_aliases(promotion):
+    """
+    The other names of `promotion` from PROMOTION_ALIASES, ignoring case.
+    """
+    promotion = promotion.strip().lower()
+    for aliases in PROMOTION_ALIASES:
+        if promotion in [alias.lower() for alias in aliases]:
+            return [alias for alias in aliases if alias.lower() != promotion]
+    return []
+
+
+def get_negative_key(search_str, date):
+    return (date.isoformat() if date is not None else "any") + "|" + search_str.strip().lower()
+
+
+class NegativeSearchCache(object):
+    """
+    The searches the site had no results for, and when each should be tried again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def contains(self, search_str, date):
+        """
+        Whether searching for `search_str` on `date` (None for any date) recently found nothing.
+        """
+        with self._lock:
+            self._load()
+            expires = self._entries.get(get_negative_key(search_str, date))
+            return expires is not None and expires > time.time()
+
+    def add(self, search_str, date):
+        """
+        Remember that searching for `search_str` on `date` found nothing.
+        """
+        ttl = NEGATIVE_TTL
+        if date is not None and (datetime.date.today() - date).days > PAST_EVENT_AGE_DAYS:
+            ttl = PAST_NEGATIVE_TTL
+        now = time.time()
+        with self._lock:
+            self._load()
+            self._entries[get_negative_key(search_str, date)] = now + ttl
+            self._entries = dict((key, expires) for key, expires in self._entries.items() if expires > now)
+            try:
+                Data.Save(STORE_KEY, json.dumps(self._entries))
+            except Exception as exc:
+                Log.Error("[search_planning] Could not save negative cache: " + str(exc))
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            raw_entries = Data.Load(STORE_KEY)
+            if raw_entries is not None:
+                self._entries = json.loads(raw_entries)
+        except Exception as exc:
+            Log.Error("[search_planning] Could not load negative cache, starting afresh: " + str(exc))
+
+
+negative_searches = NegativeSearchCache()
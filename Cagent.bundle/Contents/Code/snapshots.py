@@ -0,0 +1,258 @@
+"""
+Snapshots of the agent's caches, so that a new server can be seeded from one that has already
+read CAGEMATCH rather than fetching everything again.
+A snapshot holds the event index, the promotion abbreviations and the record cache entries of the
+indexed events and their matches: event records, reviews and matchguide ratings. Raw pages are
+left out, as an update only needs the records.
+
+The file can be written and read as a stream, or mapped into memory to look up single entries:
+
+    header  MAGIC, format version, PARSER_VERSION of the records and when it was written
+    frames  type byte, compressed length and CRC-32, then a zlib compressed JSON list of up to
+            FRAME_ENTRIES [kind, key, value] entries
+    index   a frame listing [kind, key, frame offset] for every entry
+    footer  offset of the index frame, number of entries, and MAGIC again
+
+Importing merges each entry with what is already cached, keeping the fresher copy: record parts
+that expire later, promotions fetched later and searches remembered later.
+"""
+import json
+import mmap
+import struct
+import time
+import zlib
+
+from event_index import event_index
+from extraction import PARSER_VERSION
+from promotion_cache import promotion_cache
+from record_cache import record_cache, get_event_key, get_match_key
+from records import Event
+
+MAGIC = b"CAGESNAP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">8sHHd")
+FRAME_HEADER = struct.Struct(">cII")
+FOOTER = struct.Struct(">QQ8s")
+ENTRIES_FRAME = b"E"
+INDEX_FRAME = b"I"
+FRAME_ENTRIES = 100
+COMPRESSION_LEVEL = 6
+
+# ################### Entry kinds ###################
+EVENT_KIND = "event"
+SEARCH_KIND = "search"
+PROMOTION_KIND = "promotion"
+RECORD_KIND = "record"
+
+
+class SnapshotWriter(object):
+    """
+    Writes entries to the file object `out` a frame at a time. Call `close` once every entry has
+    been added, to write the index and footer.
+    """
+
+    def __init__(self, out):
+        self._out = out
+        self._offset = 0
+        self._pending = []
+        self._index = []
+        self._write(HEADER.pack(MAGIC, FORMAT_VERSION, PARSER_VERSION, time.time()))
+
+    def add(self, kind, key, value):
+        self._pending.append([kind, key, value])
+        if len(self._pending) >= FRAME_ENTRIES:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        index_offset = self._offset
+        self._write_frame(INDEX_FRAME, self._index)
+        self._write(FOOTER.pack(index_offset, len(self._index), MAGIC))
+        self._out.flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        self._index.extend([kind, key, self._offset] for kind, key, _ in self._pending)
+        self._write_frame(ENTRIES_FRAME, self._pending)
+        self._pending = []
+
+    def _write_frame(self, frame_type, entries):
+        data = zlib.compress(json.dumps(entries, separators=(',', ':')), COMPRESSION_LEVEL)
+        self._write(FRAME_HEADER.pack(frame_type, len(data), zlib.crc32(data) & 0xffffffff))
+        self._write(data)
+
+    def _write(self, data):
+        self._out.write(data)
+        self._offset += len(data)
+
+
+class SnapshotReader(object):
+    """
+    Reads a snapshot from the file object `source`. `entries` reads it from start to end without
+    seeking, so it can come from a pipe. `get` looks entries up through the index, which needs a
+    real file, as the file is mapped into memory.
+    """
+
+    def __init__(self, source):
+        self._source = source
+        self._map = None
+        self._index = None
+        magic, version, self.parser_version, self.created = HEADER.unpack(read_exactly(source, HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("Not a snapshot file")
+        if version != FORMAT_VERSION:
+            raise ValueError("Unsupported snapshot format version " + str(version))
+
+    def entries(self):
+        """
+        :return: generator of [kind, key, value] entries, in the order they were written
+        """
+        while True:
+            frame_type, length, crc = FRAME_HEADER.unpack(read_exactly(self._source, FRAME_HEADER.size))
+            entries = decode_frame(read_exactly(self._source, length), crc)
+            if frame_type == INDEX_FRAME:
+                return
+            for entry in entries:
+                yield entry
+
+    def get(self, kind, key):
+        """
+        :return: the value of the entry `key` of `kind`, or None if the snapshot doesn't have it
+        """
+        index = self.get_index()
+        offset = index.get((kind, key))
+        if offset is None:
+            return None
+        for entry_kind, entry_key, value in self._frame_at(offset)[1]:
+            if entry_kind == kind and entry_key == key:
+                return value
+        return None
+
+    def get_index(self):
+        """
+        :return: dictionary of (kind, key) to the offset of the frame holding that entry
+        """
+        if self._index is None:
+            self._map = mmap.mmap(self._source.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self._map) < HEADER.size + FOOTER.size:
+                raise ValueError("Snapshot is truncated")
+            index_offset, _, magic = FOOTER.unpack(self._map[-FOOTER.size:])
+            if magic != MAGIC:
+                raise ValueError("Snapshot has no footer, it may be truncated")
+            self._index = dict(((kind, key), offset) for kind, key, offset in self._frame_at(index_offset)[1])
+        return self._index
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _frame_at(self, offset):
+        frame_type, length, crc = FRAME_HEADER.unpack_from(self._map, offset)
+        start = offset + FRAME_HEADER.size
+        return frame_type, decode_frame(self._map[start:start + length], crc)
+
+
+def read_exactly(source, size):
+    data = source.read(size)
+    if len(data) != size:
+        raise ValueError("Snapshot is truncated")
+    return data
+
+
+def decode_frame(data, crc):
+    if zlib.crc32(data) & 0xffffffff != crc:
+        raise ValueError("Snapshot frame is corrupt")
+    return json.loads(zlib.decompress(data))
+
+
+def export_snapshot(out, record_keys=()):
+    """
+    Write a snapshot of the caches to the file object `out`. The record cache can't list its
+    entries, so those of every indexed event and its matches are written, along with any other
+    `record_keys` given.
+
+    :return: dictionary of entry kind to the number of entries written
+    """
+    writer = SnapshotWriter(out)
+    counts = {}
+
+    def add(kind, key, value):
+        writer.add(kind, key, value)
+        counts[kind] = counts.get(kind, 0) + 1
+
+    events, searches = event_index.export()
+    written = set()
+    for key in [get_event_key(event_id) for event_id in sorted(events)] + list(record_keys):
+        if key in written:
+            continue
+        written.add(key)
+        parts = record_cache.export(key)
+        if parts is None:
+            continue
+        add(RECORD_KIND, key, parts)
+        if 'event' not in parts:
+            continue
+        event = Event.from_json(parts['event']['value'])
+        if key != get_event_key(event.id):
+            continue
+        for match_id in range(1, max(len(event.matches), len(event.card or [])) + 1):
+            match_key = get_match_key(event.id, match_id)
+            if match_key not in written:
+                written.add(match_key)
+                match_parts = record_cache.export(match_key)
+                if match_parts is not None:
+                    add(RECORD_KIND, match_key, match_parts)
+
+    for event_id, record in sorted(events.items()):
+        add(EVENT_KIND, event_id, record)
+    for search_key, search in sorted(searches.items()):
+        add(SEARCH_KIND, search_key, search)
+    for link, value in sorted(promotion_cache.export().items()):
+        add(PROMOTION_KIND, link, value)
+    writer.close()
+    Log.Info("[snapshots] Exported " + ", ".join(
+        str(count) + " " + kind + " entries" for kind, count in sorted(counts.items())))
+    return counts
+
+
+def import_snapshot(source):
+    """
+    Merge the snapshot read from the file object `source` into the caches, keeping the fresher
+    copy of everything. Records written by another version of the extraction code are skipped,
+    as the record cache would ignore them anyway.
+
+    :return: dictionary of "records", "promotions" and "index" to a tuple of (entries read, entries taken)
+    """
+    reader = SnapshotReader(source)
+    skip_records = reader.parser_version != PARSER_VERSION
+    if skip_records:
+        Log.Warn("[snapshots] Snapshot records are from parser version " + str(reader.parser_version) +
+                 ", not " + str(PARSER_VERSION) + ", so only the index and promotions are imported")
+    records_read = 0
+    records_taken = 0
+    events = {}
+    searches = {}
+    promotions = {}
+    for kind, key, value in reader.entries():
+        if kind == RECORD_KIND:
+            records_read += 1
+            if not skip_records and record_cache.merge(str(key), value):
+                records_taken += 1
+        elif kind == EVENT_KIND:
+            events[key] = value
+        elif kind == SEARCH_KIND:
+            searches[key] = value
+        elif kind == PROMOTION_KIND:
+            promotions[key] = value
+
+    counts = {
+        'records': (records_read, records_taken),
+        'promotions': (len(promotions), promotion_cache.merge(promotions)),
+        'index': (len(events) + len(searches), event_index.merge(events, searches)),
+    }
+    Log.Info("[snapshots] Imported " + ", ".join(
+        str(taken) + " of " + str(read) + " " + name for name, (read, taken) in sorted(counts.items())))
+    return counts
+
@@ -1,46 +1,296 @@
-"""
-Some URL loading methods I jacked from the web while reading up on how to start.
-No cops allowed
-MDK
-"""
-from contextlib import closing
-from requests.exceptions import RequestException
-from requests import get
-
-
-def simple_get(url):
-    """
-    Attempts to get the content at `url` by making an HTTP GET request.
-    If the content-type of response is some kind of HTML/XML, return the
-    text content, otherwise return None.
-    """
-    try:
-        Log.Debug("[url_loading] Requesting " + str(url))
-        with closing(get(url, stream=True, headers = {'Accept-Encoding': 'identity'})) as resp:
-            if is_good_response(resp):
-                return resp.content
-            else:
-                return None
-
-    except RequestException as exc:
-        log_error('Error during requests to {0} : {1}'.format(url, str(exc)))
-        return None
-
-
-def is_good_response(resp):
-    """
-    Returns True if the response seems to be HTML, False otherwise.
-    """
-    content_type = resp.headers['Content-Type'].lower()
-    return (resp.status_code == 200
-            and content_type is not None
-            and content_type.find('html') > -1)
-
-
-def log_error(exc):
-    """
-    It is always a good idea to log errors.
-    This function just prints them, but you can
-    make it do anything.
-    """
-    Log.Error("[url_loading] " + exc)
\ No newline at end of file
+"""
+Some URL loading methods I jacked from the web while reading up on how to start.
+No cops allowed
+MDK
+"""
+import threading
+import time
+
+from contextlib import closing
+from http_cache import response_cache
+from instrumentation import metrics
+from rate_limiting import get_backoff_delay, rate_limiter
+from refresh_scheduler import refresh_scheduler, MAX_STALE_SECONDS
+from utils import get_int_pref
+
+# ################### Session defaults ###################
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT = 20
+DEFAULT_HEADERS = {'Accept-Encoding': 'identity'}
+MAX_ATTEMPTS = 4
+# Pages read with stream_get are read this much at a time, and never beyond the cap
+STREAM_CHUNK_SIZE = 16 * 1024
+MAX_STREAM_BYTES = 2 * 1024 * 1024
+
+_session = None
+_session_config = None
+_session_lock = threading.Lock()
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def simple_get(url):
+    """
+    Attempts to get the content at `url` by making an HTTP GET request.
+    If the content-type of response is some kind of HTML/XML, return the
+    text content, otherwise return None.
+    Good responses are kept in the persistent response cache, which is checked first.
+    If another thread is already loading the same URL, wait for it and share its result
+    rather than making a second request.
+    """
+    with _in_flight_lock:
+        request = _in_flight.get(url)
+        is_leader = request is None
+        if is_leader:
+            request = InFlightRequest()
+            _in_flight[url] = request
+
+    if not is_leader:
+        Log.Debug("[url_loading] Waiting on in-flight request for " + str(url))
+        metrics.increment('http.coalesced')
+        request.done.wait()
+        return request.body
+
+    try:
+        request.body = load(url)[0]
+    finally:
+        with _in_flight_lock:
+            del _in_flight[url]
+        request.done.set()
+    return request.body
+
+
+def stream_get(url, scanner):
+    """
+    Like simple_get, for pages where only the start is needed. A page that isn't cached is read
+    a chunk at a time and fed to `scanner` (see extraction.DivCounter), and reading stops as soon
+    as the scanner is `done` or MAX_STREAM_BYTES have been read. A page cut short ends after the
+    last div the scanner counted, and isn't cached.
+
+    :return: tuple of (body or None, whether it is the whole page)
+    """
+    return load(url, scanner)
+
+
+def load(url, scanner=None):
+    """
+    Return the body for `url` from the response cache, fetching and caching it if needed.
+    While the refresh scheduler is running, a page that has not long expired is served as it is,
+    and revalidated in the background.
+
+    :return: tuple of (body or None, whether it is the whole page)
+    """
+    refresh_scheduler.note_activity()
+    cached_body = response_cache.get(url)
+    if cached_body is not None:
+        metrics.increment('http.cache_hits')
+        return cached_body, True
+
+    if refresh_scheduler.running:
+        stale_body = response_cache.get_stale(url, MAX_STALE_SECONDS)
+        if stale_body is not None:
+            metrics.increment('http.stale_hits')
+            refresh_scheduler.request(url)
+            return stale_body, True
+
+    metrics.increment('http.cache_misses')
+    return fetch_into_cache(url, scanner)
+
+
+def refresh_page(url):
+    """
+    Revalidate or fetch the page for `url` into the response cache, whether or not it has
+    expired. This is how the refresh scheduler keeps the cache fresh.
+
+    :return: True if the cache now has a fresh copy of the page
+    """
+    return fetch_into_cache(url)[0] is not None
+
+
+def fetch_into_cache(url, scanner=None):
+    """
+    Fetch the page for `url`, asking only whether it has changed if we have validators for a
+    cached copy, and cache it unless it was only partly read.
+
+    :return: tuple of (body or None, whether it is the whole page)
+    """
+    page = fetch(url, response_cache.get_revalidation_headers(url), scanner)
+    if page is not None and page.not_modified:
+        metrics.increment('http.revalidated')
+        body = response_cache.refresh(url)
+        if body is not None:
+            return body, True
+        # The stored body went missing in the meantime, so fetch the page after all
+        page = fetch(url, None, scanner)
+    if page is None:
+        return None, False
+    if page.complete:
+        response_cache.put(url, page.body, page.etag, page.last_modified)
+    else:
+        metrics.increment('http.partial_reads')
+    return page.body, page.complete
+
+
+def fetch(url, headers=None, scanner=None):
+    """
+    Make the request for `url` under the shared rate limiter. Rate limited responses, server
+    errors, timeouts and dropped connections are retried with an exponential backoff.
+    `headers` are sent along with the session's, such as the conditional headers for revalidating
+    a cached page. With a `scanner`, only as much of the body as it needs is read.
+    requests is imported here rather than at plugin start, as a warm cache may never need it.
+
+    :return: FetchedPage, or None if there was no good response
+    """
+    from requests.exceptions import ConnectionError, RequestException, Timeout
+    for attempt in range(MAX_ATTEMPTS):
+        retry_after = None
+        rate_limiter.acquire()
+        start = time.time()
+        try:
+            Log.Debug("[url_loading] Requesting " + str(url))
+            session, timeout = get_session()
+            with closing(session.get(url, headers=headers, stream=True, timeout=timeout)) as resp:
+                metrics.increment('http.status.' + str(resp.status_code))
+                if resp.status_code == 304:
+                    rate_limiter.record_success(time.time() - start)
+                    return FetchedPage(None, not_modified=True)
+                elif resp.status_code == 429 or resp.status_code >= 500:
+                    rate_limiter.record_throttled()
+                    retry_after = resp.headers.get('Retry-After')
+                    Log.Info("[url_loading] Got status " + str(resp.status_code) + " from " + str(url))
+                elif is_good_response(resp):
+                    if scanner is None:
+                        body, complete = resp.content, True
+                    else:
+                        body, complete = read_until_done(resp, scanner)
+                    rate_limiter.record_success(time.time() - start)
+                    metrics.observe('http.latency_ms', (time.time() - start) * 1000)
+                    metrics.increment('http.bytes', len(body))
+                    return FetchedPage(body, resp.headers.get('ETag'), resp.headers.get('Last-Modified'), complete=complete)
+                else:
+                    rate_limiter.record_success(time.time() - start)
+                    return None
+
+        except (Timeout, ConnectionError) as exc:
+            rate_limiter.record_throttled()
+            metrics.increment('http.timeouts')
+            Log.Info("[url_loading] Request to " + str(url) + " failed: " + str(exc))
+        except RequestException as exc:
+            metrics.increment('http.errors')
+            log_error('Error during requests to {0} : {1}'.format(url, str(exc)))
+            return None
+
+        if attempt + 1 < MAX_ATTEMPTS:
+            delay = get_backoff_delay(attempt, retry_after)
+            Log.Info("[url_loading] Retrying " + str(url) + " in " + "%.1f" % delay + " seconds")
+            metrics.increment('http.retries')
+            time.sleep(delay)
+
+    metrics.increment('http.errors')
+    log_error('Giving up on {0} after {1} attempts'.format(url, MAX_ATTEMPTS))
+    return None
+
+
+def read_until_done(resp, scanner):
+    """
+    Read the body of `resp` a chunk at a time, feeding each to `scanner`, until it is done or the
+    byte cap is reached. Anything after the scanner's last div is dropped from a partial body.
+
+    :return: tuple of (body, whether it is the whole page)
+    """
+    chunks = []
+    size = 0
+    scanner.reset()
+    for chunk in resp.iter_content(STREAM_CHUNK_SIZE):
+        chunks.append(chunk)
+        size += len(chunk)
+        scanner.feed(chunk)
+        if scanner.done or size >= MAX_STREAM_BYTES:
+            if not scanner.done:
+                Log.Info("[url_loading] Stopped reading " + str(resp.url) + " after " + str(size) + " bytes")
+            return "".join(chunks)[:scanner.end], False
+    return "".join(chunks), True
+
+
+class FetchedPage(object):
+    """
+    A response from CAGEMATCH: the body and its validators, or for a conditional request that
+    found the page unchanged, just `not_modified`. `complete` is False for a body that was only
+    partly read.
+    """
+    __slots__ = ('body', 'etag', 'last_modified', 'not_modified', 'complete')
+
+    def __init__(self, body, etag=None, last_modified=None, not_modified=False, complete=True):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+        self.complete = complete
+
+
+class InFlightRequest(object):
+    """
+    A load of a URL that is currently in progress. Threads asking for the same URL wait on
+    `done` and then read `body`.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.body = None
+
+
+def get_session():
+    """
+    Returns the shared keep-alive session and the timeout to use with it.
+    The session is built on first use, and rebuilt if the pool size preference changes.
+    requests' connection pools are thread-safe, so one session is shared by every agent worker.
+
+    :return: tuple of (session, timeout in seconds)
+    """
+    global _session, _session_config
+    pool_size = get_int_pref("connectionPoolSize", DEFAULT_POOL_SIZE)
+    timeout = get_int_pref("requestTimeout", DEFAULT_TIMEOUT)
+    with _session_lock:
+        if _session is None or _session_config != pool_size:
+            if _session is not None:
+                _session.close()
+            Log.Debug("[url_loading] Creating session with a pool of " + str(pool_size) + " connections")
+            _session = build_session(pool_size)
+            _session_config = pool_size
+        return _session, timeout
+
+
+def build_session(pool_size):
+    """
+    Create a requests session with connection pooling and keep-alive.
+    Each host gets its own pool of `pool_size` connections, and callers block for a free
+    connection rather than opening extra throwaway ones.
+    """
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+    session = Session()
+    session.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def is_good_response(resp):
+    """
+    Returns True if the response seems to be HTML, False otherwise.
+    """
+    content_type = resp.headers['Content-Type'].lower()
+    return (resp.status_code == 200
+            and content_type is not None
+            and content_type.find('html') > -1)
+
+
+def log_error(exc):
+    """
+    It is always a good idea to log errors.
+    This function just prints them, but you can
+    make it do anything.
+    """
+    Log.Error("[url_loading] " + exc)
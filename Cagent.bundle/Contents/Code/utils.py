@@ -10,4 +10,24 @@ def get_date(s_date):
             pass
 
     Log.Info("[" + utils + "] [get_date] Could not format date " + s_date)
-    return None
\ No newline at end of file
+    return None
+
+
+def get_int_pref(key, default):
+    """
+    Read a numeric preference, falling back to `default` if it is missing or not a number.
+    """
+    try:
+        return int(Prefs[key])
+    except:
+        return default
+
+
+def get_float_pref(key, default):
+    """
+    Read a decimal preference, falling back to `default` if it is missing or not a number.
+    """
+    try:
+        return float(Prefs[key])
+    except:
+        return default
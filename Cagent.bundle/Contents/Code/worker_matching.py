@@ -0,0 +1,83 @@
+"""
+Work out which of an event's workers appear in each of its matches.
+All the worker names are built into one Aho-Corasick automaton, so a match line is scanned once
+however many workers the event has. A name only counts when it appears as whole words, so
+"Sting" isn't found in "Stinger".
+"""
+from collections import deque
+
+
+class WorkerMatcher(object):
+    """
+    Automaton over a list of worker names. `find` returns the workers in a line of text, in the
+    order of the worker list.
+    """
+
+    def __init__(self, workers):
+        self.workers = list(workers)
+        self._lengths = [len(to_unicode(worker)) for worker in self.workers]
+        # Each state is a dictionary of character to next state, with its failure state and the
+        # indexes of the workers whose names end there kept alongside
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for index, worker in enumerate(self.workers):
+            name = to_unicode(worker)
+            if name:
+                self._add(name, index)
+        self._build_failures()
+
+    def _add(self, name, index):
+        state = 0
+        for char in name:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append(index)
+
+    def _build_failures(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text):
+        """
+        :return: list of the workers whose names appear as whole words in `text`
+        """
+        text = to_unicode(text)
+        found = set()
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for index in self._output[state]:
+                start = position - self._lengths[index] + 1
+                if is_boundary(text, start - 1) and is_boundary(text, position + 1):
+                    found.add(index)
+        return [self.workers[index] for index in sorted(found)]
+
+
+def is_boundary(text, position):
+    """
+    Whether the character at `position` can't be part of a word, because it isn't a letter or digit or is off either end.
+    """
+    return position < 0 or position >= len(text) or not text[position].isalnum()
+
+
+def to_unicode(text):
+    if isinstance(text, str):
+        return text.decode('utf-8', 'ignore')
+    return text
@@ -0,0 +1,88 @@
+"""
+Run independent jobs, like fetching the secondary pages of an event, side by side on a bounded
+number of threads. Requests made from the jobs still go through the shared rate limiter.
+"""
+import threading
+
+from Queue import Queue, Empty
+
+MAX_WORKERS = 4
+
+
+def run_concurrently(jobs, max_workers=MAX_WORKERS):
+    """
+    Run every job in `jobs`, a dictionary of name to (function, args), and wait for them all to finish.
+    A job that raises has its exception logged and gets a result of None.
+
+    :return: dictionary of name to the result of that job
+    """
+    names = list(jobs.keys())
+    results = parallel_map(lambda name: jobs[name][0](*jobs[name][1]), names, max_workers)
+    return dict(zip(names, results))
+
+
+def parallel_map(function, items, max_workers=MAX_WORKERS):
+    """
+    Call `function` on each of `items` using up to `max_workers` threads.
+    A single item is run on the calling thread, as there is nothing to overlap it with.
+
+    :return: list of results, in the same order as `items`
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if len(items) == 1:
+        results[0] = call_safely(function, items[0])
+        return results
+
+    queue = Queue()
+    for index, item in enumerate(items):
+        queue.put((index, item))
+
+    def work():
+        while True:
+            try:
+                index, item = queue.get_nowait()
+            except Empty:
+                return
+            results[index] = call_safely(function, item)
+
+    threads = [threading.Thread(target=work) for _ in range(min(max_workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class BackgroundJob(object):
+    """
+    A single call of `function(*args)` on its own thread, started straight away, whose result is
+    collected later. Like the jobs above, an exception is logged and gives a result of None.
+    """
+
+    def __init__(self, function, args):
+        self._done = threading.Event()
+        self._result = None
+        thread = threading.Thread(target=self._run, args=(function, args))
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, function, args):
+        self._result = call_safely(lambda job_args: function(*job_args), args)
+        self._done.set()
+
+    def result(self):
+        """
+        Wait for the call to finish and return its result.
+        """
+        self._done.wait()
+        return self._result
+
+
+def call_safely(function, item):
+    try:
+        return function(item)
+    except Exception as exc:
+        Log.Exception("[workers] Job failed: " + str(exc))
+        return None
@@ -0,0 +1,140 @@
+"""Offline end-to-end benchmark of the agent against the recorded fixture corpus.
+
+Starts stub-server.py in-process, points the agent at it, and for every title in test-files.yml
+runs `search` followed by `update` on the best candidate, just like an automatic Plex match.
+The first run starts with empty caches; any further runs reuse the same data directory, to show
+warm cache behaviour. For each run it reports items per second, latency of each phase and how
+many requests and bytes were fetched from the stub server, followed by the agent's own
+instrumentation: request, parsing, scoring and update timings and counters.
+
+Requires Python 2.7 with the bundle dependencies and pyyaml, and a corpus recorded by
+record-fixtures.py, or --synthetic to run against synthetic_site.py's pages and titles instead.
+From the test directory run:
+
+    python ./benchmark.py [--runs 2] [--latency 0.2] [--workers 1] [--pref reviewCount=5] [--json results.json] [--synthetic]
+"""
+import argparse, imp, json, logging, os, shutil, sys, tempfile, threading, time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, "..", "tools"))
+import plex_shim
+
+stub_server = imp.load_source("stub_server", os.path.join(TEST_DIR, "stub-server.py"))
+import synthetic_site
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def describe(values):
+    return "mean {0:7.1f} ms  p50 {1:7.1f} ms  p95 {2:7.1f} ms".format(
+        1000 * sum(values) / len(values) if values else 0.0,
+        1000 * percentile(values, 0.5), 1000 * percentile(values, 0.95))
+
+
+def run_item(agent, path, timings):
+    start = time.time()
+    results = plex_shim.SearchResults()
+    agent.search(results, plex_shim.Media.from_path(path), "en", False)
+    searched = time.time()
+    best = results.best()
+    if best is not None:
+        agent.update(plex_shim.Metadata(best.id), None, "en", False)
+    updated = time.time()
+    timings['search'].append(searched - start)
+    if best is not None:
+        timings['update'].append(updated - searched)
+    timings['item'].append(updated - start)
+
+
+def run_once(agent, server, paths, workers):
+    """Process every path with `workers` threads, returning the timings, stub server counters and agent metrics."""
+    from instrumentation import metrics
+    server.corpus.reset()
+    metrics.reset()
+    timings = {'search': [], 'update': [], 'item': []}
+    pending = list(paths)
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                path = pending.pop(0)
+            run_item(agent, path, timings)
+
+    start = time.time()
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    return {
+        'items': len(paths),
+        'seconds': elapsed,
+        'items_per_second': len(paths) / elapsed if elapsed else 0.0,
+        'timings': timings,
+        'server': dict(server.corpus.stats),
+        'metrics': metrics.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent against the fixture corpus")
+    parser.add_argument("--runs", type=int, default=2, help="number of passes over the test files; the first is cold")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to delay each stub response by")
+    parser.add_argument("--workers", type=int, default=1, help="number of items to process at once")
+    parser.add_argument("--pref", action="append", default=[], help="preference override, as id=value")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--synthetic", action="store_true", help="use the synthetic site rather than the recorded corpus")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.synthetic:
+        server = stub_server.StubServer(latency=args.latency, corpus=synthetic_site.SyntheticCorpus())
+        paths = synthetic_site.TITLES
+    else:
+        server = stub_server.StubServer(latency=args.latency)
+        paths = None
+    if not server.corpus.pages:
+        print("The fixture corpus is empty, run record-fixtures.py first")
+        sys.exit(1)
+    prefs = dict(pref.split("=", 1) for pref in args.pref)
+    data_dir = tempfile.mkdtemp()
+    server_url = server.start()
+    try:
+        agent_module = plex_shim.load_agent(data_dir, prefs)
+        agent_module.CM_MAIN_URL = server_url
+        agent = agent_module.Cagent_Movie()
+        if paths is None:
+            record_fixtures = imp.load_source("record_fixtures", os.path.join(TEST_DIR, "record-fixtures.py"))
+            paths = record_fixtures.get_test_paths()
+        runs = []
+        for run in range(args.runs):
+            result = run_once(agent, server, paths, args.workers)
+            runs.append(result)
+            print("Run {0} ({1}): {2} items in {3:.2f} s, {4:.2f} items/s".format(
+                run + 1, "cold" if run == 0 else "warm", result['items'], result['seconds'], result['items_per_second']))
+            for phase in ('search', 'update', 'item'):
+                print("  {0:<7} {1}".format(phase, describe(result['timings'][phase])))
+            print("  fetched {requests} pages, {bytes} bytes, {misses} not in corpus".format(**result['server']))
+            for name, histogram in sorted(result['metrics']['histograms'].items()):
+                print("  {0:<20} count {count:5}  mean {mean:9.1f}  p50 <= {p50}  p95 <= {p95}".format(name, **histogram))
+            for name, count in sorted(result['metrics']['counters'].items()):
+                print("  {0:<20} {1}".format(name, count))
+        if args.json:
+            with open(args.json, "w") as json_file:
+                json.dump(runs, json_file, indent=1)
+    finally:
+        server.shutdown()
+        shutil.rmtree(data_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compare parsing saved CAGEMATCH pages into a full Beautiful Soup tree against the restricted
+parsing done by the agent's extraction module.
+
+Usage, with Python 2.7 and the bundle dependencies available:
+
+    python ./parsing-benchmark.py event page1.html [page2.html ...]
+
+The first argument is the page type: event, card, reviews, promotion, matchguide or search.
+"""
+import os, sys, timeit
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Cagent.bundle", "Contents", "Code")
+sys.path.insert(0, CODE_DIR)
+
+
+class QuietLog(object):
+    """Stands in for the Plex framework logger, which the bundle code expects to find as a global."""
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+import __builtin__
+__builtin__.Log = QuietLog()
+
+from bs4 import BeautifulSoup
+import extraction
+
+PARSERS = {
+    'event': extraction.parse_event_page,
+    'card': extraction.parse_card_page,
+    'reviews': extraction.parse_reviews_page,
+    'promotion': extraction.parse_promotion_page,
+    'matchguide': extraction.parse_matchguide_page,
+    'search': extraction.parse_search_page,
+}
+REPEATS = 20
+
+
+def count_elements(soup):
+    """Number of tags in a tree, as a rough measure of how much memory it holds."""
+    return len(soup.find_all(True))
+
+
+def main(page_type, paths):
+    parse = PARSERS[page_type]
+    print("Parser backend: " + extraction.get_parser())
+    full_total = 0.0
+    restricted_total = 0.0
+    for path in paths:
+        raw_html = open(path, 'rb').read()
+        full_time = min(timeit.repeat(lambda: BeautifulSoup(raw_html, 'html.parser'), number=1, repeat=REPEATS))
+        restricted_time = min(timeit.repeat(lambda: parse(raw_html), number=1, repeat=REPEATS))
+        full_elements = count_elements(BeautifulSoup(raw_html, 'html.parser'))
+        restricted_soup = extraction.make_soup(raw_html, lambda name, attrs: name == 'table' or extraction.has_class(attrs, (
+            extraction.INFORMATION_BOX_CLASS, extraction.MATCHES_CLASS, extraction.WORKERS_CLASS,
+            extraction.RATING_CLASS, extraction.COMMENT_CLASS, extraction.SEARCH_HEADER_CLASS)))
+        restricted_elements = count_elements(restricted_soup)
+        print("{path}: full parse {full:.1f} ms / {full_elements} tags, extraction {restricted:.1f} ms / at most {restricted_elements} tags ({speedup:.1f}x faster)".format(
+            path=os.path.basename(path), full=full_time * 1000, full_elements=full_elements,
+            restricted=restricted_time * 1000, restricted_elements=restricted_elements,
+            speedup=full_time / restricted_time))
+        full_total += full_time
+        restricted_total += restricted_time
+    print("Total: full parse {full:.1f} ms, extraction {restricted:.1f} ms".format(
+        full=full_total * 1000, restricted=restricted_total * 1000))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in PARSERS:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,74 @@
+"""Record the CAGEMATCH pages the agent fetches for the titles in test-files.yml.
+
+Each title is searched for and its best candidate updated, exactly as Plex would do, using the
+live site. Every page fetched along the way is saved gzipped to fixtures/pages, with
+fixtures/manifest.json mapping each URL (relative to the CAGEMATCH root) to its file. The
+corpus can then be served offline by stub-server.py and used by benchmark.py.
+
+Requires Python 2.7 with the bundle dependencies and pyyaml. From the test directory run:
+
+    python ./record-fixtures.py
+"""
+import gzip, hashlib, json, logging, os, shutil, sys, tempfile
+import yaml
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, "..", "tools"))
+import plex_shim
+
+FIXTURES_DIR = os.path.join(TEST_DIR, "fixtures")
+PAGES_DIR = os.path.join(FIXTURES_DIR, "pages")
+MANIFEST_PATH = os.path.join(FIXTURES_DIR, "manifest.json")
+LIBRARY_ROOT = "/movies"
+
+
+def get_test_paths():
+    """The library paths of every item in test-files.yml, laid out as populate-media.py creates them."""
+    config = yaml.safe_load(open(os.path.join(TEST_DIR, "test-files.yml")))
+    paths = [os.path.join(LIBRARY_ROOT, event, event + ".mkv") for event in config['events']]
+    paths += [os.path.join(LIBRARY_ROOT, match) for match in config['matches']]
+    return paths
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    if not os.path.isdir(PAGES_DIR):
+        os.makedirs(PAGES_DIR)
+    manifest = json.load(open(MANIFEST_PATH)) if os.path.exists(MANIFEST_PATH) else {}
+
+    # Use a throwaway data directory so every page really is fetched from the site
+    data_dir = tempfile.mkdtemp()
+    agent_module = plex_shim.load_agent(data_dir)
+    import url_loading
+    fetch = url_loading.fetch
+
+    def recording_fetch(url, headers=None, scanner=None):
+        # Always read whole pages, so the fixtures can stand in for the site
+        page = fetch(url, headers)
+        if page is not None and page.body is not None:
+            relative_url = url[len(agent_module.CM_MAIN_URL):]
+            file_name = hashlib.sha1(relative_url).hexdigest() + ".html.gz"
+            with gzip.open(os.path.join(PAGES_DIR, file_name), "wb") as page_file:
+                page_file.write(page.body)
+            manifest[relative_url] = file_name
+        return page
+    url_loading.fetch = recording_fetch
+
+    agent = agent_module.Cagent_Movie()
+    try:
+        for path in get_test_paths():
+            results = plex_shim.SearchResults()
+            agent.search(results, plex_shim.Media.from_path(path), "en", False)
+            best = results.best()
+            print("{0} -> {1}".format(os.path.basename(path), best))
+            if best is not None:
+                agent.update(plex_shim.Metadata(best.id), None, "en", False)
+    finally:
+        with open(MANIFEST_PATH, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        shutil.rmtree(data_dir)
+    print("Recorded {0} pages to {1}".format(len(manifest), FIXTURES_DIR))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Serve the recorded CAGEMATCH fixture corpus over HTTP, standing in for the live site.
+
+Requests are looked up by their path and query in fixtures/manifest.json, so pointing the agent's
+CM_MAIN_URL at this server makes it run entirely offline. Anything not in the corpus gets a 404.
+GET /__stats returns the number of requests and bytes served so far as JSON, and /__reset clears them.
+
+    python ./stub-server.py [--port 8765] [--latency 0.2]
+
+--latency adds a fixed delay to every response, to approximate the round trip to the real site.
+"""
+import argparse, gzip, json, os, threading, time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TEST_DIR, "fixtures")
+
+
+class Corpus(object):
+    """The recorded pages, loaded into memory, plus counters of what has been served."""
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR):
+        self.pages = {}
+        manifest_path = os.path.join(fixtures_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            for relative_url, file_name in json.load(open(manifest_path)).items():
+                with gzip.open(os.path.join(fixtures_dir, "pages", file_name), "rb") as page_file:
+                    self.pages[relative_url] = page_file.read()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'bytes': 0, 'misses': 0}
+
+    def record(self, body):
+        with self.lock:
+            self.stats['requests'] += 1
+            if body is None:
+                self.stats['misses'] += 1
+            else:
+                self.stats['bytes'] += len(body)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        corpus = self.server.corpus
+        if self.path == "/__stats":
+            return self.respond(200, "application/json", json.dumps(corpus.stats).encode("utf-8"))
+        if self.path == "/__reset":
+            corpus.reset()
+            return self.respond(200, "application/json", b"{}")
+
+        body = corpus.pages.get(self.path.lstrip("/"))
+        corpus.record(body)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if body is None:
+            return self.respond(404, "text/html", b"<html>Not in the fixture corpus</html>")
+        self.respond(200, "text/html; charset=utf-8", body)
+
+    def respond(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0.0, corpus=None):
+        HTTPServer.__init__(self, ("127.0.0.1", port), StubHandler)
+        self.corpus = corpus or Corpus()
+        self.latency = latency
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{0}/".format(self.server_address[1])
+
+    def start(self):
+        """Serve from a background thread, returning the server's root URL."""
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the recorded CAGEMATCH fixture corpus")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to delay each response by")
+    args = parser.parse_args()
+    server = StubServer(args.port, args.latency)
+    print("Serving {0} pages at {1}".format(len(server.corpus.pages), server.url))
+    server.serve_forever()
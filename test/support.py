@@ -0,0 +1,36 @@
+"""Shared set up for the unit tests (the test_*.py files in this directory).
+
+Puts the bundle's code on the path, with tools/plex_shim.py's stand-ins for the Plex framework
+globals installed. The bundle dependencies need to be importable, e.g. with
+Contents/Libraries/Shared on PYTHONPATH as the CI workflow does. From the repository root run:
+
+    python -m unittest discover -s test -p "test_*.py"
+"""
+import imp, os, shutil, sys, tempfile, unittest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, "..", "tools"))
+import plex_shim
+
+sys.path.insert(0, plex_shim.CODE_DIR)
+plex_shim.install_globals(tempfile.gettempdir())
+
+
+def load_script(name):
+    """Load one of the test directory's scripts, whose names aren't importable as they have dashes."""
+    module_name = name.replace("-", "_")
+    if module_name not in sys.modules:
+        imp.load_source(module_name, os.path.join(TEST_DIR, name + ".py"))
+    return sys.modules[module_name]
+
+
+class DataTestCase(unittest.TestCase):
+    """A test with an empty data directory of its own, and the default preferences with any in `prefs`."""
+    prefs = None
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        plex_shim.install_globals(self.data_dir, self.prefs)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, True)
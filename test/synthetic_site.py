@@ -0,0 +1,210 @@
+"""A small synthetic stand-in for CAGEMATCH, for tests and benchmarks that can't reach the site.
+
+Pages are built on request from the EVENTS and PROMOTIONS below, laid out like the real site's
+event, card, comments, promotion, matchguide and search pages, including the long stretches of
+markup the agent skips over. SyntheticCorpus can be given to stub-server.py's StubServer in place
+of the recorded corpus, and TITLES are library paths that match its events:
+
+    server = stub_server.StubServer(corpus=synthetic_site.SyntheticCorpus())
+    agent_module.CM_MAIN_URL = server.start()
+
+To save sample pages for parsing-benchmark.py:
+
+    python ./synthetic_site.py pages/
+"""
+import os, sys, threading
+
+try:
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from urllib.parse import parse_qs, urlparse
+
+EVENTS = {
+    '2004': dict(name='ROH The Era Of Honor Begins', date='23.02.2002', promotion='122',
+                 matches=['Low Ki defeats Christopher Daniels and Spanky', 'Amazing Red defeats Xavier', 'Sting defeats Stinger'],
+                 workers='Low Ki, Christopher Daniels, Spanky, Amazing Red, Xavier, Sting, Stinger'),
+    '2005': dict(name='ROH Round Robin Challenge', date='30.03.2002', promotion='122',
+                 matches=['Low Ki defeats American Dragon', 'Doug Williams defeats Xavier'],
+                 workers='Low Ki, American Dragon, Doug Williams, Xavier'),
+    '2006': dict(name='IWA Show', date='30.03.2002', promotion='99',
+                 matches=['Chris Hero defeats CM Punk'], workers='Chris Hero, CM Punk'),
+    '2007': dict(name='ROH Xtreme Night', date='23.02.2002', promotion='122',
+                 matches=['Xavier defeats Fleisch'], workers='Xavier, Fleisch'),
+    '2008': dict(name='AAA Triplemania XXV', date='26.08.2017', promotion='5',
+                 matches=['Dr. Wagner Jr. defeats Psycho Clown'], workers='Dr. Wagner Jr., Psycho Clown'),
+}
+# Promotion number to (name, current abbreviation, every abbreviation)
+PROMOTIONS = {
+    '122': ('Ring Of Honor', 'ROH', 'ROH, RoH'),
+    '99': ('IWA Mid-South', 'IWA-MS', 'IWA-MS, IWA'),
+    '5': ('Asistencia Asesoria y Administracion', 'AAA', 'AAA'),
+}
+EVENT_COMMENTS = 25
+MATCH_COMMENTS = 4
+WON_RATING = '****1/2'
+
+TITLES = [
+    "/movies/ROH - 2002-02-23 - The Era of Honor Begins/ROH - 2002-02-23 - The Era of Honor Begins.mkv",
+    "/movies/ROH - 2002-03-30 - Round Robin Challenge/ROH - 2002-03-30 - Round Robin Challenge.mkv",
+    "/movies/AAA - 2017-08-26 - Triplemania XXV/AAA - 2017-08-26 - Triplemania XXV.mkv",
+    "/movies/ROH - 2002-03-30 - M - Low Ki vs American Dragon.mkv",
+    "/movies/ROH - 2002-02-23 - M - Xavier vs Fleisch.mkv",
+    "/movies/IWA - 2002-03-30 - M - Chris Hero vs CM Punk.mkv",
+]
+
+FILLER = '<div class="Filler">' + ('lorem ipsum <span>dolor</span> ' * 400) + '</div>'
+
+
+def information_box(rows):
+    html = '<div class="InformationBoxTable">'
+    for title, contents in rows:
+        html += ('<div class="InformationBoxRow"><div class="InformationBoxTitle">%s:</div>'
+                 '<div class="InformationBoxContents">%s</div></div>') % (title, contents)
+    return html + '</div>'
+
+
+def page(body):
+    return '<html><head><title>CAGEMATCH</title></head><body>' + body + '</body></html>'
+
+
+def event_page(event_id, card=False):
+    event = EVENTS[event_id]
+    promotion_name = PROMOTIONS[event['promotion']][0]
+    rows = [('Name of the event', event['name']), ('Date', '<a href="?id=1&view=results&d=1">%s</a>' % event['date']),
+            ('Promotion', '<a href="?id=8&nr=%s">%s</a>' % (event['promotion'], promotion_name)), ('Type', 'Event'),
+            ('Location', 'Philadelphia, Pennsylvania, USA'), ('Arena', 'Murphy Rec Center')]
+    matches = '<div class="Matches">'
+    for index, text in enumerate(event['matches']):
+        if card:
+            text = text.replace('defeats', 'vs.')
+        matches += ('<div class="Match"><div class="MatchType">Singles</div><div class="MatchResults">%s</div>'
+                    '<div class="MatchRecommendedLine">:::: Matchguide Rating: %d.50 based on 3 votes '
+                    '<a href="?id=111&nr=%s%d">Discuss</a></div></div>') % (text, index + 5, event_id, index)
+    matches += '</div>'
+    return page(FILLER + information_box(rows) + FILLER +
+                '<div class="RatingsBox"><div class="RatingsBoxAdjustedRating Rating Color9">7.25</div></div>' + matches +
+                '<div class="Caption">All workers</div><div class="Comments Font9">%s</div>' % event['workers'] + FILLER)
+
+
+def comments_page(count):
+    comments = ''
+    for index in range(count):
+        comments += ('<div class="Comment"><div class="CommentHeader">user%d wrote on 01.01.2020:</div>'
+                     '<div class="CommentContents">[8.0] Great show number %d %s</div></div>') % (index, index, 'blah ' * 200)
+    return page(FILLER + comments + FILLER)
+
+
+def promotion_page(promotion_id):
+    name, current, abbreviations = PROMOTIONS[promotion_id]
+    return page(information_box([('Current name', name), ('Current abbreviation', current)]) +
+                information_box([('Names', name), ('Abbreviations', abbreviations)]))
+
+
+def matchguide_page():
+    return page(information_box([('Match', 'Singles'), ('WON rating', WON_RATING)]))
+
+
+def search_page(query, page_size):
+    """Events on the searched date (if any) whose names contain any of the searched words, like CAGEMATCH's search."""
+    words = query.get('sEventName', [''])[0].lower().split()
+    rows = []
+    for event_id, event in sorted(EVENTS.items()):
+        day, month, year = [int(part) for part in event['date'].split('.')]
+        if 'sDateTillDay' in query and (day, month, year) != (
+                int(query['sDateFromDay'][0]), int(query['sDateFromMonth'][0]), int(query['sDateFromYear'][0])):
+            continue
+        if words and not any(word in event['name'].lower() for word in words):
+            continue
+        rows.append((event_id, event))
+    start = int(query.get('s', ['0'])[0])
+    shown = rows[start:start + page_size]
+    if rows:
+        header = 'Displaying items %d to %d of total %d items that match the search parameters.' % (
+            start + 1, start + len(shown), len(rows))
+    else:
+        header = 'No items were found that match the search parameters.'
+    table = '<table class="TBase"><tr class="THeaderRow"><td>#</td><td>Date</td><td>Event</td></tr>'
+    for index, (event_id, event) in enumerate(shown):
+        table += ('<tr class="TRow1"><td class="TCol">%d</td><td class="TCol">%s</td><td class="TCol">'
+                  '<a href="?id=8&nr=%s"><img src="promotion.gif"/></a><a href="?id=1&nr=%s">%s</a></td></tr>') % (
+            start + index + 1, event['date'], event['promotion'], event_id, event['name'])
+    table += '</table>'
+    return page('<div class="TableHeaderOff" id="TableHeader">%s</div>%s' % (header, table))
+
+
+def build_page(relative_url, page_size=100):
+    """The page for a URL relative to the site root, as UTF-8 bytes, or None if there isn't one."""
+    query = parse_qs(urlparse("/" + relative_url).query)
+    page_id = query.get('id', [''])[0]
+    number = query.get('nr', [''])[0]
+    page_number = query.get('page', [''])[0]
+    if page_id == '1' and query.get('view') == ['search']:
+        body = search_page(query, page_size)
+    elif page_id == '1' and number in EVENTS:
+        if page_number == '2':
+            body = event_page(number, card=True)
+        elif page_number == '99':
+            body = comments_page(EVENT_COMMENTS)
+        else:
+            body = event_page(number)
+    elif page_id == '8' and number in PROMOTIONS:
+        body = promotion_page(number)
+    elif page_id == '111' and number:
+        body = comments_page(MATCH_COMMENTS) if page_number == '99' else matchguide_page()
+    else:
+        return None
+    return body if isinstance(body, bytes) else body.encode('utf-8')
+
+
+class SyntheticPages(object):
+    """Stands in for the dictionary of recorded pages, building each page when it is asked for."""
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def get(self, relative_url, default=None):
+        body = build_page(relative_url, self.page_size)
+        return default if body is None else body
+
+    def __len__(self):
+        return len(EVENTS)
+
+
+class SyntheticCorpus(object):
+    """The same interface as stub-server.py's Corpus, over the synthetic pages. `page_size` is the number of search results per page."""
+
+    def __init__(self, page_size=100):
+        self.pages = SyntheticPages(page_size)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'bytes': 0, 'misses': 0}
+
+    def record(self, body):
+        with self.lock:
+            self.stats['requests'] += 1
+            if body is None:
+                self.stats['misses'] += 1
+            else:
+                self.stats['bytes'] += len(body)
+
+
+def write_pages(directory):
+    """Save one page of each type to `directory`, named after its type, for parsing-benchmark.py."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    samples = {
+        'event': "?id=1&nr=2004", 'card': "?id=1&nr=2004&page=2", 'reviews': "?id=1&nr=2004&page=99",
+        'promotion': "?id=8&nr=122", 'matchguide': "?id=111&nr=20040",
+        'search': "?id=1&view=search&sEventName=ROH&sDateFromDay=01&sDateFromMonth=01&sDateFromYear=1887",
+    }
+    for page_type, relative_url in sorted(samples.items()):
+        with open(os.path.join(directory, page_type + ".html"), "wb") as page_file:
+            page_file.write(build_page(relative_url))
+        print("Wrote " + os.path.join(directory, page_type + ".html"))
+
+
+if __name__ == "__main__":
+    write_pages(sys.argv[1] if len(sys.argv) > 1 else "pages")
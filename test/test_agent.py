@@ -0,0 +1,150 @@
+"""End to end: search and update every synthetic title through the agent, against synthetic_site.py served by stub-server.py."""
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+import plex_shim
+import synthetic_site
+
+stub_server = support.load_script("stub-server")
+
+EXPECTED_IDS = ['2004', '2005', '2008', '2005:1', '2007:1', '2006:1']
+PREFS = {'requestsPerSecond': '100', 'backgroundRefresh': False, 'reviewCount': '3'}
+
+
+class QuietStubServer(stub_server.StubServer):
+    """The agent closes connections once it has read enough of a page, which the server would otherwise report."""
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class AgentTestCase(unittest.TestCase):
+    """Runs the agent against its own synthetic site and data directory, showing `page_size` search results a page."""
+    page_size = 100
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp()
+        cls.server = QuietStubServer(corpus=synthetic_site.SyntheticCorpus(cls.page_size))
+        server_url = cls.server.start()
+        cls.agent_module = plex_shim.load_agent(cls.data_dir, PREFS)
+        cls.agent_module.CM_MAIN_URL = server_url
+        cls.agent = cls.agent_module.Cagent_Movie()
+
+    @classmethod
+    def tearDownClass(cls):
+        import url_loading
+        # Close the agent's keep-alive connections, so the server's threads end with it
+        session, _ = url_loading.get_session()
+        session.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.data_dir, True)
+
+    def setUp(self):
+        plex_shim.install_globals(self.data_dir, PREFS)
+
+
+class AgentTest(AgentTestCase):
+
+    def run_titles(self):
+        results = []
+        for path in synthetic_site.TITLES:
+            search_results = plex_shim.SearchResults()
+            self.agent.search(search_results, plex_shim.Media.from_path(path), "en", False)
+            best = search_results.best()
+            metadata = plex_shim.Metadata(best.id)
+            self.agent.update(metadata, None, "en", False)
+            results.append(metadata.to_dict())
+        return results
+
+    def test_cold_then_warm(self):
+        self.server.corpus.reset()
+        cold = self.run_titles()
+        self.assertEqual([metadata['id'] for metadata in cold], EXPECTED_IDS)
+        self.assertGreater(self.server.corpus.stats['requests'], 0)
+        self.assertEqual(self.server.corpus.stats['misses'], 0)
+
+        event = cold[0]
+        self.assertEqual(event['title'], "ROH The Era Of Honor Begins")
+        self.assertEqual(event['studio'], "Ring Of Honor")
+        self.assertEqual(len(event['reviews']), 3)
+        self.assertIn("\nAmazing Red vs. Xavier\n", event['summary'])
+        self.assertEqual(event['roles'], [worker.strip() for worker in synthetic_site.EVENTS['2004']['workers'].split(",")])
+
+        match = cold[4]
+        self.assertEqual(sorted(match['roles']), ["Fleisch", "Xavier"])
+        self.assertEqual(match['title'], "Xavier vs. Fleisch")
+        # The WON rating from the matchguide comes first, then the match's comments
+        self.assertEqual([author for author, _ in match['reviews']], ["Dave Meltzer", "user0", "user1"])
+
+        # Everything is cached now, so a second pass gives the same metadata without asking the site
+        self.server.corpus.reset()
+        self.assertEqual(self.run_titles(), cold)
+        self.assertEqual(self.server.corpus.stats['requests'], 0)
+        # The metadata never went to Plex, so no fingerprints of it are kept
+        self.assertEqual([name for name in os.listdir(self.data_dir) if name.startswith("fingerprint-")], [])
+
+
+class SearchPlanTest(AgentTestCase):
+
+    def search(self, path):
+        search_results = plex_shim.SearchResults()
+        self.agent.search(search_results, plex_shim.Media.from_path(path), "en", False)
+        return search_results.best().id
+
+    def test_found_on_its_date(self):
+        self.server.corpus.reset()
+        self.assertEqual(self.search("/movies/ROH - 2002-03-30 - Round Robin Challenge.mkv"), '2005')
+        # Found by the first search, so nothing more is asked
+        self.assertEqual(self.server.corpus.stats['requests'], 1)
+
+    def test_wrong_date_falls_back_to_the_name(self):
+        # Other events on the date don't stop the search before it looks for the name alone
+        self.assertEqual(self.search("/movies/AAA - 2002-03-30 - Triplemania XXV.mkv"), '2008')
+
+    def test_searches_that_found_nothing_are_asked_again_later(self):
+        import search_planning
+        strategy = search_planning.SearchStrategy("date and promotion", "Nothing", datetime.date(2002, 2, 23))
+        # Without the page cache, which would answer the search again for a day
+        plex_shim.install_globals(self.data_dir, dict(PREFS, cacheSizeMB='0'))
+        self.server.corpus.reset()
+        for _ in range(2):
+            self.assertEqual(self.agent.run_search_strategy(strategy, "Nothing", False), [])
+        self.assertEqual(self.server.corpus.stats['requests'], 1)
+        # Once the negative cache has forgotten it, the site is asked again
+        with search_planning.negative_searches._lock:
+            search_planning.negative_searches._entries = {}
+        self.assertEqual(self.agent.run_search_strategy(strategy, "Nothing", False), [])
+        self.assertEqual(self.server.corpus.stats['requests'], 2)
+
+
+class SearchPagesTest(AgentTestCase):
+    page_size = 1
+
+    def read_search(self, search_mode, score_str):
+        plex_shim.install_globals(self.data_dir, dict(PREFS, searchMode=search_mode, cacheSizeMB='0'))
+        return [row['id'] for row in self.agent.read_event_search("", None, score_str)]
+
+    def test_first_page_only(self):
+        self.assertEqual(self.read_search(self.agent_module.SEARCH_MODE_FIRST_PAGE, "AAA Triplemania XXV"), ['2004'])
+
+    def test_until_confident(self):
+        mode = self.agent_module.SEARCH_MODE_UNTIL_CONFIDENT
+        self.assertEqual(self.read_search(mode, "ROH Round Robin Challenge"), ['2004', '2005'])
+        self.assertEqual(self.read_search(mode, "AAA Triplemania XXV"), sorted(synthetic_site.EVENTS))
+
+    def test_unscored_searches_read_a_few_pages(self):
+        self.assertEqual(len(self.read_search(self.agent_module.SEARCH_MODE_UNTIL_CONFIDENT, None)),
+                         self.agent_module.UNSCORED_SEARCH_PAGES)
+
+    def test_every_page(self):
+        self.assertEqual(self.read_search(self.agent_module.SEARCH_MODE_EVERY_PAGE, None), sorted(synthetic_site.EVENTS))
+
+
+if __name__ == "__main__":
+    unittest.main()
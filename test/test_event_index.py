@@ -0,0 +1,82 @@
+"""The event index may only answer a search it has seen every result of."""
+import datetime
+import unittest
+
+import support
+import event_index
+from event_index import EventIndex, get_search_key
+
+PAST_DATE = datetime.date(2002, 2, 23)
+ROWS = [{'id': '2004', 'name': 'ROH The Era Of Honor Begins', 'year': '2002', 'month': '02', 'day': '23'},
+        {'id': '2007', 'name': 'ROH Xtreme Night', 'year': '2002', 'month': '02', 'day': '23'}]
+
+
+class EventIndexTest(support.DataTestCase):
+
+    def test_unknown_searches_go_to_the_site(self):
+        index = EventIndex()
+        index.add_search("ROH Xtreme Night", PAST_DATE, ROWS)
+        self.assertIsNone(index.find_events("ROH The Era Of Honor Begins", PAST_DATE))
+        self.assertIsNone(index.find_events("ROH", PAST_DATE))
+
+    def test_remembered_search_gives_every_result(self):
+        index = EventIndex()
+        index.add_search("ROH Xtreme Night", PAST_DATE, ROWS)
+        self.assertEqual(index.find_events("ROH Xtreme Night", PAST_DATE), ROWS)
+        # Only spacing and case can differ, as any other change could change the site's results
+        self.assertEqual(index.find_events(" roh  XTREME night", PAST_DATE), ROWS)
+        self.assertIsNone(index.find_events("ROH Xtreme", PAST_DATE))
+        self.assertIsNone(index.find_events("Night Xtreme ROH", PAST_DATE))
+        self.assertIsNone(index.find_events("ROH Xtreme Night", PAST_DATE + datetime.timedelta(days=1)))
+
+    def test_search_with_no_results_is_not_remembered(self):
+        index = EventIndex()
+        index.add_search("Nothing", PAST_DATE, [])
+        self.assertIsNone(index.find_events("Nothing", PAST_DATE))
+
+    def test_recent_searches_are_not_remembered(self):
+        index = EventIndex()
+        index.add_search("ROH Xtreme Night", datetime.date.today(), ROWS)
+        self.assertIsNone(index.find_events("ROH Xtreme Night", datetime.date.today()))
+
+    def test_searches_expire(self):
+        index = EventIndex()
+        index.add_search("ROH Xtreme Night", PAST_DATE, ROWS)
+        index.add_search("ROH The Era Of Honor Begins", PAST_DATE, ROWS[:1])
+        with index._lock:
+            index._searches[get_search_key("ROH Xtreme Night", PAST_DATE)]['stored'] -= event_index.SEARCH_TTL + 60
+        self.assertIsNone(index.find_events("ROH Xtreme Night", PAST_DATE))
+        # Once saved, only the events of searches still remembered are kept
+        index._save()
+        self.assertEqual(EventIndex().export(), ({'2004': {'id': '2004', 'name': ROWS[0]['name'], 'date': '2002-02-23'}},
+                                                 {get_search_key("ROH The Era Of Honor Begins", PAST_DATE): index._searches[
+                                                     get_search_key("ROH The Era Of Honor Begins", PAST_DATE)]}))
+
+    def test_merge_keeps_the_later_search(self):
+        index = EventIndex()
+        index.add_search("ROH Xtreme Night", PAST_DATE, ROWS[:1])
+        events, searches = index.export()
+        key = get_search_key("ROH Xtreme Night", PAST_DATE)
+        other = EventIndex()
+        other.add_search("ROH Xtreme Night", PAST_DATE, ROWS)
+        other_events, other_searches = other.export()
+        other_searches[key] = dict(other_searches[key], stored=searches[key]['stored'] + 1)
+
+        # The search and the event it has that ours doesn't
+        self.assertEqual(index.merge(other_events, other_searches), 2)
+        self.assertEqual(index.find_events("ROH Xtreme Night", PAST_DATE), ROWS)
+        self.assertEqual(index.merge(events, searches), 0)
+        self.assertEqual(index.find_events("ROH Xtreme Night", PAST_DATE), ROWS)
+        # Nor are expired searches taken
+        searches[key] = dict(searches[key], stored=searches[key]['stored'] - event_index.SEARCH_TTL - 60)
+        self.assertEqual(EventIndex().merge(events, searches), 0)
+
+    def test_searches_are_saved(self):
+        index = EventIndex()
+        index.add_search("ROH Xtreme Night", PAST_DATE, ROWS)
+        index._save()
+        self.assertEqual(EventIndex().find_events("ROH Xtreme Night", PAST_DATE), ROWS)
+
+
+if __name__ == "__main__":
+    unittest.main()
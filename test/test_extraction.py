@@ -0,0 +1,142 @@
+"""extraction.py has to find what a full parse of each page would, and DivCounter has to stop reading in the same place however the page is split up."""
+import unittest
+
+import support
+import extraction
+import url_loading
+import synthetic_site
+from bs4 import BeautifulSoup
+
+CHUNK_SIZES = (1, 7, 100, 4096, 16 * 1024, 10 ** 7)
+
+
+def full_parse(raw_html):
+    return BeautifulSoup(raw_html, 'html.parser')
+
+
+def to_json(records):
+    return [record.to_json() for record in records]
+
+
+class FakeResponse(object):
+    """A streamed response, counting how many chunks of it have been read."""
+
+    def __init__(self, body, chunk_size):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.url = "http://example.com/"
+        self.chunks_read = 0
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), self.chunk_size):
+            self.chunks_read += 1
+            yield self.body[start:start + self.chunk_size]
+
+
+class ParsingTest(unittest.TestCase):
+
+    def test_event_page_matches_full_parse(self):
+        raw_html = synthetic_site.build_page("?id=1&nr=2004")
+        html = full_parse(raw_html)
+        event = extraction.parse_event_page(raw_html)
+        self.assertEqual(event.info, extraction.get_dict_from_table(html.find("div", {"class": extraction.INFORMATION_BOX_CLASS})))
+        self.assertEqual(to_json(event.matches), to_json(extraction.get_match_entries(html)))
+        self.assertEqual(event.rating, str(html.find("div", {"class": extraction.RATING_CLASS}).string))
+        self.assertEqual(event.workers, [worker.strip() for worker in html.find("div", {"class": extraction.WORKERS_CLASS}).text.split(",")])
+        self.assertEqual(len(event.matches), 3)
+        self.assertEqual(event.info['Promotion']['link'], "?id=8&nr=122")
+
+    def test_card_page_matches_full_parse(self):
+        raw_html = synthetic_site.build_page("?id=1&nr=2004&page=2")
+        card = extraction.parse_card_page(raw_html)
+        self.assertEqual(to_json(card.matches), to_json(extraction.get_match_entries(full_parse(raw_html))))
+        self.assertEqual(card.matches[1].text, "Amazing Red vs. Xavier")
+
+    def test_reviews_page_matches_full_parse(self):
+        raw_html = synthetic_site.build_page("?id=1&nr=2004&page=99")
+        reviews = extraction.parse_reviews_page(raw_html).comments
+        expected = [(comment.find("div", {"class": "CommentHeader"}).text.split(" wrote on ")[0],
+                     comment.find("div", {"class": "CommentContents"}).text)
+                    for comment in full_parse(raw_html).find_all("div", {"class": extraction.COMMENT_CLASS})]
+        self.assertEqual([(review.author, review.text) for review in reviews], expected)
+        self.assertEqual(len(reviews), synthetic_site.EVENT_COMMENTS)
+
+    def test_promotion_page_matches_full_parse(self):
+        raw_html = synthetic_site.build_page("?id=8&nr=122")
+        tables = full_parse(raw_html).find_all("div", {"class": extraction.INFORMATION_BOX_CLASS})
+        expected = extraction.get_dict_from_table(tables[0])
+        expected.update(extraction.get_dict_from_table(tables[1]))
+        self.assertEqual(extraction.parse_promotion_page(raw_html).info, expected)
+
+    def test_search_page_matches_full_parse(self):
+        raw_html = synthetic_site.build_page("?id=1&view=search&sEventName=ROH")
+        search = extraction.parse_search_page(raw_html)
+        html = full_parse(raw_html)
+        expected = [extraction.parse_search_result_row(row) for row in html.find('table').find_all('tr', class_=lambda x: x != 'THeaderRow')]
+        self.assertEqual(search.rows, [row for row in expected if row is not None])
+        self.assertEqual(search.counts, extraction.parse_search_result_counts(html))
+        self.assertEqual([row['id'] for row in search.rows], ['2004', '2005', '2007'])
+
+    def test_empty_search_page(self):
+        search = extraction.parse_search_page(synthetic_site.build_page("?id=1&view=search&sEventName=Nothing"))
+        self.assertEqual(search.counts['total'], 0)
+        self.assertEqual(search.rows, [])
+
+
+class DivCounterTest(unittest.TestCase):
+
+    def feed(self, body, scanner, chunk_size):
+        scanner.reset()
+        for start in range(0, len(body), chunk_size):
+            scanner.feed(body[start:start + chunk_size])
+            if scanner.done:
+                break
+        return scanner.count, scanner.done, scanner.end
+
+    def test_stops_in_the_same_place_for_every_chunk_size(self):
+        body = synthetic_site.build_page("?id=1&nr=2004&page=99")
+        for wanted in (1, 3, synthetic_site.EVENT_COMMENTS):
+            results = set(self.feed(body, extraction.DivCounter(extraction.COMMENT_CLASS, wanted), size) for size in CHUNK_SIZES)
+            self.assertEqual(len(results), 1, results)
+            count, done, end = results.pop()
+            self.assertEqual((count, done), (wanted, True))
+            # The page up to `end` holds exactly the first `wanted` comments
+            reviews = extraction.parse_reviews_page(body[:end]).comments
+            expected = extraction.parse_reviews_page(body).comments[:wanted]
+            self.assertEqual(to_json(reviews), to_json(expected))
+
+    def test_not_done_when_the_page_has_too_few(self):
+        body = synthetic_site.build_page("?id=111&nr=20040&page=99")
+        for size in CHUNK_SIZES:
+            count, done, _ = self.feed(body, extraction.DivCounter(extraction.COMMENT_CLASS, 10), size)
+            self.assertEqual((count, done), (synthetic_site.MATCH_COMMENTS, False))
+
+    def test_counts_nested_divs_once(self):
+        body = '<div class="Comment"><div><div class="Comment">inner</div></div></div><div class="Other"></div><div class="Comment"></div>'
+        for size in CHUNK_SIZES:
+            self.assertEqual(self.feed(body, extraction.DivCounter(extraction.COMMENT_CLASS, 5), size)[0], 2)
+
+    def test_needs_every_part_of_the_class(self):
+        body = '<div class="InformationBox"></div><div class="Box InformationBoxTable x"></div>'
+        counter = extraction.DivCounter(extraction.INFORMATION_BOX_CLASS, 1)
+        self.assertEqual(self.feed(body, counter, 3), (1, True, len(body)))
+
+    def test_reading_stops_early(self):
+        body = synthetic_site.build_page("?id=1&nr=2004&page=99")
+        for chunk_size in (1024, url_loading.STREAM_CHUNK_SIZE):
+            response = FakeResponse(body, chunk_size)
+            scanner = extraction.DivCounter(extraction.COMMENT_CLASS, 3)
+            partial, complete = url_loading.read_until_done(response, scanner)
+            self.assertFalse(complete)
+            self.assertEqual(partial, body[:scanner.end])
+            self.assertLess(response.chunks_read, (len(body) + chunk_size - 1) // chunk_size)
+
+    def test_reading_a_page_with_too_few_is_complete(self):
+        body = synthetic_site.build_page("?id=111&nr=20040&page=99")
+        partial, complete = url_loading.read_until_done(FakeResponse(body, 1024), extraction.DivCounter(extraction.COMMENT_CLASS, 10))
+        self.assertTrue(complete)
+        self.assertEqual(partial, body)
+
+
+if __name__ == "__main__":
+    unittest.main()
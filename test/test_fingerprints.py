@@ -0,0 +1,52 @@
+"""Fingerprints may only skip sections that Plex already has."""
+import os
+import unittest
+
+import support
+from fingerprints import Fingerprint
+
+
+def write(item_id, current_title, title, sections, force=False):
+    """Update an item the way the agent does, returning the sections that needed writing."""
+    fingerprint = Fingerprint(item_id, current_title, force)
+    written = [section for section, value in sorted(sections.items()) if fingerprint.changed(section, value)]
+    fingerprint.title = title
+    fingerprint.save()
+    return written
+
+
+class FingerprintTest(support.DataTestCase):
+    SECTIONS = {'title': "ROH The Era Of Honor Begins", 'rating': "7.25", 'roles': ["Low Ki", "Xavier"]}
+
+    def test_unchanged_sections_are_skipped(self):
+        self.assertEqual(write('2004', None, self.SECTIONS['title'], self.SECTIONS), sorted(self.SECTIONS))
+        self.assertEqual(write('2004', self.SECTIONS['title'], self.SECTIONS['title'], self.SECTIONS), [])
+        changed = dict(self.SECTIONS, rating="7.5")
+        self.assertEqual(write('2004', self.SECTIONS['title'], self.SECTIONS['title'], changed), ['rating'])
+
+    def test_force_rewrites_everything(self):
+        write('2004', None, self.SECTIONS['title'], self.SECTIONS)
+        self.assertEqual(write('2004', self.SECTIONS['title'], self.SECTIONS['title'], self.SECTIONS, force=True),
+                         sorted(self.SECTIONS))
+
+    def test_another_title_rewrites_everything(self):
+        write('2004', None, self.SECTIONS['title'], self.SECTIONS)
+        self.assertEqual(write('2004', "2004", self.SECTIONS['title'], self.SECTIONS), sorted(self.SECTIONS))
+
+    def test_item_without_a_title_rewrites_everything(self):
+        # Even if a fingerprint was saved for it, an item with no title never got what we wrote
+        write('2004', None, self.SECTIONS['title'], self.SECTIONS)
+        self.assertEqual(write('2004', None, self.SECTIONS['title'], self.SECTIONS), sorted(self.SECTIONS))
+
+    def test_nothing_saved_without_a_title(self):
+        write('2004:1', None, None, self.SECTIONS)
+        self.assertIsNone(Data.Load(Fingerprint('2004:1').key))
+
+    def test_not_saved_to_disk_outside_plex(self):
+        write('2004:1', None, "Xavier vs. Fleisch", self.SECTIONS)
+        self.assertIsNotNone(Data.Load(Fingerprint('2004:1').key))
+        self.assertEqual(os.listdir(self.data_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""The page cache has to stay within its size limit, keep count of its size as it goes, and stay out of the way when turned off."""
+import os
+import unittest
+
+import support
+import plex_shim
+import http_cache
+from http_cache import ResponseCache, get_body_key
+
+EVENT_URL = "https://www.cagematch.net/?id=1&nr=%d"
+KB = 1024
+
+
+def page(size):
+    return b"<html>" + b"x" * (size - 13) + b"</html>"
+
+
+class ResponseCacheTest(support.DataTestCase):
+    prefs = {'cacheSizeMB': '1'}
+
+    def assertTotalIsRight(self, cache):
+        with cache._lock:
+            self.assertEqual(cache._total_bytes, sum(entry['size'] for entry in cache._entries.values()))
+
+    def test_get_what_was_put(self):
+        cache = ResponseCache()
+        cache.put(EVENT_URL % 1, page(KB), etag='"abc"')
+        self.assertEqual(cache.get(EVENT_URL % 1), page(KB))
+        self.assertIsNone(cache.get(EVENT_URL % 2))
+        self.assertEqual(cache.get_revalidation_headers(EVENT_URL % 1), {'If-None-Match': '"abc"'})
+        self.assertEqual(cache.stats()['bytes'], KB)
+
+    def test_running_total(self):
+        cache = ResponseCache()
+        for number in range(5):
+            cache.put(EVENT_URL % number, page(KB * (number + 1)))
+        self.assertEqual(cache.stats()['bytes'], 15 * KB)
+        # Replacing a page counts only its new size
+        cache.put(EVENT_URL % 0, page(10 * KB))
+        self.assertEqual(cache.stats()['bytes'], 24 * KB)
+        # A page whose body has gone missing is dropped
+        Data.Remove(get_body_key(EVENT_URL % 1))
+        self.assertIsNone(cache.get(EVENT_URL % 1))
+        self.assertEqual(cache.stats()['bytes'], 22 * KB)
+        self.assertIsNone(cache.refresh(EVENT_URL % 1))
+        self.assertTotalIsRight(cache)
+        cache._save()
+        self.assertEqual(ResponseCache().stats()['bytes'], 22 * KB)
+
+    def test_evicts_least_recently_used_down_to_target(self):
+        cache = ResponseCache()
+        size = 300 * KB
+        for number in range(3):
+            cache.put(EVENT_URL % number, page(size))
+        cache.get(EVENT_URL % 0)
+        cache.put(EVENT_URL % 3, page(size))
+        self.assertIsNone(cache.get(EVENT_URL % 1))
+        for number in (0, 2, 3):
+            self.assertIsNotNone(cache.get(EVENT_URL % number))
+        self.assertFalse(Data.Exists(get_body_key(EVENT_URL % 1)))
+        stats = cache.stats()
+        self.assertLessEqual(stats['bytes'], 1024 * KB * http_cache.EVICTION_TARGET)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertTotalIsRight(cache)
+
+    def test_stores_are_saved_straight_away(self):
+        cache = ResponseCache()
+        for number in range(10):
+            cache.put(EVENT_URL % number, page(KB))
+        # As if the plugin host had restarted, without the cache saving anything more
+        self.assertEqual(ResponseCache().stats()['entries'], 10)
+
+    def test_access_time_saves_are_batched(self):
+        cache = ResponseCache()
+        cache.put(EVENT_URL % 1, page(KB))
+        saves = []
+        save = Data.Save
+        Data.Save = lambda item, data: (saves.append(item), save(item, data))
+        try:
+            for _ in range(http_cache.INDEX_SAVE_INTERVAL * 2):
+                cache.get(EVENT_URL % 1)
+        finally:
+            Data.Save = save
+        self.assertEqual(saves.count(http_cache.INDEX_KEY), 2)
+
+    def test_size_zero_turns_the_cache_off(self):
+        cache = ResponseCache()
+        cache.put(EVENT_URL % 1, page(KB), etag='"abc"')
+        plex_shim.install_globals(self.data_dir, {'cacheSizeMB': '0'})
+        self.assertIsNone(cache.get(EVENT_URL % 1))
+        self.assertIsNone(cache.get_stale(EVENT_URL % 1, 3600))
+        self.assertIsNone(cache.get_revalidation_headers(EVENT_URL % 1))
+        self.assertEqual(cache.pop_entries_expiring(float("inf")), [])
+        cache.put(EVENT_URL % 2, page(KB))
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual([name for name in os.listdir(self.data_dir) if name != http_cache.INDEX_KEY], [])
+
+        # Turned back on, it starts empty
+        plex_shim.install_globals(self.data_dir, self.prefs)
+        self.assertIsNone(cache.get(EVENT_URL % 1))
+        self.assertIsNone(ResponseCache().get(EVENT_URL % 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Promotion slugs have to be removed the same way whether they were just read or loaded from the cache."""
+import json
+import time
+import unittest
+
+import support
+import promotion_cache
+from promotion_cache import PromotionSlugs
+
+AAA_LINK = "?id=8&nr=5"
+
+
+class PromotionSlugsTest(support.DataTestCase):
+
+    def reload(self, slugs):
+        return PromotionSlugs.from_json(json.loads(json.dumps(slugs.to_json())))
+
+    def test_removes_slugs(self):
+        slugs = PromotionSlugs("NJPW", ["NJPW", "NJ", "NJPW/ROH"], time.time())
+        self.assertEqual(slugs.remove_from("NJPW Wrestle Kingdom 11"), " Wrestle Kingdom 11")
+        self.assertEqual(slugs.remove_from("NJPW/ROH Global Wars"), "ROH Global Wars")
+        self.assertEqual(slugs.remove_from("ROH Global Wars"), "ROH Global Wars")
+
+    def test_reloaded_slugs_are_byte_strings(self):
+        slugs = self.reload(PromotionSlugs("AAA", ["AAA", "Lucha Libre Élite"], time.time()))
+        self.assertTrue(all(isinstance(slug, str) for slug in [slugs.current_slug] + slugs.slugs))
+        # Mixing unicode slugs with a non-ASCII byte string event name would fail to decode it
+        self.assertEqual(slugs.remove_from("AAA Triplemanía XXV"), " Triplemanía XXV")
+        self.assertEqual(slugs.remove_from("Lucha Libre Élite Show"), " Show")
+
+    def test_loaded_from_the_data_directory(self):
+        cache = promotion_cache.PromotionCache()
+        cache.merge({AAA_LINK: PromotionSlugs("AAA", ["AAA"], time.time()).to_json()})
+        slugs = promotion_cache.PromotionCache().peek(AAA_LINK)
+        self.assertIsInstance(slugs.current_slug, str)
+        self.assertEqual(slugs.remove_from("AAA Triplemanía XXV"), " Triplemanía XXV")
+
+
+if __name__ == "__main__":
+    unittest.main()
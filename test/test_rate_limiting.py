@@ -0,0 +1,72 @@
+"""Retries have to back off, and the shared request rate has to fall when the site pushes back and recover when it doesn't, never above the preference."""
+import time
+import unittest
+
+import support
+import plex_shim
+import rate_limiting
+from rate_limiting import AdaptiveRateLimiter, get_backoff_delay
+
+
+class BackoffTest(unittest.TestCase):
+
+    def test_doubles_with_jitter(self):
+        for attempt in range(4):
+            delay = rate_limiting.BASE_BACKOFF_SECONDS * 2 ** attempt
+            for _ in range(20):
+                self.assertTrue(delay / 2 <= get_backoff_delay(attempt) <= delay)
+
+    def test_capped(self):
+        self.assertLessEqual(get_backoff_delay(20), rate_limiting.MAX_BACKOFF_SECONDS)
+
+    def test_retry_after(self):
+        self.assertGreaterEqual(get_backoff_delay(0, "10"), 10)
+        self.assertEqual(get_backoff_delay(0, "3600"), rate_limiting.MAX_BACKOFF_SECONDS)
+        # Dates aren't understood, so the usual delay is used
+        self.assertLessEqual(get_backoff_delay(0, "Wed, 21 Oct 2015 07:28:00 GMT"), rate_limiting.BASE_BACKOFF_SECONDS)
+
+
+class RateLimiterTest(support.DataTestCase):
+    prefs = {'requestsPerSecond': '2'}
+
+    def test_throttling_halves_the_rate_down_to_the_minimum(self):
+        limiter = AdaptiveRateLimiter()
+        limiter.record_throttled()
+        self.assertAlmostEqual(limiter._rate, 1.0)
+        for _ in range(10):
+            limiter.record_throttled()
+        self.assertEqual(limiter._rate, rate_limiting.MIN_REQUESTS_PER_SECOND)
+
+    def test_recovers_up_to_the_preference(self):
+        limiter = AdaptiveRateLimiter()
+        limiter.record_throttled()
+        limiter.record_success(0.1)
+        self.assertAlmostEqual(limiter._rate, 1.0 + rate_limiting.RATE_INCREASE_STEP)
+        for _ in range(20):
+            limiter.record_success(0.1)
+        self.assertEqual(limiter._rate, 2.0)
+
+    def test_slow_responses_ease_off(self):
+        limiter = AdaptiveRateLimiter()
+        limiter.record_success(rate_limiting.SLOW_LATENCY_SECONDS * 2)
+        self.assertAlmostEqual(limiter._rate, 2.0 * rate_limiting.SLOW_RATE_FACTOR)
+
+    def test_lowered_preference_applies_at_once(self):
+        limiter = AdaptiveRateLimiter()
+        limiter.record_success(0.1)
+        plex_shim.install_globals(self.data_dir, {'requestsPerSecond': '0.5'})
+        limiter.record_success(0.1)
+        self.assertEqual(limiter._rate, 0.5)
+
+    def test_acquire_keeps_to_the_rate(self):
+        plex_shim.install_globals(self.data_dir, {'requestsPerSecond': '10'})
+        limiter = AdaptiveRateLimiter()
+        start = time.time()
+        for _ in range(5):
+            limiter.acquire()
+        # The bucket starts with one token, and refills at ten a second
+        self.assertGreater(time.time() - start, 0.35)
+
+
+if __name__ == "__main__":
+    unittest.main()
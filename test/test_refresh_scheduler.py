@@ -0,0 +1,117 @@
+"""The background refresher should only look at pages as they come due, and only serve pages stale for as long as suits them."""
+import time
+import unittest
+
+import support
+import http_cache
+import refresh_scheduler
+from http_cache import ResponseCache, DAY
+
+SEARCH_URL = "https://www.cagematch.net/?id=1&view=search&sEventName=ROH"
+EVENT_URL = "https://www.cagematch.net/?id=1&nr=%d"
+PAST_EVENT_PAGE = b'<div class="InformationBoxTitle">Date:</div><div class="InformationBoxContents">23.02.2002</div>'
+
+
+def age(cache, url, expired_seconds_ago, accessed_seconds_ago=0):
+    """Make the cached page for `url` look as if it expired `expired_seconds_ago`."""
+    now = time.time()
+    with cache._lock:
+        entry = cache._entries[url]
+        ttl = entry['expires'] - entry['stored']
+        entry['expires'] = now - expired_seconds_ago
+        entry['stored'] = entry['expires'] - ttl
+        entry['accessed'] = now - accessed_seconds_ago
+        cache._build_expiry_heap()
+
+
+class StaleTest(support.DataTestCase):
+
+    def test_pages_are_served_stale_at_most_as_long_as_they_were_cached(self):
+        cache = ResponseCache()
+        cache.put(SEARCH_URL, b"search")
+        cache.put(EVENT_URL % 1, PAST_EVENT_PAGE)
+        max_stale = refresh_scheduler.MAX_STALE_SECONDS
+        age(cache, SEARCH_URL, DAY - 60)
+        self.assertEqual(cache.get_stale(SEARCH_URL, max_stale), b"search")
+        age(cache, SEARCH_URL, DAY + 60)
+        self.assertIsNone(cache.get_stale(SEARCH_URL, max_stale))
+        age(cache, EVENT_URL % 1, 2 * DAY)
+        self.assertEqual(cache.get_stale(EVENT_URL % 1, max_stale), PAST_EVENT_PAGE)
+        age(cache, EVENT_URL % 1, max_stale + 60)
+        self.assertIsNone(cache.get_stale(EVENT_URL % 1, max_stale))
+
+
+class DueTest(support.DataTestCase):
+
+    def setUp(self):
+        support.DataTestCase.setUp(self)
+        self.cache = ResponseCache()
+        self.original_cache = refresh_scheduler.response_cache
+        refresh_scheduler.response_cache = self.cache
+        self.scheduler = refresh_scheduler.RefreshScheduler()
+
+    def tearDown(self):
+        refresh_scheduler.response_cache = self.original_cache
+        support.DataTestCase.tearDown(self)
+
+    def test_entries_come_due_once(self):
+        for number in range(3):
+            self.cache.put(EVENT_URL % number, b"page")
+        age(self.cache, EVENT_URL % 1, 60)
+        soon = time.time() + 60
+        self.assertEqual([url for url, _ in self.cache.pop_entries_expiring(soon)], [EVENT_URL % 1])
+        self.assertEqual(self.cache.pop_entries_expiring(soon), [])
+        # Once revalidated, it comes due again when it next expires
+        self.cache.refresh(EVENT_URL % 1)
+        self.assertEqual(sorted(url for url, _ in self.cache.pop_entries_expiring(time.time() + 2 * DAY)),
+                         [EVENT_URL % number for number in range(3)])
+
+    def test_only_pages_in_use_are_refreshed(self):
+        self.cache.put(SEARCH_URL, b"search")
+        self.cache.put(EVENT_URL % 1, b"hot")
+        self.cache.put(EVENT_URL % 2, b"cold")
+        self.cache.put(EVENT_URL % 3, b"fresh")
+        age(self.cache, SEARCH_URL, 60)
+        age(self.cache, EVENT_URL % 1, -60)
+        age(self.cache, EVENT_URL % 2, 60, accessed_seconds_ago=3 * DAY)
+        self.assertEqual(sorted(self.scheduler._get_urls()), sorted([SEARCH_URL, EVENT_URL % 1]))
+        # Pages not refreshed yet are kept for the next round
+        self.assertEqual(sorted(self.scheduler._get_urls()), sorted([SEARCH_URL, EVENT_URL % 1]))
+
+    def test_requested_pages_come_first(self):
+        for number in range(refresh_scheduler.PAGES_PER_ROUND + 2):
+            self.cache.put(EVENT_URL % number, b"page")
+            age(self.cache, EVENT_URL % number, 60)
+        self.scheduler.request(SEARCH_URL)
+        urls = self.scheduler._get_urls()
+        self.assertEqual(len(urls), refresh_scheduler.PAGES_PER_ROUND)
+        self.assertEqual(urls[0], SEARCH_URL)
+
+    def test_refreshed_and_failed_pages_are_dropped(self):
+        self.cache.put(EVENT_URL % 1, b"ok")
+        self.cache.put(EVENT_URL % 2, b"fails")
+        self.cache.put(EVENT_URL % 3, b"fetched elsewhere")
+        self.cache.put(EVENT_URL % 4, b"evicted")
+        for number in range(1, 5):
+            age(self.cache, EVENT_URL % number, 60)
+        self.assertEqual(len(self.scheduler._get_urls()), 4)
+        self.cache.put(EVENT_URL % 3, b"fetched elsewhere")
+        with self.cache._lock:
+            self.cache._remove(EVENT_URL % 4)
+
+        refreshed = []
+
+        def refresh_page(url):
+            refreshed.append(url)
+            return url != EVENT_URL % 2 and self.cache.refresh(url) is not None
+
+        self.scheduler._refresh_page = refresh_page
+        self.scheduler._refresh_round()
+        self.assertEqual(sorted(refreshed), [EVENT_URL % 1, EVENT_URL % 2])
+        # The failed page waits a while before it is tried again, and nothing else is left to do
+        self.assertEqual(self.scheduler._get_urls(), [])
+        self.assertEqual(list(self.scheduler._due), [EVENT_URL % 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
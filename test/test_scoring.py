@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""scoring.py has to give exactly the scores and order fuzzywuzzy's process.extract does."""
+import unittest
+
+import support
+import scoring
+from fuzzywuzzy import fuzz, process
+
+EVENT_NAMES = [
+    "ROH The Era Of Honor Begins",
+    "ROH Round Robin Challenge",
+    "ROH Round Robin Challenge II",
+    "IWA Mid-South Show",
+    "NJPW Wrestle Kingdom 11 in Tokyo Dome",
+    "NJPW Dominion 6.11 in Osaka-jo Hall",
+    "AAA Triplemanía XXV",
+    "Ice Ribbon New Ice Ribbon #951 ~ Ice Ribbon March 2019",
+    "DDT/Chris Brookes Produce Shin-Kiba No Fans Extravaganza #1",
+    "WWF Monday Night RAW #305",
+    "",
+    "ROH The Era Of Honor Begins",
+    # Long enough for difflib's automatic junk heuristic to kick in
+    "CHIKARA King Of Trios 2015 - Night 3 " + "with a very long subtitle " * 10,
+]
+
+MATCH_NAMES = [
+    "Low Ki vs. Christopher Daniels and Spanky @ ROH The Era Of Honor Begins - 20020223",
+    "Amazing Red vs. Xavier @ ROH The Era Of Honor Begins - 20020223",
+    "Sting vs. Stinger @ ROH The Era Of Honor Begins - 20020223",
+    "Xavier vs. Fleisch @ ROH Xtreme Night - 20020223",
+    "Kazuchika Okada (c) vs. Kenny Omega - Time Limit Draw @ NJPW Dominion 6.11 in Osaka-jo Hall - 20170611",
+    "Dr. Wagner Jr. vs. Psycho Clown @ AAA Triplemanía XXV - 20170826",
+    "Sting vs. Diamond Dallas Page @ WCW Monday Nitro #187 - 19990426",
+    "Sting & Diamond Dallas Page vs. Kevin Nash & Bret Hart @ WCW Monday Nitro #187 - 19990426",
+    "Tag Team Gauntlet: " + "Team %d vs. " * 30 % tuple(range(30)) + "Team 30 @ CZW Cage Of Death - 20151212",
+]
+
+EVENT_QUERIES = ["ROH The Era of Honor Begins", "Round Robin", "Triplemania XXV", "Ice Ribbon #951", "", "!!!"]
+MATCH_QUERIES = ["Xavier vs Fleisch", "Sting vs Diamond Dallas Page", "Kazuchika Okada vs. Kenny Omega",
+                 "Dr Wagner Jr vs Psycho Clown", "Team 5 vs Team 6", "Stinger"]
+
+
+class ScoringTest(unittest.TestCase):
+
+    def test_event_scores_match_wratio(self):
+        for query in EVENT_QUERIES:
+            for limit in (None, 1, 3):
+                expected = process.extract(query, EVENT_NAMES, limit=limit)
+                self.assertEqual(scoring.extract_events(query, EVENT_NAMES, limit), expected, query)
+
+    def test_match_scores_match_token_set_ratio(self):
+        for query in MATCH_QUERIES:
+            for limit in (None, 1, 3):
+                expected = process.extract(query, MATCH_NAMES, scorer=fuzz.token_set_ratio, limit=limit)
+                self.assertEqual(scoring.extract_matches(query, MATCH_NAMES, limit), expected, query)
+
+    def test_token_set_ratio_matches_fuzz(self):
+        for query in MATCH_QUERIES:
+            processed_query = scoring.process_query(query)
+            for name in MATCH_NAMES:
+                expected = fuzz.token_set_ratio(processed_query.text, name)
+                self.assertEqual(scoring.token_set_ratio(processed_query, scoring.name_cache.get(name)), expected, name)
+
+    def test_threshold_only_skips_names_that_cannot_reach_it(self):
+        processed_query = scoring.process_query("Xavier vs Fleisch")
+        for name in MATCH_NAMES:
+            score = fuzz.token_set_ratio(processed_query.text, name)
+            bounded = scoring.token_set_ratio(processed_query, scoring.name_cache.get(name), threshold=score)
+            self.assertEqual(bounded, score, name)
+
+
+if __name__ == "__main__":
+    unittest.main()
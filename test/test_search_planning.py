@@ -0,0 +1,77 @@
+"""A file name has to become the searches the agent used to make, in order, with the promotion's other names tried alongside the date, and searches that found nothing are skipped for a while."""
+import datetime
+import time
+import unittest
+
+import support
+import search_planning
+from search_planning import NegativeSearchCache, plan_event_search, plan_match_search
+
+DATE = datetime.date(2002, 3, 30)
+
+
+def describe(plan):
+    return [[(strategy.description, strategy.search_str, strategy.date) for strategy in tier] for tier in plan]
+
+
+class PlanEventSearchTest(unittest.TestCase):
+
+    def test_dated_name(self):
+        plan = plan_event_search({'prom': 'ROH', 'name': 'Round Robin Challenge'}, "ROH Round Robin Challenge", DATE)
+        self.assertEqual(describe(plan), [
+            [("date and promotion", "ROH Round Robin Challenge", DATE)],
+            [("date only", "", DATE)],
+            [("name only", "ROH Round Robin Challenge", None)]])
+
+    def test_promotion_aliases_are_tried_with_the_date(self):
+        plan = plan_event_search({'prom': 'wwf', 'name': 'Backlash'}, "wwf Backlash", DATE)
+        self.assertEqual(describe(plan)[1], [
+            ("promotion alias WWE", "WWE Backlash", DATE),
+            ("promotion alias WWWF", "WWWF Backlash", DATE),
+            ("date only", "", DATE)])
+
+    def test_undated_name(self):
+        self.assertEqual(describe(plan_event_search({'name': 'Backlash'}, "Backlash", None)),
+                         [[("name only", "Backlash", None)]])
+
+
+class PlanMatchSearchTest(unittest.TestCase):
+
+    def test_promotion_and_its_aliases(self):
+        self.assertEqual(describe(plan_match_search({'prom': 'TNA', 'name': 'AJ Styles vs Samoa Joe'}, "TNA", DATE)), [
+            [("date and promotion", "TNA", DATE)],
+            [("promotion alias Impact", "Impact", DATE), ("promotion alias GFW", "GFW", DATE)]])
+
+    def test_no_aliases_or_date(self):
+        self.assertEqual(describe(plan_match_search({'prom': 'ROH'}, "ROH", DATE)), [[("date and promotion", "ROH", DATE)]])
+        self.assertEqual(plan_match_search({'prom': 'ROH'}, "ROH", None), [])
+
+
+class NegativeSearchCacheTest(support.DataTestCase):
+
+    def expires_in(self, cache, search_str, date):
+        return cache._entries[search_planning.get_negative_key(search_str, date)] - time.time()
+
+    def test_remembered_for_a_while(self):
+        cache = NegativeSearchCache()
+        today = datetime.date.today()
+        cache.add("Nothing", DATE)
+        cache.add(" nothing ", today)
+        cache.add("Nothing", None)
+        self.assertTrue(cache.contains("NOTHING", DATE))
+        self.assertTrue(cache.contains("Nothing", today))
+        self.assertFalse(cache.contains("Nothing", today - datetime.timedelta(days=1)))
+        self.assertAlmostEqual(self.expires_in(cache, "Nothing", DATE), search_planning.PAST_NEGATIVE_TTL, delta=60)
+        self.assertAlmostEqual(self.expires_in(cache, "Nothing", today), search_planning.NEGATIVE_TTL, delta=60)
+        self.assertAlmostEqual(self.expires_in(cache, "Nothing", None), search_planning.NEGATIVE_TTL, delta=60)
+        self.assertTrue(NegativeSearchCache().contains("Nothing", DATE))
+
+    def test_expires(self):
+        cache = NegativeSearchCache()
+        cache.add("Nothing", DATE)
+        cache._entries[search_planning.get_negative_key("Nothing", DATE)] = time.time() - 1
+        self.assertFalse(cache.contains("Nothing", DATE))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+"""Snapshots have to give back exactly what was exported, whether streamed or looked up through the index, and reject damaged files."""
+import datetime
+import io
+import os
+import time
+import unittest
+
+import support
+import event_index
+import extraction
+import promotion_cache
+import snapshots
+import synthetic_site
+from record_cache import record_cache, get_event_key, get_match_key
+from records import Event, Match, Matchguide, Promotion, Review
+
+
+def make_event(event_id):
+    info = extraction.parse_event_page(synthetic_site.build_page("?id=1&nr=" + event_id)).info
+    matches = [Match(text) for text in synthetic_site.EVENTS[event_id]['matches']]
+    return Event.from_info(event_id, info, matches, rating='7.25')
+
+
+class SnapshotTestCase(support.DataTestCase):
+    """Each test has its own data directory, and its own copies of the caches that are kept in memory."""
+
+    def setUp(self):
+        support.DataTestCase.setUp(self)
+        self.indexes = [snapshots.event_index]
+        self.reset_caches()
+
+    def tearDown(self):
+        snapshots.event_index = self.indexes[0]
+        snapshots.promotion_cache = promotion_cache.promotion_cache
+        support.DataTestCase.tearDown(self)
+
+    def reset_caches(self):
+        """Forget what is in memory, as if the agent had been restarted."""
+        snapshots.event_index = event_index.EventIndex()
+        snapshots.promotion_cache = promotion_cache.PromotionCache()
+
+    def fill_caches(self):
+        for event_id in ('2004', '2008'):
+            event = make_event(event_id)
+            record_cache.put(get_event_key(event_id), {
+                'event': (event, 3600),
+                'reviews': ([Review("user0", "[8.0] Great show")], 60)})
+            for match_id in range(1, len(event.matches) + 1):
+                record_cache.put(get_match_key(event_id, match_id), {'matchguide': (Matchguide(synthetic_site.WON_RATING), 3600)})
+            dd, mm, yyyy = event.date.split(".")
+            snapshots.event_index.add_search(event.name, datetime.date(int(yyyy), int(mm), int(dd)), [
+                {'id': event_id, 'name': event.name, 'year': yyyy, 'month': mm, 'day': dd}])
+        record_cache.put("event-9999", {'event': (Event('9999', 'Undated', 'unknown'), 3600)})
+        snapshots.event_index._save()
+        with snapshots.promotion_cache._lock:
+            snapshots.promotion_cache._load()
+            snapshots.promotion_cache._promotions['?id=8&nr=122'] = promotion_cache.PromotionSlugs.from_promotion(
+                Promotion('ROH', ['ROH', 'RoH']))
+            snapshots.promotion_cache._save()
+
+    def export(self, record_keys=()):
+        out = io.BytesIO()
+        counts = snapshots.export_snapshot(out, record_keys)
+        return out.getvalue(), counts
+
+
+class RoundTripTest(SnapshotTestCase):
+
+    def test_stream_round_trip(self):
+        self.fill_caches()
+        exported = dict((key, record_cache.export(key)) for key in
+                        [get_event_key('2004'), get_event_key('2008'), get_match_key('2004', 3), "event-9999"])
+        data, counts = self.export(["event-9999", get_event_key('2004')])
+        self.assertEqual(counts, {'record': 7, 'event': 2, 'search': 2, 'promotion': 1})
+
+        # Into an empty data directory
+        support.DataTestCase.tearDown(self)
+        support.DataTestCase.setUp(self)
+        self.reset_caches()
+        result = snapshots.import_snapshot(io.BytesIO(data))
+        self.assertEqual(result, {'records': (7, 7), 'promotions': (1, 1), 'index': (4, 4)})
+        for key, parts in exported.items():
+            self.assertEqual(record_cache.export(key), parts)
+        self.assertEqual(record_cache.get(get_event_key('2008'), 'event', Event).to_json(), make_event('2008').to_json())
+        self.assertEqual(snapshots.promotion_cache.peek('?id=8&nr=122').remove_from("ROH Xtreme Night"), " Xtreme Night")
+        events, _ = snapshots.event_index.export()
+        self.assertEqual(sorted(events), ['2004', '2008'])
+
+        # The imported caches are saved, and importing again changes nothing
+        self.reset_caches()
+        self.assertEqual(sorted(snapshots.event_index.export()[0]), ['2004', '2008'])
+        result = snapshots.import_snapshot(io.BytesIO(data))
+        self.assertEqual(result, {'records': (7, 0), 'promotions': (1, 0), 'index': (4, 0)})
+
+    def test_index_lookup_matches_stream(self):
+        self.fill_caches()
+        data, _ = self.export()
+        path = os.path.join(self.data_dir, "test.snapshot")
+        with open(path, "wb") as out:
+            out.write(data)
+        with open(path, "rb") as source:
+            reader = snapshots.SnapshotReader(source)
+            streamed = list(reader.entries())
+            self.assertEqual(len(reader.get_index()), len(streamed))
+            for kind, key, value in streamed:
+                self.assertEqual(reader.get(kind, key), value)
+            self.assertIsNone(reader.get(snapshots.RECORD_KIND, "event-1"))
+            reader.close()
+
+    def test_many_frames(self):
+        writer_out = io.BytesIO()
+        writer = snapshots.SnapshotWriter(writer_out)
+        entries = [[snapshots.RECORD_KIND, "event-" + str(number), {'n': number}] for number in range(snapshots.FRAME_ENTRIES * 3 + 1)]
+        for entry in entries:
+            writer.add(*entry)
+        writer.close()
+        self.assertEqual(list(snapshots.SnapshotReader(io.BytesIO(writer_out.getvalue())).entries()), entries)
+
+    def test_empty_caches(self):
+        data, counts = self.export()
+        self.assertEqual(counts, {})
+        self.assertEqual(list(snapshots.SnapshotReader(io.BytesIO(data)).entries()), [])
+
+
+class MergeTest(SnapshotTestCase):
+
+    def test_keeps_the_fresher_copy(self):
+        key = get_event_key('2004')
+        record_cache.put(key, {'event': (make_event('2004'), 3600), 'reviews': ([], 3600)})
+        data, _ = self.export([key])
+        record_cache.put(key, {'event': (make_event('2008'), 7200), 'reviews': ([], 60)})
+
+        result = snapshots.import_snapshot(io.BytesIO(data))
+        self.assertEqual(result['records'], (1, 1))
+        parts = record_cache.export(key)
+        self.assertEqual(Event.from_json(parts['event']['value']).name, synthetic_site.EVENTS['2008']['name'])
+        self.assertGreater(parts['reviews']['expires'], time.time() + 3000)
+
+    def test_promotions_fetched_later_win(self):
+        self.fill_caches()
+        data, _ = self.export()
+        snapshots.promotion_cache.merge({'?id=8&nr=122': {'current': 'RoH', 'slugs': ['RoH'], 'fetched': time.time() + 60}})
+        self.assertEqual(snapshots.import_snapshot(io.BytesIO(data))['promotions'], (1, 0))
+        self.assertEqual(snapshots.promotion_cache.peek('?id=8&nr=122').current_slug, 'RoH')
+
+    def test_records_of_another_parser_version_are_skipped(self):
+        self.fill_caches()
+        data, _ = self.export()
+        header = snapshots.HEADER.unpack(data[:snapshots.HEADER.size])
+        data = snapshots.HEADER.pack(header[0], header[1], header[2] + 1, header[3]) + data[snapshots.HEADER.size:]
+        support.DataTestCase.tearDown(self)
+        support.DataTestCase.setUp(self)
+        self.reset_caches()
+        result = snapshots.import_snapshot(io.BytesIO(data))
+        self.assertEqual(result['records'], (6, 0))
+        self.assertEqual(result['index'], (4, 4))
+        self.assertIsNone(record_cache.export(get_event_key('2004')))
+
+
+class DamagedSnapshotTest(SnapshotTestCase):
+
+    def test_truncated(self):
+        self.fill_caches()
+        data, _ = self.export()
+        for length in (0, 5, snapshots.HEADER.size + 3, len(data) // 2):
+            with self.assertRaises(ValueError):
+                list(snapshots.SnapshotReader(io.BytesIO(data[:length])).entries())
+
+    def test_corrupt(self):
+        self.fill_caches()
+        data, _ = self.export()
+        position = snapshots.HEADER.size + snapshots.FRAME_HEADER.size + 10
+        damaged = data[:position] + (b"\x00" if data[position:position + 1] != b"\x00" else b"\x01") + data[position + 1:]
+        with self.assertRaises(ValueError):
+            list(snapshots.SnapshotReader(io.BytesIO(damaged)).entries())
+        with self.assertRaises(ValueError):
+            snapshots.SnapshotReader(io.BytesIO(b"NOTASNAP" + data[8:]))
+
+    def test_missing_footer(self):
+        self.fill_caches()
+        data, _ = self.export()
+        path = os.path.join(self.data_dir, "test.snapshot")
+        with open(path, "wb") as out:
+            out.write(data[:-snapshots.FOOTER.size])
+        with open(path, "rb") as source:
+            with self.assertRaises(ValueError):
+                snapshots.SnapshotReader(source).get_index()
+
+
+if __name__ == "__main__":
+    unittest.main()
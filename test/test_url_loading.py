@@ -0,0 +1,210 @@
+"""Threads loading the same page at the same time have to share one request, failed requests are retried with a backoff, and expired pages are revalidated."""
+import threading
+import time
+import unittest
+
+import support
+import url_loading
+from http_cache import ResponseCache, get_body_key
+from instrumentation import metrics
+from rate_limiting import AdaptiveRateLimiter
+from requests.exceptions import Timeout
+
+URL = "https://www.cagematch.net/?id=1&nr=2004"
+PAGE = b"<html>" + b"x" * 100 + b"</html>"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class CoalescingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.load = url_loading.load
+        self.loads = []
+        self.release = threading.Event()
+        metrics.reset()
+
+        def load(url, scanner=None):
+            self.loads.append(url)
+            self.release.wait(5)
+            return "body of " + url, True
+
+        url_loading.load = load
+
+    def tearDown(self):
+        url_loading.load = self.load
+
+    def test_concurrent_loads_share_one_request(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(url_loading.simple_get(URL))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        # Hold the first request until the others are waiting on it
+        wait_for(lambda: metrics.summary()['counters'].get('http.coalesced') == 4)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.loads, [URL])
+        self.assertEqual(results, ["body of " + URL] * 5)
+        self.assertEqual(url_loading._in_flight, {})
+
+    def test_later_loads_make_their_own_request(self):
+        self.release.set()
+        self.assertEqual(url_loading.simple_get(URL), "body of " + URL)
+        self.assertEqual(url_loading.simple_get(URL), "body of " + URL)
+        self.assertEqual(self.loads, [URL, URL])
+
+    def test_failed_load_is_cleared(self):
+        def load(url, scanner=None):
+            raise ValueError("connection lost")
+
+        url_loading.load = load
+        with self.assertRaises(ValueError):
+            url_loading.simple_get(URL)
+        self.assertEqual(url_loading._in_flight, {})
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = {'Content-Type': 'text/html; charset=utf-8'}
+        self.headers.update(headers or {})
+        self.url = URL
+
+    def iter_content(self, chunk_size):
+        yield self.content
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """Answers each request with the next of `responses`, raising those that are exceptions, and notes the headers sent."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        self.requests.append(headers)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class FakeTime(object):
+    """url_loading's clock, with the sleeps between retries noted rather than waited out."""
+
+    def __init__(self):
+        self.sleeps = []
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+class FetchTestCase(support.DataTestCase):
+    prefs = {'requestsPerSecond': '10'}
+
+    def setUp(self):
+        support.DataTestCase.setUp(self)
+        self.originals = (url_loading.get_session, url_loading.time, url_loading.rate_limiter, url_loading.response_cache)
+        self.time = url_loading.time = FakeTime()
+        self.rate_limiter = url_loading.rate_limiter = AdaptiveRateLimiter()
+        self.cache = url_loading.response_cache = ResponseCache()
+        metrics.reset()
+
+    def tearDown(self):
+        url_loading.get_session, url_loading.time, url_loading.rate_limiter, url_loading.response_cache = self.originals
+        support.DataTestCase.tearDown(self)
+
+    def answer(self, *responses):
+        self.session = FakeSession(responses)
+        url_loading.get_session = lambda: (self.session, 5)
+
+
+class RetryTest(FetchTestCase):
+
+    def test_server_errors_are_retried(self):
+        self.answer(FakeResponse(503), FakeResponse(200, PAGE))
+        self.assertEqual(url_loading.fetch(URL).body, PAGE)
+        self.assertEqual(len(self.session.requests), 2)
+        self.assertEqual(len(self.time.sleeps), 1)
+        # Slowed down by the failure, and back up a step after the success
+        self.assertAlmostEqual(self.rate_limiter._rate, 5.0 + 0.1)
+
+    def test_retry_after_is_honoured(self):
+        self.answer(FakeResponse(429, headers={'Retry-After': '7'}), FakeResponse(200, PAGE))
+        self.assertEqual(url_loading.fetch(URL).body, PAGE)
+        self.assertGreaterEqual(self.time.sleeps[0], 7)
+
+    def test_timeouts_are_retried(self):
+        self.answer(Timeout("timed out"), FakeResponse(200, PAGE))
+        self.assertEqual(url_loading.fetch(URL).body, PAGE)
+        self.assertEqual(metrics.summary()['counters']['http.timeouts'], 1)
+
+    def test_gives_up_with_growing_delays(self):
+        self.answer(*[FakeResponse(500)] * url_loading.MAX_ATTEMPTS)
+        self.assertIsNone(url_loading.fetch(URL))
+        self.assertEqual(len(self.session.requests), url_loading.MAX_ATTEMPTS)
+        self.assertEqual(len(self.time.sleeps), url_loading.MAX_ATTEMPTS - 1)
+        self.assertLess(self.time.sleeps[0], self.time.sleeps[-1])
+
+    def test_missing_pages_are_not_retried(self):
+        self.answer(FakeResponse(404))
+        self.assertIsNone(url_loading.fetch(URL))
+        self.assertEqual(self.time.sleeps, [])
+
+
+class RevalidationTest(FetchTestCase):
+
+    def expire(self):
+        with self.cache._lock:
+            self.cache._entries[URL]['expires'] = time.time() - 60
+
+    def test_unchanged_page_is_kept(self):
+        self.cache.put(URL, PAGE, etag='"v1"', last_modified="Sat, 23 Feb 2002 00:00:00 GMT")
+        self.expire()
+        self.assertIsNone(self.cache.get(URL))
+        self.answer(FakeResponse(304))
+        self.assertEqual(url_loading.fetch_into_cache(URL), (PAGE, True))
+        self.assertEqual(self.session.requests, [{'If-None-Match': '"v1"', 'If-Modified-Since': "Sat, 23 Feb 2002 00:00:00 GMT"}])
+        # Fresh again, without having downloaded the page
+        self.assertEqual(self.cache.get(URL), PAGE)
+        self.assertEqual(metrics.summary()['counters']['http.revalidated'], 1)
+
+    def test_changed_page_is_replaced(self):
+        self.cache.put(URL, PAGE, etag='"v1"')
+        self.expire()
+        self.answer(FakeResponse(200, PAGE + b"!", headers={'ETag': '"v2"'}))
+        self.assertEqual(url_loading.fetch_into_cache(URL), (PAGE + b"!", True))
+        self.assertEqual(self.cache.get_revalidation_headers(URL), {'If-None-Match': '"v2"'})
+
+    def test_missing_body_is_fetched_again(self):
+        self.cache.put(URL, PAGE, etag='"v1"')
+        self.expire()
+        Data.Remove(get_body_key(URL))
+        self.answer(FakeResponse(304), FakeResponse(200, PAGE, headers={'ETag': '"v1"'}))
+        self.assertEqual(url_loading.fetch_into_cache(URL), (PAGE, True))
+        self.assertEqual(self.session.requests, [{'If-None-Match': '"v1"'}, None])
+        self.assertEqual(self.cache.get(URL), PAGE)
+
+    def test_no_validators_no_conditional_request(self):
+        self.cache.put(URL, PAGE)
+        self.expire()
+        self.answer(FakeResponse(200, PAGE))
+        url_loading.fetch_into_cache(URL)
+        self.assertEqual(self.session.requests, [None])
+
+
+if __name__ == "__main__":
+    unittest.main()
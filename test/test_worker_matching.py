@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""WorkerMatcher has to find a worker wherever their name is whole words in a match, and nowhere else."""
+import re
+import unittest
+
+import support
+from worker_matching import WorkerMatcher
+
+
+def find_by_regex(workers, text):
+    """The workers found by searching for each name on its own."""
+    text = text.decode('utf-8')
+    return [worker for worker in workers if worker and re.search(
+        u"(?<![^\\W_])" + re.escape(worker.decode('utf-8')) + u"(?![^\\W_])", text, re.UNICODE)]
+
+
+class WorkerMatcherTest(unittest.TestCase):
+
+    def assertFinds(self, workers, text, expected):
+        self.assertEqual(WorkerMatcher(workers).find(text), expected)
+        self.assertEqual(find_by_regex(workers, text), expected)
+
+    def test_whole_words_only(self):
+        workers = ["Sting", "Stinger", "Ki", "Low Ki"]
+        self.assertFinds(workers, "Stinger defeats Low Ki", ["Stinger", "Ki", "Low Ki"])
+        self.assertFinds(workers, "Sting defeats Kip", ["Sting"])
+        self.assertFinds(workers, "Stingers defeat Lowki", [])
+
+    def test_names_at_either_end_and_next_to_punctuation(self):
+        workers = ["Xavier", "Amazing Red", "Dr. Wagner Jr."]
+        self.assertFinds(workers, "Xavier", ["Xavier"])
+        self.assertFinds(workers, "Amazing Red (c) vs. Xavier", ["Xavier", "Amazing Red"])
+        self.assertFinds(workers, "Dr. Wagner Jr. & Xavier", ["Xavier", "Dr. Wagner Jr."])
+        self.assertFinds(workers, "(Amazing Red)", ["Amazing Red"])
+        self.assertFinds(workers, "Amazing Red2 vs. _Xavier", ["Xavier"])
+
+    def test_keeps_the_order_of_the_worker_list(self):
+        workers = ["Psycho Clown", "Dr. Wagner Jr.", "Kevin Nash"]
+        self.assertFinds(workers, "Dr. Wagner Jr. defeats Psycho Clown and Kevin Nash", workers)
+        self.assertFinds(list(reversed(workers)), "Kevin Nash defeats Psycho Clown", ["Kevin Nash", "Psycho Clown"])
+
+    def test_overlapping_names(self):
+        workers = ["Diamond Dallas Page", "Dallas", "Page", "Dallas Page"]
+        self.assertFinds(workers, "Sting & Diamond Dallas Page", workers)
+        self.assertFinds(workers, "Diamond Dallas Pages", ["Dallas"])
+        self.assertFinds(["aa", "aaa"], "aaaa aa", ["aa"])
+
+    def test_non_ascii_names(self):
+        workers = ["Último Guerrero", "Guerrero", "Rey Mysterio"]
+        self.assertFinds(workers, "Último Guerrero vs. Rey Mysterio", workers)
+        self.assertFinds(workers, "NÚltimo Guerreroé", [])
+        self.assertEqual(WorkerMatcher([u"Último Guerrero"]).find("Último Guerrero defeats"), [u"Último Guerrero"])
+
+    def test_empty_names_and_text(self):
+        self.assertEqual(WorkerMatcher(["", "Xavier"]).find("Xavier"), ["Xavier"])
+        self.assertEqual(WorkerMatcher(["Xavier"]).find(""), [])
+        self.assertEqual(WorkerMatcher([]).find("Xavier"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
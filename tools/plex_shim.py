@@ -0,0 +1,251 @@
+"""Run the CAGEnt agent outside of Plex.
+
+Plex plugin code relies on globals that the Plex framework injects (Log, Prefs, Data, Agent,
+Locale, MetadataSearchResult, ...). This module provides simple stand-ins for the ones the agent
+uses, and loads the bundle's code with them in place, so that `Cagent_Movie.search` and `update`
+can be called from scripts. It needs Python 2.7 with the bundle dependencies importable.
+
+    import plex_shim
+    agent_module = plex_shim.load_agent(data_dir="/tmp/cagent-data")
+    agent = agent_module.Cagent_Movie()
+    results = plex_shim.SearchResults()
+    agent.search(results, plex_shim.Media.from_path("/movies/ROH - 2002-02-23 - The Era of Honor Begins.mkv"), "en", False)
+"""
+import __builtin__
+import json
+import logging
+import os
+import sys
+import urllib
+
+BUNDLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Cagent.bundle", "Contents")
+CODE_DIR = os.path.join(BUNDLE_DIR, "Code")
+DEFAULT_PREFS_PATH = os.path.join(BUNDLE_DIR, "DefaultPrefs.json")
+
+logger = logging.getLogger("cagent")
+
+
+class Log(object):
+    """Plex's logger, sent to Python logging under the "cagent" logger."""
+
+    def __call__(self, message):
+        logger.info(message)
+
+    def Debug(self, message):
+        logger.debug(message)
+
+    def Info(self, message):
+        logger.info(message)
+
+    def Warn(self, message):
+        logger.warning(message)
+
+    def Error(self, message):
+        logger.error(message)
+
+    def Critical(self, message):
+        logger.critical(message)
+
+    def Exception(self, message):
+        logger.exception(message)
+
+
+class Prefs(object):
+    """The agent preferences, starting from the defaults in DefaultPrefs.json. Bools are converted as Plex does."""
+
+    def __init__(self, overrides=None):
+        self.values = {}
+        for pref in json.load(open(DEFAULT_PREFS_PATH)):
+            value = pref["default"]
+            if pref["type"] == "bool":
+                value = value == "true"
+            self.values[pref["id"]] = value
+        self.values.update(overrides or {})
+
+    def __getitem__(self, key):
+        return self.values.get(key)
+
+
+class Data(object):
+    """Plex's per-plugin data item storage, kept as one file per item in `data_dir`.
+
+    Items whose names start with one of MEMORY_ONLY_PREFIXES are only kept in memory. Fingerprints
+    record what was last written to an item's metadata in Plex, and metadata written from a script
+    never reaches Plex, so saving them to a server's data directory would make its next refresh skip
+    sections the item doesn't have.
+    """
+    MEMORY_ONLY_PREFIXES = ("fingerprint-",)
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self._memory = {}
+        if not os.path.isdir(data_dir):
+            os.makedirs(data_dir)
+
+    def _path(self, item):
+        return os.path.join(self.data_dir, item)
+
+    def _in_memory(self, item):
+        return item.startswith(self.MEMORY_ONLY_PREFIXES)
+
+    def Exists(self, item):
+        if self._in_memory(item):
+            return item in self._memory
+        return os.path.exists(self._path(item))
+
+    def Load(self, item):
+        if self._in_memory(item):
+            return self._memory.get(item)
+        if not self.Exists(item):
+            return None
+        with open(self._path(item), "rb") as data_file:
+            return data_file.read()
+
+    def Save(self, item, data):
+        if self._in_memory(item):
+            self._memory[item] = data
+            return
+        temp_path = self._path(item) + ".tmp"
+        with open(temp_path, "wb") as data_file:
+            data_file.write(data)
+        os.rename(temp_path, self._path(item))
+
+    def Remove(self, item):
+        if self._in_memory(item):
+            self._memory.pop(item, None)
+        elif self.Exists(item):
+            os.remove(self._path(item))
+
+
+class Language(object):
+    English = "en"
+
+
+class Locale(object):
+    Language = Language
+
+
+class Agent(object):
+    class Movies(object):
+        pass
+
+
+class MetadataSearchResult(object):
+    def __init__(self, id=None, name=None, year=None, score=0, lang=None):
+        self.id = id
+        self.name = name
+        self.year = year
+        self.score = score
+        self.lang = lang
+
+    def __repr__(self):
+        return "MetadataSearchResult(id={0!r}, name={1!r}, year={2!r}, score={3!r})".format(self.id, self.name, self.year, self.score)
+
+
+class SearchResults(list):
+    """The results container passed to `search`."""
+
+    def Append(self, result):
+        self.append(result)
+
+    def best(self):
+        return max(self, key=lambda result: result.score) if self else None
+
+
+class Media(object):
+    """The media object passed to `search`. Plex gives the file name as a quoted path."""
+
+    def __init__(self, name, filename=None):
+        self.name = name
+        self.filename = filename
+
+    @classmethod
+    def from_path(cls, path):
+        return cls(os.path.splitext(os.path.basename(path))[0], urllib.quote(path))
+
+
+class ObjectContainer(list):
+    """A list of child objects on a metadata model, like `metadata.roles` or `metadata.reviews`."""
+
+    def new(self):
+        item = Record()
+        self.append(item)
+        return item
+
+    def clear(self):
+        del self[:]
+
+
+class Record(object):
+    """A plain object to hang attributes on, used for roles and reviews."""
+
+    def __repr__(self):
+        return "Record({0!r})".format(self.__dict__)
+
+
+class Metadata(object):
+    """The metadata model passed to `update`."""
+
+    def __init__(self, id):
+        self.id = id
+        self.title = None
+        self.summary = None
+        self.studio = None
+        self.rating = None
+        self.originally_available_at = None
+        self._collections = set()
+        self.reviews = ObjectContainer()
+        self.roles = ObjectContainer()
+
+    @property
+    def collections(self):
+        return self._collections
+
+    @collections.setter
+    def collections(self, values):
+        self._collections = set(values)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'summary': self.summary,
+            'studio': self.studio,
+            'rating': self.rating,
+            'originally_available_at': str(self.originally_available_at),
+            'collections': sorted(self.collections),
+            'reviews': [(review.author, review.text) for review in self.reviews],
+            'roles': [role.name for role in self.roles],
+        }
+
+
+def install_globals(data_dir, prefs=None):
+    """Put the stand-in framework globals where the bundle code will find them."""
+    __builtin__.Log = Log()
+    __builtin__.Prefs = Prefs(prefs)
+    __builtin__.Data = Data(data_dir)
+    __builtin__.Locale = Locale
+    __builtin__.Agent = Agent
+    __builtin__.MetadataSearchResult = MetadataSearchResult
+
+
+def load_agent(data_dir, prefs=None):
+    """Load the bundle's Code/__init__.py as the module "cagent", with the stand-in globals installed.
+
+    :param data_dir: directory to keep the agent's data items in. Point this at
+                     "Plug-in Support/Data/com.plexapp.agents.cagent/DataItems" to share a server's caches.
+    :param prefs: dictionary of preference values to use instead of the defaults
+    :return: the agent module
+    """
+    install_globals(data_dir, prefs)
+    if CODE_DIR not in sys.path:
+        sys.path.insert(0, CODE_DIR)
+    import imp
+    path = os.path.join(CODE_DIR, "__init__.py")
+    module = imp.new_module("cagent")
+    module.__file__ = path
+    sys.modules["cagent"] = module
+    # Plex compiles plugin code itself, which lets the agent use UTF-8 without a coding line
+    with open(path, "rb") as source:
+        exec(compile(source.read(), path, "exec"), module.__dict__)
+    return module
@@ -0,0 +1,108 @@
+"""Export the agent's caches to a snapshot file, or seed another server's caches from one.
+
+Servers with overlapping libraries would otherwise each read the same CAGEMATCH pages. A
+snapshot holds the event index, the parsed event and match records (including reviews and
+matchguide ratings) and the promotion abbreviations, compressed into one file; see
+Contents/Code/snapshots.py for the format. Importing merges it with what the server already has,
+keeping the fresher copy of each entry.
+
+Stop the Plex server while importing, as it keeps its own copy of the caches in memory and would
+write over the merged ones. Use "-" as the file to write to stdout or read from stdin, e.g. to
+copy caches straight from one server to another:
+
+    python ./snapshot.py export --data-dir ".../DataItems" cagent.snapshot
+    python ./snapshot.py import --data-dir ".../DataItems" cagent.snapshot
+    python ./snapshot.py export --data-dir ".../DataItems" - | ssh other-server python ./snapshot.py import --data-dir ".../DataItems" -
+    python ./snapshot.py show cagent.snapshot record event-123456
+
+Requires Python 2.7 with the bundle dependencies.
+"""
+import argparse, json, logging, os, shutil, sys, tempfile, time
+
+import plex_shim
+
+
+def find_record_keys(data_dir, key_prefix):
+    """The keys of every record cache entry in `data_dir`, including those of events the index doesn't know."""
+    return sorted(name[len(key_prefix):] for name in os.listdir(data_dir)
+                  if name.startswith(key_prefix) and not name.endswith(".tmp"))
+
+
+def export_command(args):
+    plex_shim.load_agent(args.data_dir)
+    import record_cache, snapshots
+    record_keys = find_record_keys(args.data_dir, record_cache.KEY_PREFIX)
+    start = time.time()
+    if args.file == "-":
+        counts = snapshots.export_snapshot(sys.stdout, record_keys)
+    else:
+        with open(args.file, "wb") as out:
+            counts = snapshots.export_snapshot(out, record_keys)
+    sys.stderr.write("Exported {0} in {1:.1f} s\n".format(
+        ", ".join("{0} {1} entries".format(count, kind) for kind, count in sorted(counts.items())), time.time() - start))
+
+
+def import_command(args):
+    plex_shim.load_agent(args.data_dir)
+    import snapshots
+    start = time.time()
+    if args.file == "-":
+        counts = snapshots.import_snapshot(sys.stdin)
+    else:
+        with open(args.file, "rb") as source:
+            counts = snapshots.import_snapshot(source)
+    sys.stderr.write("Imported {0} in {1:.1f} s\n".format(
+        ", ".join("{0} of {1} {2}".format(taken, read, name) for name, (read, taken) in sorted(counts.items())),
+        time.time() - start))
+
+
+def show_command(args):
+    data_dir = tempfile.mkdtemp()
+    try:
+        plex_shim.load_agent(data_dir)
+        import snapshots
+        with open(args.file, "rb") as source:
+            reader = snapshots.SnapshotReader(source)
+            index = reader.get_index()
+            if args.kind is None:
+                kinds = {}
+                for kind, _ in index:
+                    kinds[kind] = kinds.get(kind, 0) + 1
+                print("Written {0}, parser version {1}".format(time.ctime(reader.created), reader.parser_version))
+                for kind, count in sorted(kinds.items()):
+                    print("{0:<10} {1} entries".format(kind, count))
+            elif args.key is None:
+                for kind, key in sorted(index):
+                    if kind == args.kind:
+                        print(key)
+            else:
+                print(json.dumps(reader.get(args.kind, args.key), indent=1, sort_keys=True))
+            reader.close()
+    finally:
+        shutil.rmtree(data_dir, True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import the agent's caches as a snapshot")
+    commands = parser.add_subparsers()
+    export_parser = commands.add_parser("export", help="write the caches in --data-dir to a snapshot")
+    export_parser.add_argument("file", help="snapshot file to write, or - for stdout")
+    export_parser.add_argument("--data-dir", required=True, help="the agent's data item directory")
+    export_parser.set_defaults(command=export_command)
+    import_parser = commands.add_parser("import", help="merge a snapshot into the caches in --data-dir")
+    import_parser.add_argument("file", help="snapshot file to read, or - for stdin")
+    import_parser.add_argument("--data-dir", required=True, help="the agent's data item directory")
+    import_parser.set_defaults(command=import_command)
+    show_parser = commands.add_parser("show", help="summarise a snapshot, list the keys of one kind of entry, or show one entry")
+    show_parser.add_argument("file", help="snapshot file to read")
+    show_parser.add_argument("kind", nargs="?", help="event, search, promotion or record")
+    show_parser.add_argument("key", nargs="?", help="key of the entry to show")
+    show_parser.set_defaults(command=show_command)
+    parser.add_argument("--verbose", action="store_true", help="show the agent's log")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    args.command(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Measure how long the agent takes to load, and to answer its first search and update.
+
+Plex loads the plugin in a fresh process and then calls `search` and `update`, so the cost of
+importing the agent and of whatever its first calls import on the way is paid on every server
+start. This script reports, in one fresh process:
+
+  - how long each heavy dependency (fuzzywuzzy, Beautiful Soup, lxml, requests) takes to import
+    on its own, each measured in a separate process
+  - how long loading the agent takes, and which of those dependencies it imported
+  - for each file name given, how long the first and second search and update take, and which
+    dependencies each of them imported
+  - the same for each item id given with --id, which is updated without searching, as when Plex
+    refreshes an item it has already matched
+
+Point --data-dir at warmed caches (see warm-cache.py) to see warm start behaviour, where an
+update should need neither fuzzywuzzy nor requests:
+
+    python ./startup-timing.py --data-dir /tmp/cagent-data --id 123456 "ROH - 2002-02-23 - The Era of Honor Begins.mkv"
+
+Requires Python 2.7 with the bundle dependencies.
+"""
+import argparse, logging, os, subprocess, sys, time
+
+import plex_shim
+
+HEAVY_MODULES = ('fuzzywuzzy.fuzz', 'bs4', 'lxml.etree', 'requests')
+
+
+def get_import_time(module_name):
+    """Seconds it takes a fresh interpreter to import `module_name`, or None if it can't be imported."""
+    script = "import time; start = time.time(); import {0}; print(time.time() - start)".format(module_name)
+    try:
+        with open(os.devnull, "w") as devnull:
+            return float(subprocess.check_output([sys.executable, "-c", script], stderr=devnull))
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def get_loaded():
+    return set(name for name in HEAVY_MODULES if name in sys.modules)
+
+
+def report(step, seconds, newly_loaded):
+    print("{0:<40} {1:8.1f} ms   imported: {2}".format(
+        step, seconds * 1000, ", ".join(sorted(newly_loaded)) if newly_loaded else "nothing heavy"))
+
+
+def timed_step(step, action):
+    """Run `action`, reporting how long it took and which heavy modules it imported."""
+    loaded_before = get_loaded()
+    start = time.time()
+    result = None
+    try:
+        result = action()
+    except Exception as exc:
+        print("{0} failed: {1}".format(step, exc))
+    report(step, time.time() - start, get_loaded() - loaded_before)
+    return result
+
+
+def search(agent, path):
+    results = plex_shim.SearchResults()
+    agent.search(results, plex_shim.Media.from_path(path), "en", False)
+    return results.best()
+
+
+def update(agent, item_id):
+    agent.update(plex_shim.Metadata(item_id), None, "en", False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the agent's import and first call latency")
+    parser.add_argument("paths", nargs="*", help="file names to search for and update")
+    parser.add_argument("--id", action="append", default=[], help="item id to update without searching")
+    parser.add_argument("--data-dir", required=True, help="the agent's data item directory")
+    parser.add_argument("--pref", action="append", default=[], help="preference override, as id=value")
+    parser.add_argument("--site", help="CAGEMATCH root URL to use instead of the live site, e.g. a stub-server.py")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's log")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    print("Importing each dependency on its own:")
+    for module_name in HEAVY_MODULES:
+        seconds = get_import_time(module_name)
+        print("  {0:<16} {1}".format(module_name, "not available" if seconds is None else "{0:.1f} ms".format(seconds * 1000)))
+    print("")
+
+    prefs = dict(pref.split("=", 1) for pref in args.pref)
+    agent_module = timed_step("load agent", lambda: plex_shim.load_agent(args.data_dir, prefs))
+    if agent_module is None:
+        return
+    if args.site:
+        agent_module.CM_MAIN_URL = args.site
+    agent = agent_module.Cagent_Movie()
+
+    for item_id in args.id:
+        for attempt in ("first", "second"):
+            timed_step("{0} update of {1}".format(attempt, item_id), lambda: update(agent, item_id))
+    for path in args.paths:
+        for attempt in ("first", "second"):
+            best = timed_step("{0} search for {1}".format(attempt, path)[:40], lambda: search(agent, path))
+            if best is not None:
+                timed_step("{0} update of {1}".format(attempt, best.id), lambda: update(agent, best.id))
+    print("")
+    print("Loaded by the end: " + (", ".join(sorted(get_loaded())) or "nothing heavy"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Warm the agent's caches for a whole library before Plex matches it.
+
+Plex searches for and updates one item at a time, so a large library is matched one round trip
+after another. This script walks library folders, reads each file name with the agent's
+FILENAME_REGEX, and groups the files by date and promotion, as the files in one group share the
+same search, event and card pages. Groups are then worked through side by side, each running
+the agent's own search and update for its files, so every page Plex will need (searches, event
+and card pages, reviews, matchguide entries and promotions) ends up in the page cache, the
+record cache and the event index. All requests still go through the agent's rate limiter.
+
+Point --data-dir at the plugin's data items so the Plex server uses the warmed caches, and stop
+the server while this runs, as both would otherwise write the same cache files:
+
+    python ./warm-cache.py --data-dir ".../Plug-in Support/Data/com.plexapp.agents.cagent/DataItems" /path/to/library
+
+Use the same preferences as the server (--pref reviewCount=5 ...) so that the same pages are
+fetched. Requires Python 2.7 with the bundle dependencies.
+"""
+import argparse, logging, os, threading, time
+
+import plex_shim
+
+VIDEO_EXTENSIONS = ('.avi', '.m2ts', '.m4v', '.mkv', '.mov', '.mp4', '.mpg', '.ts', '.webm', '.wmv')
+
+
+def find_videos(folders):
+    for folder in folders:
+        for root, _, file_names in os.walk(folder):
+            for file_name in sorted(file_names):
+                if os.path.splitext(file_name)[1].lower() in VIDEO_EXTENSIONS:
+                    yield os.path.join(root, file_name)
+
+
+def group_paths(agent_module, paths):
+    """Group paths by the date and promotion in their file names. Files without a date get a group of their own."""
+    groups = {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        name_match = agent_module.get_filename_regex().match(name)
+        if name_match is not None and name_match.group('date') is not None:
+            key = (name_match.group('date'), (name_match.group('prom') or '').strip().lower())
+        else:
+            key = (None, path)
+        groups.setdefault(key, []).append(path)
+    # Biggest groups first, so that one doesn't hold up the end of the run
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+class Progress(object):
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.unmatched = []
+        self.failed = []
+        self.lock = threading.Lock()
+
+    def record(self, path, best, error):
+        with self.lock:
+            self.done += 1
+            if error is not None:
+                self.failed.append((path, error))
+            elif best is None:
+                self.unmatched.append(path)
+            print("[{0}/{1}] {2} -> {3}".format(self.done, self.total, os.path.basename(path),
+                                                error or (best.name if best is not None else "no match")))
+
+
+def warm_group(agent, paths, progress):
+    """Search for and update each file in a group, one after another so later ones reuse the first's pages."""
+    for path in paths:
+        best = None
+        error = None
+        try:
+            results = plex_shim.SearchResults()
+            agent.search(results, plex_shim.Media.from_path(path), "en", False)
+            best = results.best()
+            if best is not None:
+                agent.update(plex_shim.Metadata(best.id), None, "en", False)
+        except Exception as exc:
+            error = "failed: {0}".format(exc)
+        progress.record(path, best, error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the agent's caches for every file in a library")
+    parser.add_argument("folders", nargs="+", help="library folders to walk")
+    parser.add_argument("--data-dir", required=True, help="the agent's data item directory to fill")
+    parser.add_argument("--workers", type=int, default=4, help="number of groups to work on at once")
+    parser.add_argument("--pref", action="append", default=[], help="preference override, as id=value")
+    parser.add_argument("--site", help="CAGEMATCH root URL to use instead of the live site, e.g. a stub-server.py")
+    parser.add_argument("--dry-run", action="store_true", help="only list the groups that would be warmed")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's log")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    prefs = dict(pref.split("=", 1) for pref in args.pref)
+    agent_module = plex_shim.load_agent(args.data_dir, prefs)
+    if args.site:
+        agent_module.CM_MAIN_URL = args.site
+    paths = list(find_videos(args.folders))
+    groups = group_paths(agent_module, paths)
+    print("Found {0} files in {1} groups".format(len(paths), len(groups)))
+    if args.dry_run:
+        for group in groups:
+            print("{0} file(s): {1}".format(len(group), ", ".join(os.path.basename(path) for path in group)))
+        return
+
+    from instrumentation import metrics
+    from workers import parallel_map
+    agent = agent_module.Cagent_Movie()
+    progress = Progress(len(paths))
+    start = time.time()
+    parallel_map(lambda group: warm_group(agent, group, progress), groups, max(1, args.workers))
+    elapsed = time.time() - start
+    metrics.write_summary()
+
+    counters = metrics.summary()['counters']
+    print("Warmed {0} files in {1:.1f} s: {2} pages fetched, {3} from the cache".format(
+        len(paths), elapsed, counters.get('http.cache_misses', 0), counters.get('http.cache_hits', 0)))
+    for path in progress.unmatched:
+        print("No match: " + path)
+    for path, error in progress.failed:
+        print("Failed: {0} ({1})".format(path, error))
+
+
+if __name__ == "__main__":
+    main()